@@ -11,6 +11,33 @@ print(sys_path)
 from configobj import ConfigObj
 from collections import OrderedDict
 
+# optional entries of the [CAE] and [CNN] sections (missing entries fall back to these defaults)
+OPTIONAL_ENTRIES = OrderedDict([
+	('input_pipeline', 'queue'), 	# CIFAR10 input: queue (queue runners) | dataset (tf.data) | sharded (pre-shuffled shards)
+	('prefetch_batches', '2'), 		# batches prepared in a background thread (0: synchronous next_batch)
+	('resident_dataset', '0'), 		# 1: keep the training set in the graph (no feed_dict per training step)
+	('augmentation', '0'), 			# 1: random crops, flips and brightness/contrast for the in-memory CIFAR / CK+ training batches
+	('augmentation_epochs', '0'), 	# > 0: stream augmentation from K epochs materialized once (scripts/augmentation_cache.py)
+	('input_normalization', 'none'), # none | standardize | zca (cached training set statistics applied in the graph)
+	('cifar_input_readers', '1'), 	# CIFAR10 queue pipeline: parallel reader / distortion pipelines
+	('cifar_input_threads', '16'), 	# CIFAR10 queue pipeline: enqueue threads
+	('cifar_queue_capacity_batches', '3'), # CIFAR10 queue pipeline: capacity above min_after_dequeue in batches
+	('steps_per_run', '1'), 		# > 1: training steps per sess.run in an in-graph loop (needs resident_dataset = 1)
+	('summary_tier', 'full'), 		# tensorboard summaries: scalars | standard | full (lib/summary_tiers.py)
+	('expensive_summary_checks', '1'), # summaries above the scalar tier are written every this many check iterations
+	('validation_set_size', '-1'), 	# CAE: validation images evaluated at every check iteration (<= 0: all)
+	('validation_batch_size', '500'), # CAE: batch size of this evaluation
+	('concurrent_evaluation', '0'), # 1: evaluate the check iterations in a background thread on weight snapshots
+	('early_stopping_patience', '0'), # > 0: stop after this many checks without improvement of the evaluation metric
+	('early_stopping_min_delta', '0'), # minimal change of the evaluation metric that counts as an improvement
+	('plateau_patience', '0'), 		# > 0: drop the step size after this many checks without improvement
+	('plateau_step_size_drop', '0.1'), # factor of the step size drop
+	('time_budget', '0'), 			# > 0: wall-clock budget of the job in seconds, ends the training in time
+	('check_seconds', '600'), 		# with time_budget: seconds between two check iterations (replaces chk_iterations)
+	('accumulation_steps', '1'), 	# > 1: gradients of this many micro batches of batch_size images are applied at once
+	('finalize_graph', '0'), 		# 1: finalize the graph before the training loop (op leaks raise an error)
+])
+
 class ConfigLoader:
 
 	def __init__(self):
@@ -94,10 +121,22 @@ class ConfigLoader:
 			for k, v in local_dict.items():
 				self.configuration_dict[k] = v[0]
 
+			if config_version.upper() in ['CAE', 'CNN']:
+				for k, default in OPTIONAL_ENTRIES.items():
+					self.configuration_dict[k] = config[config_version].get(k, default)
+
 			print('Succesfully loaded config file, values are:')
 			for k, v in self.configuration_dict.items():
 				print(k, v)
 
+	def num_required_entries(self):
+		return len([k for k in self.configuration_dict if k not in OPTIONAL_ENTRIES])
+
+	def store_optional_entries(self, config, config_version):
+		for k in OPTIONAL_ENTRIES:
+			if k in self.configuration_dict:
+				config[config_version][k] = self.configuration_dict[k]
+
 	def store_config_file(self, path=sys_path+'/configs/custom_cae.ini', config_version='CAE'):
 
 		# store content of current configuration_dict to file
@@ -105,7 +144,7 @@ class ConfigLoader:
 		config.filename = path
 		config[config_version] = {}
 		if config_version.upper()=='CAE':
-			if self.configuration_dict and len(self.configuration_dict)==17:
+			if self.configuration_dict and self.num_required_entries()==17:
 				config[config_version]['filter_dims_x'] = [int(i[0]) for i in self.configuration_dict.get('filter_dims')]
 				config[config_version]['filter_dims_y'] = [int(i[1]) for i in self.configuration_dict.get('filter_dims')]
 				config[config_version]['hidden_channels'] = self.configuration_dict.get('hidden_channels')
@@ -124,13 +163,14 @@ class ConfigLoader:
 				config[config_version]['chk_iterations'] = self.configuration_dict.get('chk_iterations')
 				config[config_version]['step_size'] = self.configuration_dict.get('step_size')
 				config[config_version]['tie_conv_weights'] = self.configuration_dict.get('tie_conv_weights')
+				self.store_optional_entries(config, config_version)
 				print(config)
 				config.write()
 			else:
 				print('# of configurations need to be 17!')
 
 		elif config_version.upper()=='CNN':
-			if self.configuration_dict and len(self.configuration_dict)==18:
+			if self.configuration_dict and self.num_required_entries()==18:
 				config[config_version]['filter_dims_x'] 		= [int(i[0]) for i in self.configuration_dict.get('filter_dims')]
 				config[config_version]['filter_dims_y'] 		= [int(i[1]) for i in self.configuration_dict.get('filter_dims')]
 				config[config_version]['hidden_channels'] 		= self.configuration_dict.get('hidden_channels')
@@ -151,6 +191,7 @@ class ConfigLoader:
 				config[config_version]['initial_bias_value']	= self.configuration_dict.get('initial_bias_value')
 
 				config[config_version]['weight_decay_regularizer'] = self.configuration_dict.get('weight_decay_regularizer')
+				self.store_optional_entries(config, config_version)
 
 				config.write()
 				print(config)
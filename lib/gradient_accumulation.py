@@ -0,0 +1,27 @@
+import tensorflow as tf
+
+def accumulate_gradients(gradient_fn, tensors, variables, accumulation_steps, name = 'gradient_accumulation'):
+	# sums the gradients gradient_fn(*micro_batch) over accumulation_steps equal slices of the batch tensors (first
+	# dimension) in a tf.while_loop, so only the activations of one micro batch are alive at a time. gradient_fn builds
+	# the forward pass of a micro batch inside the loop body and returns one gradient per variable (None: no gradient).
+	# The batch size has to be a multiple of accumulation_steps, otherwise running the sums raises an InvalidArgumentError
+
+	with tf.name_scope(name):
+		batch_size 	= tf.shape(tensors[0])[0]
+		divisible 	= tf.assert_equal(batch_size % accumulation_steps, 0, message='batch size is not a multiple of accumulation_steps = {}'.format(accumulation_steps))
+
+		with tf.control_dependencies([divisible]):
+			micro_batch_size = batch_size // accumulation_steps
+
+		def body(step, sums):
+			start = step * micro_batch_size
+			gradients = gradient_fn(*[tensor[start:start + micro_batch_size] for tensor in tensors])
+
+			return step + 1, [total if gradient is None else total + gradient for total, gradient in zip(sums, gradients)]
+
+		sums = [tf.zeros(tf.shape(variable), dtype=variable.dtype.base_dtype) for variable in variables]
+		shape_invariants = [tf.TensorShape([]), [tf.TensorShape(None) for _ in sums]]
+
+		_, sums = tf.while_loop(lambda step, sums: step < accumulation_steps, body, [tf.constant(0), sums], shape_invariants=shape_invariants, parallel_iterations=1, back_prop=False)
+
+	return sums
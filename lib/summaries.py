@@ -0,0 +1,29 @@
+import math
+
+import tensorflow as tf
+
+# summary tiers, see lib/summary_tiers.py
+from lib.summary_tiers import TIERS, tiers_up_to
+
+def filter_grid_image(weights, name = 'first layer filters'):
+	# one image summary showing all filters [height, width, in_channels, out_channels] of a convolution on a grid,
+	# every filter is scaled to [0, 1] separately and surrounded by a 1 pixel border
+
+	height, width, channels, num_filters = weights.get_shape().as_list()
+
+	columns = int(math.ceil(math.sqrt(num_filters)))
+	rows 	= int(math.ceil(num_filters / float(columns)))
+
+	filters = tf.transpose(weights, [3, 0, 1, 2])
+
+	minimum = tf.reshape(tf.reduce_min(filters, axis=[1, 2, 3]), [-1, 1, 1, 1])
+	maximum = tf.reshape(tf.reduce_max(filters, axis=[1, 2, 3]), [-1, 1, 1, 1])
+	filters = (filters - minimum) / (maximum - minimum + 1e-8)
+
+	filters = tf.pad(filters, [[0, rows * columns - num_filters], [1, 1], [1, 1], [0, 0]])
+
+	grid = tf.reshape(filters, [rows, columns, height + 2, width + 2, channels])
+	grid = tf.transpose(grid, [0, 2, 1, 3, 4])
+	grid = tf.reshape(grid, [1, rows * (height + 2), columns * (width + 2), channels])
+
+	return tf.summary.image(name, grid)
@@ -0,0 +1,11 @@
+# tensorboard summary tiers of the CAE and CNN, every tier contains the previous ones
+# (no tensorflow import, the tiers are checked without building a graph)
+#	scalars 	: errors, learning rate and regularization terms
+#	standard 	: weight, bias and encoding histograms, first layer filters, input and reconstruction images
+#	full 		: preactivation and gradient histograms, alive relu neuron counts
+TIERS = ['scalars', 'standard', 'full']
+
+def tiers_up_to(tier):
+	if tier not in TIERS:
+		raise ValueError('Unknown summary tier {} ({})'.format(tier, ' | '.join(TIERS)))
+	return TIERS[:TIERS.index(tier) + 1]
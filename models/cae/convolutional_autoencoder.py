@@ -2,11 +2,13 @@ import tensorflow as tf
 import numpy as np
 
 from lib.activations import l_relu
+import lib.summaries as summaries
+import lib.gradient_accumulation as gradient_accumulation
 
 class CAE:
 	# convolutional autoencoder 
 
-	def __init__(self, data, filter_dims, hidden_channels, step_size = 0.0001, weight_init_stddev = 0.0001, weight_init_mean = 0.0001, initial_bias_value = 0.0001, strides = None, pooling_type = 'strided_conv', activation_function = 'sigmoid', tie_conv_weights = True, store_model_walkthrough = False, add_tensorboard_summary = True, relu_leak = 0.2, optimizer_type = 'gradient_descent', output_reconstruction_activation = 'sigmoid', regularization_factor = 0, decay_steps = None, decay_rate = 0.1, intialization_debug_output = True):
+	def __init__(self, data, filter_dims, hidden_channels, step_size = 0.0001, weight_init_stddev = 0.0001, weight_init_mean = 0.0001, initial_bias_value = 0.0001, strides = None, pooling_type = 'strided_conv', activation_function = 'sigmoid', tie_conv_weights = True, store_model_walkthrough = False, add_tensorboard_summary = True, relu_leak = 0.2, optimizer_type = 'gradient_descent', output_reconstruction_activation = 'sigmoid', regularization_factor = 0, decay_steps = None, decay_rate = 0.1, intialization_debug_output = True, summary_tier = 'full', accumulation_steps = 1):
 
 		if intialization_debug_output:
 			print('-----------------------------------------')
@@ -63,7 +65,8 @@ class CAE:
 		self.tie_conv_weights = tie_conv_weights
 
 		self.add_tensorboard_summary = add_tensorboard_summary
-		self.track_gradients_in_tensorboard = True
+		self.summary_tiers = summaries.tiers_up_to(summary_tier)
+		self.track_gradients_in_tensorboard = 'full' in self.summary_tiers
 
 		# init lists that will store weights and biases for the convolution operations
 		self.conv_weights 	= []
@@ -79,6 +82,15 @@ class CAE:
 		self.decay_steps 			= decay_steps
 		self.decay_rate 			= decay_rate
 
+		# the training batches are split into accumulation_steps micro batches, their gradients are summed (cross-entropy)
+		# or averaged (mse) like the gradients of the whole batch and applied once
+		self.accumulation_steps 	= accumulation_steps
+
+		# multiplies the step size, lowered by scripts.early_stopping on a plateau of the reconstruction error
+		self.step_size_factor 			= tf.Variable(1.0, name='step_size_factor', trainable=False)
+		self.step_size_factor_input 	= tf.placeholder(tf.float32, shape=[])
+		self.set_step_size_factor_op 	= tf.assign(self.step_size_factor, self.step_size_factor_input)
+
 		self.optimizer_type = optimizer_type
 
 		# sparsity regularization (L1 norm):
@@ -107,22 +119,27 @@ class CAE:
 		self._error					= None
 		self._ce_error 				= None
 		self._optimizer 			= None
+		self._ce_gradients 			= None
 		self._optimize				= None
 		self._optimize_mse 			= None
 
-		self._summaries = []
+		self._summaries = dict((tier, []) for tier in summaries.TIERS)
 
 
 		print('Initializing conv autoencoder')
 		with tf.name_scope('CAE'):
+			# all training nodes are built here, the properties only return them afterwards
 			self.optimize
+			self.optimize_mse
 			self.error
 
 			if self.track_gradients_in_tensorboard:
+				# histograms of the gradients used by optimize
+				gradients = dict((variable.name, gradient) for gradient, variable in self.ce_gradients)
 				for i, conv_weight in enumerate(self.conv_weights):
-					self._summaries.append(tf.summary.histogram('c-e loss gradient conv weight {}'.format(i), self.optimizer.compute_gradients(self.ce_error, [conv_weight])))
+					self.add_summary(tf.summary.histogram('c-e loss gradient conv weight {}'.format(i), gradients[conv_weight.name]), 'full')
 				for i, conv_bias in enumerate(self.conv_biases):
-					self._summaries.append(tf.summary.histogram('c-e loss gradient conv bias {}'.format(i), self.optimizer.compute_gradients(self.ce_error, [conv_bias])))
+					self.add_summary(tf.summary.histogram('c-e loss gradient conv bias {}'.format(i), gradients[conv_bias.name]), 'full')
 
 		if self.add_tensorboard_summary:
 			self.update_summaries()
@@ -142,11 +159,21 @@ class CAE:
 		print('Initialization finished')
 			
 
-	def add_summary(self, summary):
-		self._summaries.append(summary)
+	def add_summary(self, summary, tier = 'scalars'):
+		# summaries of tiers above summary_tier are not merged (see lib/summary_tiers.py)
+		if tier in self.summary_tiers:
+			self._summaries[tier].append(summary)
 
 	def update_summaries(self):
-		self.merged = tf.summary.merge(self._summaries)
+		# merged 			: scalar summaries, cheap enough for every check iteration
+		# merged_expensive 	: all summaries up to summary_tier (e.g. only every few check iterations)
+		self.merged = tf.summary.merge(self._summaries['scalars'])
+
+		expensive_summaries = [summary for tier in self.summary_tiers[1:] for summary in self._summaries[tier]]
+		if expensive_summaries:
+			self.merged_expensive = tf.summary.merge(self._summaries['scalars'] + expensive_summaries)
+		else:
+			self.merged_expensive = self.merged
 
 	@property
 	def encoding(self):
@@ -156,8 +183,6 @@ class CAE:
 
 			print('initialize encoding')
 
-			tmp_tensor = self.data
-
 			depth =  len(self.filter_dims)
 
 			for layer in range(depth):
@@ -166,11 +191,6 @@ class CAE:
 				if layer == 0:
 					in_channels = int(self.data.shape[3])
 				else:
-
-					if self.store_model_walkthrough:
-						# store intermediate results
-						self.model_walkthrough.append(tmp_tensor)
-
 					in_channels = self.hidden_channels[layer - 1]
 				out_channels = self.hidden_channels[layer]
 
@@ -184,70 +204,81 @@ class CAE:
 				W = tf.Variable(tf.truncated_normal(filter_shape, mean=self.weight_init_mean, stddev=self.weight_init_stddev), name='conv{}_weights'.format(layer))
 				b = tf.Variable(tf.constant(self.initial_bias_value, shape=bias_shape), name='conv{}_bias'.format(layer))
 
-				self._summaries.append(tf.summary.histogram('ENCODING: layer {} weight'.format(layer), W))
-				self._summaries.append(tf.summary.histogram('ENCODING: layer {} bias'.format(layer), b))
+				self.add_summary(tf.summary.histogram('ENCODING: layer {} weight'.format(layer), W), 'standard')
+				self.add_summary(tf.summary.histogram('ENCODING: layer {} bias'.format(layer), b), 'standard')
 
 				if self.add_tensorboard_summary and layer == 0 and self.filter_dims[layer] != (1,1):
 					# visualize first layer filters
 
-					for fltr_indx in range(out_channels):
-						self._summaries.append(tf.summary.image('first layer filter {}'.format(fltr_indx), W[None, :,:,:,fltr_indx]))
+					self.add_summary(summaries.filter_grid_image(W, 'first layer filters'), 'standard')
 
 				self.conv_weights.append(W)
 				self.conv_biases.append(b)
 
-				self.pre_conv_shapes.append(tf.shape(tmp_tensor))
+			self._encoding, self.pre_conv_shapes = self._encode(self.data, self.conv_weights, self.conv_biases, add_summaries = True)
 
-				# PREACTIVATION
-				if self.pooling_type == 'strided_conv':
-					strides = self.strided_conv_strides
-				else:
-					strides = self.std_strides
+			# append L1 norm of hidden representation to enforce sparsity in the hidden representation
+			encoding_norm = tf.norm(self._encoding, ord=1, name='L1_encoding_norm')
+			self.regularization_terms.append(encoding_norm)
+			self.add_summary(tf.summary.scalar('encoding L1 norm', encoding_norm), 'scalars')
 
-				conv_preact = tf.add(tf.nn.conv2d(tmp_tensor, W, strides = self.strides[layer], padding='SAME'),  b, name='conv_{}_preactivation'.format(layer))
+			if self.add_tensorboard_summary:
+				self.add_summary(tf.summary.histogram('encoding histogram', self._encoding), 'standard')
 
-				if self.add_tensorboard_summary:
-					self._summaries.append(tf.summary.histogram('layer {} preactivations'.format(layer), conv_preact))
+		return self._encoding
 
-				# ACTIVATION
-				if self.activation_function == 'relu':
-					conv_act = tf.nn.relu(conv_preact, name='conv_{}_activation'.format(layer))
+	def _encode(self, data, conv_weights, conv_biases, add_summaries = False):
+		# convolutional layers applied to data with the given weights and biases,
+		# returns the encoding and the input shapes of the layers (output shapes of the conv2d_transpose operations)
 
-					alive_neurons = tf.count_nonzero(conv_act, name='active_neuron_number_{}'.format(layer))
-					self._summaries.append(tf.summary.scalar('nb of relu neurons alive in layer {}'.format(layer), alive_neurons))
+		tmp_tensor = data
+		pre_conv_shapes = []
 
-				elif self.activation_function == 'lrelu':
-					# leaky relu to avoid the dying relu problem
-					conv_act = l_relu(conv_preact, leak = self.relu_leak,  name='conv_{}_activation'.format(layer))
+		for layer, (W, b) in enumerate(zip(conv_weights, conv_biases)):
 
-					alive_neurons = tf.count_nonzero(conv_act, name='active_neuron_number_{}'.format(layer))
-					self._summaries.append(tf.summary.scalar('nb of relu neurons alive in layer {}'.format(layer), alive_neurons))
+			if layer > 0 and add_summaries and self.store_model_walkthrough:
+				# store intermediate results
+				self.model_walkthrough.append(tmp_tensor)
 
-				elif self.activation_function == 'scaled_tanh':
-					conv_act = tf.add(tf.nn.tanh(conv_preact) / 2, 0.5, name='conv_{}_activation'.format(layer))
+			pre_conv_shapes.append(tf.shape(tmp_tensor))
 
-				else:
-					conv_act = tf.nn.sigmoid(conv_preact, name='conv_{}_activation'.format(layer))
+			# PREACTIVATION
+			conv_preact = tf.add(tf.nn.conv2d(tmp_tensor, W, strides = self.strides[layer], padding='SAME'),  b, name='conv_{}_preactivation'.format(layer))
 
-				# POOLING (2x2 max pooling)
-				if self.pooling_type == 'max_pooling':
-					pool_out = tf.nn.max_pool(conv_act, [1,2,2,1], [1,2,2,1], padding='SAME', name='max_pool_{}'.format(layer))
-					tmp_tensor = pool_out
+			if add_summaries and self.add_tensorboard_summary:
+				self.add_summary(tf.summary.histogram('layer {} preactivations'.format(layer), conv_preact), 'full')
 
-				else:
-					tmp_tensor = conv_act
+			# ACTIVATION
+			if self.activation_function == 'relu':
+				conv_act = tf.nn.relu(conv_preact, name='conv_{}_activation'.format(layer))
 
-			self._encoding = tmp_tensor
+				if add_summaries:
+					alive_neurons = tf.count_nonzero(conv_act, name='active_neuron_number_{}'.format(layer))
+					self.add_summary(tf.summary.scalar('nb of relu neurons alive in layer {}'.format(layer), alive_neurons), 'full')
 
-			# append L1 norm of hidden representation to enforce sparsity in the hidden representation
-			encoding_norm = tf.norm(self._encoding, ord=1, name='L1_encoding_norm')
-			self.regularization_terms.append(encoding_norm)
-			self._summaries.append(tf.summary.scalar('encoding L1 norm', encoding_norm))
+			elif self.activation_function == 'lrelu':
+				# leaky relu to avoid the dying relu problem
+				conv_act = l_relu(conv_preact, leak = self.relu_leak,  name='conv_{}_activation'.format(layer))
 
-			if self.add_tensorboard_summary:
-				self._summaries.append(tf.summary.histogram('encoding histogram', self._encoding))
+				if add_summaries:
+					alive_neurons = tf.count_nonzero(conv_act, name='active_neuron_number_{}'.format(layer))
+					self.add_summary(tf.summary.scalar('nb of relu neurons alive in layer {}'.format(layer), alive_neurons), 'full')
 
-		return self._encoding
+			elif self.activation_function == 'scaled_tanh':
+				conv_act = tf.add(tf.nn.tanh(conv_preact) / 2, 0.5, name='conv_{}_activation'.format(layer))
+
+			else:
+				conv_act = tf.nn.sigmoid(conv_preact, name='conv_{}_activation'.format(layer))
+
+			# POOLING (2x2 max pooling)
+			if self.pooling_type == 'max_pooling':
+				pool_out = tf.nn.max_pool(conv_act, [1,2,2,1], [1,2,2,1], padding='SAME', name='max_pool_{}'.format(layer))
+				tmp_tensor = pool_out
+
+			else:
+				tmp_tensor = conv_act
+
+		return tmp_tensor, pre_conv_shapes
 
 	@property
 	def error(self):
@@ -256,7 +287,7 @@ class CAE:
 		if self._error is None:
 			print('initialize error')
 
-			mse = tf.reduce_mean(tf.squared_difference(self.reconstruction, self.data), name='mean-squared_error')
+			mse = self._mse(self.data, self.reconstruction)
 
 			self._error = mse 
 
@@ -265,8 +296,8 @@ class CAE:
 				self._error += self.regularization_factor * reg_term
 
 			if self.add_tensorboard_summary:
-				self._summaries.append(tf.summary.scalar('total_error_with_regularization', self._error))
-				self._summaries.append(tf.summary.scalar('mean squared error', mse))
+				self.add_summary(tf.summary.scalar('total_error_with_regularization', self._error), 'scalars')
+				self.add_summary(tf.summary.scalar('mean squared error', mse), 'scalars')
 
 		return self._error
 
@@ -274,20 +305,24 @@ class CAE:
 	def ce_error(self):
 		# cross-entropy error
 		if self._ce_error is None:
-			if self.output_reconstruction_activation == 'scaled_tanh':
+			self._ce_error = self._cross_entropy(self.data, self.logit_reconstruction, self.reconstruction)
+
+			if self.add_tensorboard_summary:
+				self.add_summary(tf.summary.scalar('avg cross entropy', tf.reduce_mean(self._ce_error)), 'scalars')
 
-				ce_error = -tf.reduce_sum(self.data * tf.log(tf.clip_by_value(self.reconstruction, 1e-10, 1.0)), name='cross_entropy_on_scaled_tanh')
+		return self._ce_error
 
-			else:
+	def _mse(self, data, reconstruction):
+		return tf.reduce_mean(tf.squared_difference(reconstruction, data), name='mean-squared_error')
 
-				ce_error = tf.nn.sigmoid_cross_entropy_with_logits(labels=self.data, logits=self.logit_reconstruction, name='cross_entropy_error')
+	def _cross_entropy(self, data, logit_reconstruction, reconstruction):
+		if self.output_reconstruction_activation == 'scaled_tanh':
 
-			self._ce_error = ce_error
+			return -tf.reduce_sum(data * tf.log(tf.clip_by_value(reconstruction, 1e-10, 1.0)), name='cross_entropy_on_scaled_tanh')
 
-			if self.add_tensorboard_summary:
-				self._summaries.append(tf.summary.scalar('avg cross entropy', tf.reduce_mean(self._ce_error)))
+		else:
 
-		return self._ce_error
+			return tf.nn.sigmoid_cross_entropy_with_logits(labels=data, logits=logit_reconstruction, name='cross_entropy_error')
 
 	@property
 	def optimizer(self):
@@ -295,11 +330,11 @@ class CAE:
 			print('initialize {} optimizer'.format(self.optimizer_type))
 
 			if self.optimizer_type == 'ada_grad':
-				self._optimizer = tf.train.AdagradOptimizer(self.step_size)
+				self._optimizer = tf.train.AdagradOptimizer(self.step_size * self.step_size_factor)
 
 			else:
 				# default: gradient descent optimizer
-				self._optimizer = tf.train.GradientDescentOptimizer(self.step_size)
+				self._optimizer = tf.train.GradientDescentOptimizer(self.step_size * self.step_size_factor)
 
 
 		return self._optimizer
@@ -308,11 +343,26 @@ class CAE:
 	def optimize_mse(self):
 		if self._optimize_mse is None:
 
-			optimizer = self.optimizer
-			self._optimize_mse = optimizer.minimize(self.error)
+			if self.accumulation_steps > 1:
+				self._optimize_mse = self.training_step(self.data, 'mse')
+			else:
+				optimizer = self.optimizer
+				self._optimize_mse = optimizer.minimize(self.error)
 
 		return self._optimize_mse
 
+	@property
+	def ce_gradients(self):
+		# (gradient, variable) pairs of the cross-entropy error, computed once and shared by optimize and the gradient
+		# summaries. With accumulation_steps > 1 the gradients are accumulated over the micro batches of the batch
+		if self._ce_gradients is None:
+			if self.accumulation_steps > 1:
+				self._ce_gradients = list(zip(self._batch_gradients(self.data), self._optimized_variables()))
+			else:
+				self._ce_gradients = self.optimizer.compute_gradients(self.ce_error)
+
+		return self._ce_gradients
+
 	@property
 	def optimize(self):
 		# returns the cross-entropy node we use for the optimization
@@ -320,10 +370,7 @@ class CAE:
 		if self._optimize is None:
 			print('initialize optimize call')
 
-			ce_error  = self.ce_error
-			optimizer = self.optimizer
-
-			self._optimize = optimizer.minimize(ce_error)
+			self._optimize = self.optimizer.apply_gradients(self.ce_gradients)
 
 		return self._optimize
 
@@ -335,18 +382,11 @@ class CAE:
 		if self._logit_reconstruction is None:
 			print('initialize logit_reconstruction')
 
-			tmp_tensor = self.encoding
+			encoding = self.encoding
+
 			for layer in range(len(self.filter_dims))[::-1]:
 				# go through the layers in reverse order to reconstruct the image
 
-				#print('layer {} reconstruction'.format(layer))
-				#print(self.conv_weights[layer])
-
-				if self.store_model_walkthrough:
-					# store intermediate results
-					self.model_walkthrough.append(tmp_tensor)
-
-				# CONV_TRANSPOSE (AND UPSAMPLING)
 				if layer == 0:
 					channels = int(self.data.shape[3])
 				else:
@@ -359,61 +399,129 @@ class CAE:
 					# TODO: why layer == 0
 					W = tf.Variable(tf.truncated_normal(tf.shape(self.conv_weights[layer]), mean=self.weight_init_mean, stddev=self.weight_init_stddev), name='conv{}_weights'.format(layer))
 					self.reconst_weights.append(W)
-					self._summaries.append(tf.summary.histogram('DECODING: layer {} weight'.format(layer), W))
-
-				else:
-					W =  self.conv_weights[layer]
+					self.add_summary(tf.summary.histogram('DECODING: layer {} weight'.format(layer), W), 'standard')
 
 				# init reconstruction bias
 				bias_shape = [channels]
 				c = tf.Variable(tf.constant(self.initial_bias_value, shape=bias_shape), name='reconstruction_bias_{}'.format(layer))
 				self.reconst_biases.append(c)
 
-				self._summaries.append(tf.summary.histogram('DECODING: layer {} bias'.format(layer), c))
+				self.add_summary(tf.summary.histogram('DECODING: layer {} bias'.format(layer), c), 'standard')
 
+			self._logit_reconstruction = self._decode(encoding, self.pre_conv_shapes, self._decoding_weights(self.conv_weights, self.reconst_weights), self.reconst_biases, add_summaries = True)
 
-				if self.pooling_type == 'max_pooling':
-					# conv2d_transpose with upsampling
-					upsampling_strides = [1,2,2,1]
-					reconst_preact = tf.add( tf.nn.conv2d_transpose(tmp_tensor, W, self.pre_conv_shapes[layer], upsampling_strides), c, name='reconstruction_preact_{}'.format(layer))
+			if self.add_tensorboard_summary:
+				self.add_summary(tf.summary.histogram('logit reconstruction', self._logit_reconstruction), 'full')
 
-				else:
-					# conv2d_transpose without upsampling 
-					if self.pooling_type == 'strided_conv':
-						strides = self.strided_conv_strides
-					else:
-						strides = self.std_strides
-					reconst_preact = tf.add( tf.nn.conv2d_transpose(tmp_tensor, W, self.pre_conv_shapes[layer], self.strides[layer]), c, name='reconstruction_preact_{}'.format(layer))
+		return self._logit_reconstruction
 
-				self._summaries.append(tf.summary.histogram('layer {} reconstruction preactivations'.format(layer), reconst_preact))
+	def _decoding_weights(self, conv_weights, reconst_weights):
+		# weights of the conv2d_transpose operations in reconstruction order (last layer first)
+		if self.tie_conv_weights:
+			return conv_weights[::-1]
+		return reconst_weights
 
-				# ACTIVATION
-				if layer > 0:
-					# do not use the activation function in the last layer because we want the logits
-					if self.hl_reconstruction_activation_function == 'relu':
-						reconst_act = tf.nn.relu(reconst_preact, name='reconst_act')
+	def _decode(self, encoding, pre_conv_shapes, decoding_weights, reconst_biases, add_summaries = False):
+		# reconstruction layers applied to the encoding, weights and biases in reconstruction order (last layer first),
+		# returns the logit reconstruction
 
-						alive_neurons = tf.count_nonzero(reconst_act, name='alive_relus_in_reconstruction_layer_{}'.format(layer))
-						self._summaries.append(tf.summary.scalar('alive neurons in reconstruction layer {}'.format(layer), alive_neurons))
+		tmp_tensor = encoding
 
-					elif self.hl_reconstruction_activation_function == 'lrelu':
-						reconst_act = l_relu(reconst_preact, leak = self.relu_leak, name='reconst_act')
+		for W, c, layer in zip(decoding_weights, reconst_biases, range(len(self.filter_dims))[::-1]):
 
-					elif self.hl_reconstruction_activation_function == 'scaled_tanh':
-						reconst_act = tf.add(tf.nn.tanh(reconst_preact) / 2, 0.5, name='reconst_act')
+			if add_summaries and self.store_model_walkthrough:
+				# store intermediate results
+				self.model_walkthrough.append(tmp_tensor)
 
-					else:
-						reconst_act = tf.nn.sigmoid(reconst_preact ,name='reconst_act')
+			# CONV_TRANSPOSE (AND UPSAMPLING)
+			if self.pooling_type == 'max_pooling':
+				# conv2d_transpose with upsampling
+				upsampling_strides = [1,2,2,1]
+				reconst_preact = tf.add( tf.nn.conv2d_transpose(tmp_tensor, W, pre_conv_shapes[layer], upsampling_strides), c, name='reconstruction_preact_{}'.format(layer))
 
-					tmp_tensor = reconst_act
+			else:
+				# conv2d_transpose without upsampling 
+				reconst_preact = tf.add( tf.nn.conv2d_transpose(tmp_tensor, W, pre_conv_shapes[layer], self.strides[layer]), c, name='reconstruction_preact_{}'.format(layer))
+
+			if add_summaries:
+				self.add_summary(tf.summary.histogram('layer {} reconstruction preactivations'.format(layer), reconst_preact), 'full')
+
+			# ACTIVATION
+			if layer > 0:
+				# do not use the activation function in the last layer because we want the logits
+				if self.hl_reconstruction_activation_function == 'relu':
+					reconst_act = tf.nn.relu(reconst_preact, name='reconst_act')
+
+					if add_summaries:
+						alive_neurons = tf.count_nonzero(reconst_act, name='alive_relus_in_reconstruction_layer_{}'.format(layer))
+						self.add_summary(tf.summary.scalar('alive neurons in reconstruction layer {}'.format(layer), alive_neurons), 'full')
+
+				elif self.hl_reconstruction_activation_function == 'lrelu':
+					reconst_act = l_relu(reconst_preact, leak = self.relu_leak, name='reconst_act')
+
+				elif self.hl_reconstruction_activation_function == 'scaled_tanh':
+					reconst_act = tf.add(tf.nn.tanh(reconst_preact) / 2, 0.5, name='reconst_act')
 
 				else:
-					self._logit_reconstruction = reconst_preact
+					reconst_act = tf.nn.sigmoid(reconst_preact ,name='reconst_act')
 
-			if self.add_tensorboard_summary:
-				self._summaries.append(tf.summary.histogram('logit reconstruction', self._logit_reconstruction))
+				tmp_tensor = reconst_act
 
-		return self._logit_reconstruction
+			else:
+				tmp_tensor = reconst_preact
+
+		return tmp_tensor
+
+	def _output_activation(self, logit_reconstruction):
+		if self.output_reconstruction_activation == 'scaled_tanh':
+			return tf.add(tf.nn.tanh(logit_reconstruction) / 2, 0.5, name='scaled_tanh_reconstruction')
+		else:
+			return tf.nn.sigmoid(logit_reconstruction, name='reconstruction')
+
+	def training_step(self, data, error_function = 'cross_entropy'):
+		# one optimization step (as optimize, or optimize_mse for error_function 'mse') on the input tensor data, sharing
+		# all variables and the optimizer with the autoencoder, e.g. to run several steps per sess.run inside a
+		# tf.while_loop (scripts/multi_step_training.py). The variables are read again and the gradients are taken with
+		# respect to these reads, so every step sees the updates of the previous one.
+		# With accumulation_steps > 1 the gradients are accumulated over the micro batches (lib/gradient_accumulation.py).
+
+		return self.optimizer.apply_gradients(list(zip(self._batch_gradients(data, error_function), self._optimized_variables())))
+
+	def _optimized_variables(self):
+		return self.conv_weights + self.conv_biases + self.reconst_weights + self.reconst_biases
+
+	def _batch_gradients(self, data, error_function = 'cross_entropy'):
+		# gradients of the error on data for _optimized_variables, taken with respect to fresh reads
+
+		if self.accumulation_steps > 1:
+			gradient_fn = lambda micro_data: self._step_gradients(micro_data, error_function, self.accumulation_steps)
+			return gradient_accumulation.accumulate_gradients(gradient_fn, [data], self._optimized_variables(), self.accumulation_steps)
+
+		return self._step_gradients(data, error_function)
+
+	def _step_gradients(self, data, error_function, num_micro_batches = 1):
+		# gradients of the error on data with respect to fresh reads of the variables. The summed cross-entropy and the L1
+		# regularization add up over micro batches, the mean squared error is divided by num_micro_batches.
+
+		conv_weights 	= [W.read_value() for W in self.conv_weights]
+		conv_biases 	= [b.read_value() for b in self.conv_biases]
+		reconst_weights = [W.read_value() for W in self.reconst_weights]
+		reconst_biases 	= [c.read_value() for c in self.reconst_biases]
+
+		encoding, pre_conv_shapes = self._encode(data, conv_weights, conv_biases)
+		logit_reconstruction = self._decode(encoding, pre_conv_shapes, self._decoding_weights(conv_weights, reconst_weights), reconst_biases)
+		reconstruction = self._output_activation(logit_reconstruction)
+
+		if error_function == 'mse':
+			error = self._mse(data, reconstruction) / num_micro_batches
+			if self.regularization_terms:
+				error += self.regularization_factor * tf.norm(encoding, ord=1)
+		else:
+			error = self._cross_entropy(data, logit_reconstruction, reconstruction)
+
+		reads = conv_weights + conv_biases + reconst_weights + reconst_biases
+
+		return tf.gradients(error, reads)
 
 	@property
 	def reconstruction(self):
@@ -422,19 +530,13 @@ class CAE:
 		if self._reconstruction is None:
 			print('initialize reconstruction')
 
-			if self.output_reconstruction_activation == 'scaled_tanh':
-
-				self._reconstruction = tf.add(tf.nn.tanh(self.logit_reconstruction) / 2, 0.5, name='scaled_tanh_reconstruction')
-
-			else:
-
-				self._reconstruction = tf.nn.sigmoid(self.logit_reconstruction, name='reconstruction')
+			self._reconstruction = self._output_activation(self.logit_reconstruction)
 		
 		
-			self._summaries.append(tf.summary.image('input', self.data))
-			self._summaries.append(tf.summary.image('reconstruction', self._reconstruction))
+			self.add_summary(tf.summary.image('input', self.data), 'standard')
+			self.add_summary(tf.summary.image('reconstruction', self._reconstruction), 'standard')
 
-			self._summaries.append(tf.summary.histogram('reconstruction_hist', self._reconstruction))
+			self.add_summary(tf.summary.histogram('reconstruction_hist', self._reconstruction), 'full')
 
 		return self._reconstruction
 
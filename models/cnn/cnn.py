@@ -2,10 +2,13 @@ import tensorflow as tf
 import csv, os
 import collections
 
+import lib.summaries as summaries
+import lib.gradient_accumulation as gradient_accumulation
+
 class CNN: 
 	# convolutional neural network (same structure as cae with added fully-connected layers)
 
-	def __init__(self, data, target, keep_prob, filter_dims, hidden_channels, dense_depths, pooling_type = 'strided_conv', activation_function = 'sigmoid', add_tensorboard_summary = True, scope_name='CNN', one_hot_labels = True, step_size = 0.1, decay_steps = 10000, decay_rate = 0.1, weight_decay_regularizer = 0, weight_init_stddev = 0.2, weight_init_mean = 0, initial_bias_value = 0):
+	def __init__(self, data, target, keep_prob, filter_dims, hidden_channels, dense_depths, pooling_type = 'strided_conv', activation_function = 'sigmoid', add_tensorboard_summary = True, scope_name='CNN', one_hot_labels = True, step_size = 0.1, decay_steps = 10000, decay_rate = 0.1, weight_decay_regularizer = 0, weight_init_stddev = 0.2, weight_init_mean = 0, initial_bias_value = 0, summary_tier = 'full', accumulation_steps = 1):
 
 		# TODO:
 		# 	- add assertion that test whether filter_dims, hidden_channels and strides have the right dimensions
@@ -57,7 +60,8 @@ class CNN:
 		self.dense_weights = []
 
 		self.add_tensorboard_summary 		= add_tensorboard_summary
-		self.track_gradients_in_tensorboard = True
+		self.summary_tiers = summaries.tiers_up_to(summary_tier)
+		self.track_gradients_in_tensorboard = 'full' in self.summary_tiers
 
 		# private attributes used by the properties
 		self._encoding 		= None
@@ -65,8 +69,10 @@ class CNN:
 		self._prediction 	= None
 		self._error			= None
 		self._optimizer  	= None
+		self._gradients 	= None
 		self._optimize 		= None
 		self._optimize_dense_layers = None
+		self._dense_layer_optimizer = None
 		self._accuracy		= None
 
 		self.weight_init_stddev 	= weight_init_stddev # 0.2 		
@@ -81,9 +87,12 @@ class CNN:
 		self.decay_steps = decay_steps
 		self.decay_rate = decay_rate
 
+		# the training batches are split into accumulation_steps micro batches, their gradients are averaged and applied once
+		self.accumulation_steps = accumulation_steps
+
 		self._losses = []
 
-		self._summaries = []
+		self._summaries = dict((tier, []) for tier in summaries.TIERS)
 
 
 		self.global_step = tf.Variable(0, dtype=tf.int32, name='global_step', trainable=False)
@@ -91,6 +100,11 @@ class CNN:
 		self.global_step_setter_input 	= tf.placeholder(tf.int32, shape=[])
 		self.set_global_step_op 		= tf.assign(self.global_step, self.global_step_setter_input)
 
+		# multiplies the step size, lowered by scripts.early_stopping on a plateau of the evaluation accuracy
+		self.step_size_factor 			= tf.Variable(1.0, name='step_size_factor', trainable=False)
+		self.step_size_factor_input 	= tf.placeholder(tf.float32, shape=[])
+		self.set_step_size_factor_op 	= tf.assign(self.step_size_factor, self.step_size_factor_input)
+
 		if weight_decay_regularizer == 0 and type(weight_decay_regularizer) == int:
 		    print('WARNING: weight_decay_regularizer was int 0, set to float')
 		    weight_decay_regularizer = 0.
@@ -109,16 +123,18 @@ class CNN:
 			else:
 			    self.decay_sum = 0
 
-			self._summaries.append(tf.summary.scalar('decay_term_sum', self.decay_sum))
+			self.add_summary(tf.summary.scalar('decay_term_sum', self.decay_sum), 'scalars')
 
 			self.optimize
 			self.optimize_dense_layers
 
 			if self.track_gradients_in_tensorboard:
+				# histograms of the gradients used by optimize
+				gradients = dict((variable.name, gradient) for gradient, variable in self.gradients)
 				for i, conv_weight in enumerate(self.conv_weights):
-					self._summaries.append(tf.summary.histogram('c-e loss gradient conv weight {}'.format(i), self.optimizer.compute_gradients(self.error, [conv_weight])))
+					self.add_summary(tf.summary.histogram('c-e loss gradient conv weight {}'.format(i), gradients[conv_weight.name]), 'full')
 				for i, conv_bias in enumerate(self.conv_biases):
-					self._summaries.append(tf.summary.histogram('c-e loss gradient conv bias {}'.format(i), self.optimizer.compute_gradients(self.error, [conv_bias])))
+					self.add_summary(tf.summary.histogram('c-e loss gradient conv bias {}'.format(i), gradients[conv_bias.name]), 'full')
 
 
 		with tf.name_scope('accuracy_' + scope_name):
@@ -146,8 +162,21 @@ class CNN:
 		print('...finished initialization')
 
 
+	def add_summary(self, summary, tier = 'scalars'):
+		# summaries of tiers above summary_tier are not merged (see lib/summary_tiers.py)
+		if tier in self.summary_tiers:
+			self._summaries[tier].append(summary)
+
 	def update_summaries(self):
-		self.merged = tf.summary.merge(self._summaries)
+		# merged 			: scalar summaries, cheap enough for every check iteration
+		# merged_expensive 	: all summaries up to summary_tier (e.g. only every few check iterations)
+		self.merged = tf.summary.merge(self._summaries['scalars'])
+
+		expensive_summaries = [summary for tier in self.summary_tiers[1:] for summary in self._summaries[tier]]
+		if expensive_summaries:
+			self.merged_expensive = tf.summary.merge(self._summaries['scalars'] + expensive_summaries)
+		else:
+			self.merged_expensive = self.merged
 
 	@property
 	def encoding(self):
@@ -159,8 +188,6 @@ class CNN:
 
 			print('initialize encoding')
 
-			tmp_tensor = self.data
-
 			for layer in range(len(self.filter_dims)):
 
 				# CONVOLUTION
@@ -183,50 +210,58 @@ class CNN:
 				if self.add_tensorboard_summary and layer == 0:
 					# visualize first layer filters
 
-					for fltr_indx in range(out_channels):
-						self._summaries.append(tf.summary.image('first layer filter {}'.format(fltr_indx), W[None, :,:,:,fltr_indx]))
+					self.add_summary(summaries.filter_grid_image(W, 'first layer filters'), 'standard')
 
 
 				self.conv_weights.append(W)
 				self.conv_biases.append(b)
 
-				# self.pre_conv_shapes.append(tf.shape(tmp_tensor))
+			self._encoding = self._encode(self.data, self.conv_weights, self.conv_biases, add_summaries = True)
 
-				# PREACTIVATION
-				conv_preact = tf.add(tf.nn.conv2d(tmp_tensor, W, strides = self.strides[layer], padding='SAME'),  b, name='conv_{}_preactivation'.format(layer))
+			if self.add_tensorboard_summary:
+				self.add_summary(tf.summary.histogram('encoding histogram', self._encoding), 'standard')
 
-				self._summaries.append(tf.summary.histogram('layer {} preactivations'.format(layer), conv_preact))
+		return self._encoding
 
-				# ACTIVATION
-				if self.activation_function == 'relu':
-					conv_act = tf.nn.relu(conv_preact, name='conv_{}_activation'.format(layer))
+	def _encode(self, data, conv_weights, conv_biases, add_summaries = False):
+		# convolutional layers applied to data with the given weights and biases
 
-					alive_neurons = tf.count_nonzero(conv_act, name='active_neuron_number_{}'.format(layer))
-					self._summaries.append(tf.summary.scalar('nb of relu neurons alive in layer {}'.format(layer), alive_neurons))
-				elif self.activation_function == 'scaled_tanh':
-					conv_act = tf.add(tf.nn.tanh(conv_preact) / 2, 0.5, 'conv_{}_activation'.format(layer))
-				else:
-					conv_act = tf.nn.sigmoid(conv_preact, name='conv_{}_activation'.format(layer))
+		tmp_tensor = data
 
-				# POOLING (2x2 max pooling)
-				if self.pooling_type == 'max_pooling':
-					pool_out = tf.nn.max_pool(conv_act, [1,2,2,1], [1,2,2,1], padding='SAME', name='max_pool_{}'.format(layer))
-					tmp_tensor = pool_out
+		for layer, (W, b) in enumerate(zip(conv_weights, conv_biases)):
 
-				elif self.pooling_type == 'max_pooling_k3':
-					# max pooling with larger kernel (as in AlexNet)
-					pool_out = tf.nn.max_pool(conv_act, [1,3,3,1], [1,2,2,1], padding='SAME', name='max_pool_{}'.format(layer))
-					tmp_tensor = pool_out
+			# PREACTIVATION
+			conv_preact = tf.add(tf.nn.conv2d(tmp_tensor, W, strides = self.strides[layer], padding='SAME'),  b, name='conv_{}_preactivation'.format(layer))
 
-				else:
-					tmp_tensor = conv_act
+			if add_summaries:
+				self.add_summary(tf.summary.histogram('layer {} preactivations'.format(layer), conv_preact), 'full')
 
-			self._encoding = tmp_tensor
+			# ACTIVATION
+			if self.activation_function == 'relu':
+				conv_act = tf.nn.relu(conv_preact, name='conv_{}_activation'.format(layer))
 
-			if self.add_tensorboard_summary:
-				self._summaries.append(tf.summary.histogram('encoding histogram', self._encoding))
+				if add_summaries:
+					alive_neurons = tf.count_nonzero(conv_act, name='active_neuron_number_{}'.format(layer))
+					self.add_summary(tf.summary.scalar('nb of relu neurons alive in layer {}'.format(layer), alive_neurons), 'full')
+			elif self.activation_function == 'scaled_tanh':
+				conv_act = tf.add(tf.nn.tanh(conv_preact) / 2, 0.5, 'conv_{}_activation'.format(layer))
+			else:
+				conv_act = tf.nn.sigmoid(conv_preact, name='conv_{}_activation'.format(layer))
 
-		return self._encoding
+			# POOLING (2x2 max pooling)
+			if self.pooling_type == 'max_pooling':
+				pool_out = tf.nn.max_pool(conv_act, [1,2,2,1], [1,2,2,1], padding='SAME', name='max_pool_{}'.format(layer))
+				tmp_tensor = pool_out
+
+			elif self.pooling_type == 'max_pooling_k3':
+				# max pooling with larger kernel (as in AlexNet)
+				pool_out = tf.nn.max_pool(conv_act, [1,3,3,1], [1,2,2,1], padding='SAME', name='max_pool_{}'.format(layer))
+				tmp_tensor = pool_out
+
+			else:
+				tmp_tensor = conv_act
+
+		return tmp_tensor
 
 	@property
 	def logits(self):
@@ -241,7 +276,7 @@ class CNN:
 
 			encoding_dim = encoding_shape[1] * encoding_shape[2] * encoding_shape[3]
 
-			tmp_tensor = tf.reshape(self.encoding, [-1, encoding_dim], name='last_conv_output_flattened')
+			input_dim = encoding_dim
 
 			for d_ind, d in enumerate(self.dense_depths):
 
@@ -250,7 +285,7 @@ class CNN:
 
 				layer_size = self.dense_depths[d_ind]
 
-				weight_shape = [tmp_tensor.get_shape().as_list()[1], layer_size]
+				weight_shape = [input_dim, layer_size]
 				bias_shape = [layer_size]
 
 				# print('weight_shape: ', weight_shape)
@@ -267,35 +302,49 @@ class CNN:
 				self.dense_layer_variables.append(W)
 				self.dense_layer_variables.append(b)
 
-				dense_preact 	= tf.add(tf.matmul(tmp_tensor, W), b, name='dense_{}_preact'.format(d_ind))
-		
-			
-	
-				self._summaries.append(tf.summary.histogram('dense_layer_{}_preact'.format(d_ind), dense_preact))
-	
-				if d_ind != len(self.dense_depths) - 1:
+				input_dim = layer_size
+
+			self._logits = self._classify(self.encoding, self.dense_weights, self.dense_biases, add_summaries = True)
+
+		return self._logits
+
+	def _classify(self, encoding, dense_weights, dense_biases, add_summaries = False):
+		# dense layers (with dropout) applied to the flattened encoding with the given weights and biases
 
-					if self.activation_function =='relu':
-						dense_act = tf.nn.relu(dense_preact, name='dense_{}_act'.format(d_ind))
-					
-					elif self.activation_function == 'scaled_tanh':
-						dense_act = tf.add(tf.nn.tanh(dense_preact) / 2, 0.5, 'dense_{}_act'.format(d_ind))
+		encoding_shape = encoding.get_shape().as_list()
 
-					else:
-						dense_act = tf.nn.sigmoid(dense_preact, name='dense_{}_act'.format(d_ind))
+		encoding_dim = encoding_shape[1] * encoding_shape[2] * encoding_shape[3]
 
-					# add dropout regularization
-					dense_act_drop = tf.nn.dropout(dense_act, self.keep_prob)
+		tmp_tensor = tf.reshape(encoding, [-1, encoding_dim], name='last_conv_output_flattened')
 
-					tmp_tensor = dense_act_drop
+		for d_ind, (W, b) in enumerate(zip(dense_weights, dense_biases)):
+
+			dense_preact 	= tf.add(tf.matmul(tmp_tensor, W), b, name='dense_{}_preact'.format(d_ind))
+
+			if add_summaries:
+				self.add_summary(tf.summary.histogram('dense_layer_{}_preact'.format(d_ind), dense_preact), 'full')
+
+			if d_ind != len(dense_weights) - 1:
+
+				if self.activation_function =='relu':
+					dense_act = tf.nn.relu(dense_preact, name='dense_{}_act'.format(d_ind))
+				
+				elif self.activation_function == 'scaled_tanh':
+					dense_act = tf.add(tf.nn.tanh(dense_preact) / 2, 0.5, 'dense_{}_act'.format(d_ind))
 
 				else:
+					dense_act = tf.nn.sigmoid(dense_preact, name='dense_{}_act'.format(d_ind))
 
-					tmp_tensor = dense_preact
+				# add dropout regularization
+				dense_act_drop = tf.nn.dropout(dense_act, self.keep_prob)
 
-			self._logits = tmp_tensor
+				tmp_tensor = dense_act_drop
 
-		return self._logits
+			else:
+
+				tmp_tensor = dense_preact
+
+		return tmp_tensor
 
 	@property
 	def prediction(self):
@@ -316,49 +365,72 @@ class CNN:
 		if self._error is None:
 			print('initialize error')
 
-			if self.one_hot_labels:
-				ce_error = tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(labels=self.target, logits=self.logits, name='cross-entropy_error'))
-			else:
-				ce_error = tf.reduce_mean(tf.nn.sparse_softmax_cross_entropy_with_logits(labels=self.target, logits=self.logits, name='cross-entropy_error'))
-
+			ce_error = self._cross_entropy(self.target, self.logits)
 
 			self._error = ce_error + self.decay_factor * self.decay_sum
 
 			if self.add_tensorboard_summary:
-				self._summaries.append(tf.summary.scalar('cross entropy error', ce_error))
+				self.add_summary(tf.summary.scalar('cross entropy error', ce_error), 'scalars')
 				if self.decay_factor > 0:
-					self._summaries.append(tf.summary.scalar('total error (incl weight decay)', self._error))
+					self.add_summary(tf.summary.scalar('total error (incl weight decay)', self._error), 'scalars')
 
 		return self._error
 
+	def _cross_entropy(self, target, logits):
+		if self.one_hot_labels:
+			return tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(labels=target, logits=logits, name='cross-entropy_error'))
+		else:
+			return tf.reduce_mean(tf.nn.sparse_softmax_cross_entropy_with_logits(labels=target, logits=logits, name='cross-entropy_error'))
+
 	@property
 	def optimizer(self):
 
 		if self._optimizer is None:
 			print('init optimizer')
 
-			if self.decay_steps:
+			# linear scaling with gradient accumulation: the step size grows with the effective batch size and the
+			# learning rate decays after the same number of training examples as without accumulation
+			step_size 	= self.step_size * self.accumulation_steps
+			decay_steps = max(1, self.decay_steps // self.accumulation_steps) if self.decay_steps else self.decay_steps
+
+			if decay_steps:
 
 				print('learning rate decay enabled')
 
 				# Decay the learning rate exponentially based on the number of steps.
-				lr = tf.train.exponential_decay(self.step_size,
+				lr = tf.train.exponential_decay(step_size,
 						self.global_step,
-						self.decay_steps, # 10000
+						decay_steps, # 10000
 						self.decay_rate, # 0.1
 						staircase=True)
 			else:
 
-				lr = self.step_size
+				lr = step_size
 
 				print('learning rate decay disabled, lr = {}'.format(lr))
 
+			lr = lr * self.step_size_factor
 
-			self._summaries.append(tf.summary.scalar('learning_rate', lr))
+			self.add_summary(tf.summary.scalar('learning_rate', lr), 'scalars')
 			self._optimizer = tf.train.GradientDescentOptimizer(lr)
 
 		return self._optimizer
 
+	@property
+	def gradients(self):
+		# (gradient, variable) pairs of the error for all trainable variables, computed once and shared by
+		# optimize, optimize_dense_layers and the gradient summaries. With accumulation_steps > 1 the gradients
+		# are accumulated over the micro batches of the batch (lib/gradient_accumulation.py)
+
+		if self._gradients is None:
+
+			if self.accumulation_steps > 1:
+				self._gradients = list(zip(self._batch_gradients(self.data, self.target), self._optimized_variables()))
+			else:
+				self._gradients = self.optimizer.compute_gradients(self.error)
+
+		return self._gradients
+
 	@property
 	def optimize(self):
 		# minimize the error function tuning all variables
@@ -367,9 +439,8 @@ class CNN:
 
 			print('init optimization')
 
-			self._optimize = self.optimizer.minimize(self.error)
+			self._optimize = self.optimizer.apply_gradients(self.gradients)
 
-		self.global_step += 1
 		return self._optimize
 
 	@property
@@ -380,10 +451,73 @@ class CNN:
 
 			print('init dense layer optimization')
 
-			self._optimize_dense_layers = tf.train.AdamOptimizer(self.step_size).minimize(self.error, var_list = self.dense_layer_variables)
+			if self.accumulation_steps > 1:
+				self._optimize_dense_layers = self.training_step(self.data, self.target, fine_tuning_only=True)
+			else:
+				dense_layer_variable_names = [variable.name for variable in self.dense_layer_variables]
+				dense_layer_gradients = [(gradient, variable) for gradient, variable in self.gradients if variable.name in dense_layer_variable_names]
+
+				self._optimize_dense_layers = self.dense_layer_optimizer.apply_gradients(dense_layer_gradients)
 
 		return self._optimize_dense_layers
 
+	@property
+	def dense_layer_optimizer(self):
+
+		if self._dense_layer_optimizer is None:
+			self._dense_layer_optimizer = tf.train.AdamOptimizer(self.step_size * self.step_size_factor)
+
+		return self._dense_layer_optimizer
+
+	def training_step(self, data, target, fine_tuning_only = False):
+		# one optimization step (as optimize / optimize_dense_layers) on the input tensors data and target, sharing all
+		# variables and optimizers with the network, e.g. to run several steps per sess.run inside a tf.while_loop
+		# (scripts/multi_step_training.py). The variables are read again and the gradients are taken with respect to
+		# these reads, so every step sees the updates of the previous one. The global step is not incremented.
+		# With accumulation_steps > 1 the gradients are averaged over the micro batches (lib/gradient_accumulation.py).
+
+		optimizer = self.dense_layer_optimizer if fine_tuning_only else self.optimizer
+		gradients = self._batch_gradients(data, target, fine_tuning_only)
+
+		return optimizer.apply_gradients(list(zip(gradients, self._optimized_variables(fine_tuning_only))))
+
+	def _optimized_variables(self, fine_tuning_only = False):
+		if fine_tuning_only:
+			return self.dense_weights + self.dense_biases
+		return self.conv_weights + self.conv_biases + self.dense_weights + self.dense_biases
+
+	def _batch_gradients(self, data, target, fine_tuning_only = False):
+		# gradients of the error on data and target for _optimized_variables, taken with respect to fresh reads
+
+		if self.accumulation_steps > 1:
+			# the error of every micro batch is scaled, so the summed gradients are the gradients of the batch error
+			gradient_fn = lambda micro_data, micro_target: self._step_gradients(micro_data, micro_target, fine_tuning_only, 1.0 / self.accumulation_steps)
+			return gradient_accumulation.accumulate_gradients(gradient_fn, [data, target], self._optimized_variables(fine_tuning_only), self.accumulation_steps)
+
+		return self._step_gradients(data, target, fine_tuning_only)
+
+	def _step_gradients(self, data, target, fine_tuning_only, scale = 1.0):
+		# gradients of the (scaled) error on data and target with respect to fresh reads of the optimized variables
+
+		conv_weights 	= [W.read_value() for W in self.conv_weights]
+		conv_biases 	= [b.read_value() for b in self.conv_biases]
+		dense_weights 	= [W.read_value() for W in self.dense_weights]
+		dense_biases 	= [b.read_value() for b in self.dense_biases]
+
+		logits = self._classify(self._encode(data, conv_weights, conv_biases), dense_weights, dense_biases)
+
+		error = self._cross_entropy(target, logits)
+		if self.decay_factor > 0:
+			decay_terms = [tf.nn.l2_loss(W) for W in conv_weights + dense_weights]
+			error += self.decay_factor * tf.add_n(decay_terms) / len(decay_terms)
+
+		if fine_tuning_only:
+			reads = dense_weights + dense_biases
+		else:
+			reads = conv_weights + conv_biases + dense_weights + dense_biases
+
+		return tf.gradients(scale * error, reads)
+
 	@property
 	def accuracy(self):
 
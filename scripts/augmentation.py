@@ -0,0 +1,107 @@
+# ------------------------------------------------------------------------------------------
+# batch augmentation for the in-memory CIFAR and CK+ datasets: random crops, flips
+# and brightness/contrast jitter applied to a whole (N, H, W, C) float batch in [0, 1] with
+# vectorized numpy indexing (no per-image python loop)
+#
+# a BatchAugmenter is a (images, labels) -> (images, labels) function and can be used as the
+# transform of a BatchPrefetcher, the augmentation then runs in the producer thread
+#
+# digits are not augmented: mirrored (and shifted) digits change or lose their class
+# ------------------------------------------------------------------------------------------
+
+import numpy as np
+
+import scripts.datasets as datasets
+
+# dataset families (scripts/datasets.dataset_family) the augmentation is meant for
+AUGMENTED_FAMILIES = ('CIFAR', 'CKPLUS')
+
+# photometric jitter of cifar10_input.distorted_inputs, rescaled to images in [0, 1]
+MAX_BRIGHTNESS_DELTA 	= 63. / 255
+CONTRAST_RANGE 			= (0.2, 1.8)
+
+
+def random_crop(images, padding, rng):
+	# zero-pads every image by padding pixels and crops it back to its size at a random offset
+	n, h, w, c = images.shape
+
+	padded = np.pad(images, ((0, 0), (padding, padding), (padding, padding), (0, 0)), mode='constant')
+
+	offset_y = rng.randint(0, 2 * padding + 1, size=n)
+	offset_x = rng.randint(0, 2 * padding + 1, size=n)
+
+	rows = offset_y[:, None] + np.arange(h)
+	cols = offset_x[:, None] + np.arange(w)
+
+	# (n, 1, 1), (n, h, 1), (n, 1, w) broadcast to one (n, h, w, c) gather
+	return padded[np.arange(n)[:, None, None], rows[:, :, None], cols[:, None, :]]
+
+def random_flip(images, rng):
+	# mirrors a random half of the images horizontally (in place)
+	flip = rng.rand(images.shape[0]) < 0.5
+	images[flip] = images[flip, :, ::-1]
+	return images
+
+def random_brightness(images, max_delta, rng):
+	images += rng.uniform(-max_delta, max_delta, size=(images.shape[0], 1, 1, 1)).astype(images.dtype)
+	return images
+
+def random_contrast(images, lower, upper, rng):
+	# scales the distance of every pixel to the mean of its image channel
+	factor 	= rng.uniform(lower, upper, size=(images.shape[0], 1, 1, 1)).astype(images.dtype)
+	mean 	= images.mean(axis=(1, 2), keepdims=True)
+	images -= mean
+	images *= factor
+	images += mean
+	return images
+
+def supports_augmentation(spec):
+	# True if the training images of the dataset specification spec may be augmented
+	return datasets.dataset_family(spec) in AUGMENTED_FAMILIES
+
+
+class BatchAugmenter:
+
+	def __init__(self, image_shape, crop_padding = None, flip = True, color = True, clip = True, seed = None):
+		# image_shape 	: (H, W) or (H, W, C) of a single image, flattened batches are reshaped to it
+		# crop_padding 	: maximal crop shift in pixels (None: 1/8 of the image size, 0: no crops)
+		# flip 			: random horizontal flips
+		# color 		: random brightness and contrast (same ranges as cifar10_input)
+		# clip 			: clip the jittered images to [0, 1] (the range of the un-augmented inputs)
+
+		self.image_shape = tuple(image_shape)
+		if len(self.image_shape) == 2:
+			self.image_shape += (1,)
+
+		if crop_padding is None:
+			crop_padding = min(self.image_shape[:2]) // 8
+
+		self.crop_padding 	= crop_padding
+		self.flip 			= flip
+		self.color 			= color
+		self.clip 			= clip
+
+		self._rng = np.random.RandomState(seed)
+
+	def augment(self, images):
+		# images: float batch of shape (N,) + image_shape or (N, H*W*C), returned in the same shape
+		batch_shape = images.shape
+		images = np.array(images, dtype=np.float32).reshape((-1,) + self.image_shape)
+
+		if self.crop_padding > 0:
+			images = random_crop(images, self.crop_padding, self._rng)
+
+		if self.flip:
+			images = random_flip(images, self._rng)
+
+		if self.color:
+			images = random_brightness(images, MAX_BRIGHTNESS_DELTA, self._rng)
+			images = random_contrast(images, CONTRAST_RANGE[0], CONTRAST_RANGE[1], self._rng)
+
+			if self.clip:
+				np.clip(images, 0., 1., out=images)
+
+		return images.reshape(batch_shape)
+
+	def __call__(self, images, labels):
+		return self.augment(images), labels
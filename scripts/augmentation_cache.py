@@ -0,0 +1,170 @@
+# ------------------------------------------------------------------------------------------
+# materialized augmentation epochs: K seeded, augmented copies of the training split of a
+# stored dataset are written once as one uint8 (K, N, H, W, C) array next to the dataset
+# store and memory-mapped by all later runs (e.g. the repeated paper reference trials)
+#
+# usage (one-time, optional since augmented_data_set creates missing caches):
+#	python -m scripts.augmentation_cache dataset epochs [seed]
+# ------------------------------------------------------------------------------------------
+
+import os, sys, json, shutil, tempfile
+
+import numpy as np
+
+import scripts.dataset_store as dataset_store
+from scripts.augmentation import BatchAugmenter
+
+# number of images augmented at once while writing the cache
+CHUNK_SIZE = 1000
+
+
+def cache_name(epochs, seed):
+	return 'augmented-k{}-s{}'.format(epochs, seed)
+
+def cache_path(name, epochs, seed, store_dir = dataset_store.STORE_DIR):
+	return os.path.join(dataset_store.store_path(name, store_dir), cache_name(epochs, seed))
+
+def is_cached(name, epochs, seed, store_dir = dataset_store.STORE_DIR):
+	return os.path.isfile(os.path.join(cache_path(name, epochs, seed, store_dir), 'meta.json'))
+
+def write_cache(name, epochs, seed = 0, store_dir = dataset_store.STORE_DIR):
+	# augments the training split of the stored dataset name epochs times (same augmentation as BatchAugmenter)
+	# written into a temporary folder that is renamed at the end (see dataset_store.write_dataset)
+
+	if name.startswith('MNIST'):
+		raise ValueError('MNIST is not augmented (mirrored digits change their class)')
+
+	if not dataset_store.is_stored(name, store_dir):
+		dataset_store.convert(name, store_dir)
+
+	images, _ 	= dataset_store.load_base(name, store_dir)
+	indices 	= dataset_store.load_indices(name, 'train', store_dir)
+	num_examples = indices.shape[0]
+
+	augmenter = BatchAugmenter(images.shape[1:], seed=seed)
+
+	tmp_dir = tempfile.mkdtemp(prefix='.{}-'.format(cache_name(epochs, seed)), dir=dataset_store.store_path(name, store_dir))
+
+	# copies of the training split in the order of its indices
+	augmented = np.lib.format.open_memmap(os.path.join(tmp_dir, 'train_images.npy'), mode='w+', dtype=np.uint8, shape=(epochs, num_examples) + images.shape[1:])
+
+	for epoch in range(epochs):
+		print('Augmenting epoch {} of {} of {}'.format(epoch + 1, epochs, name))
+
+		for start in range(0, num_examples, CHUNK_SIZE):
+			chunk = np.asarray(images[indices[start:start + CHUNK_SIZE]], dtype=np.float32) * (1. / 255)
+			augmented[epoch, start:start + CHUNK_SIZE] = np.rint(augmenter.augment(chunk) * 255)
+
+	augmented.flush()
+	del augmented
+
+	meta = {'dataset': name, 'epochs': epochs, 'seed': seed, 'num_examples': int(num_examples), 'image_shape': list(images.shape[1:])}
+
+	with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+		json.dump(meta, f, indent=1)
+
+	try:
+		os.rename(tmp_dir, cache_path(name, epochs, seed, store_dir))
+	except OSError:
+		# another process finished the same cache first
+		shutil.rmtree(tmp_dir, ignore_errors=True)
+
+	print('Stored {} augmented epochs of {} in {}'.format(epochs, name, cache_path(name, epochs, seed, store_dir)))
+
+def load_cache(name, epochs, seed, store_dir = dataset_store.STORE_DIR):
+	# memory-mapped (K, N, H, W, C) uint8 array
+	return np.load(os.path.join(cache_path(name, epochs, seed, store_dir), 'train_images.npy'), mmap_mode='r')
+
+
+class AugmentedDataSet(dataset_store.DataSet):
+	# training DataSet streaming from the materialized epochs: epoch e of the training run reads
+	# the augmented copy e % K (reshuffled every epoch), labels are the ones of the original split
+	# the base buffers are the cache rows, i.e. the training split in the order of its index file
+
+	def __init__(self, augmented, labels, num_classes, one_hot = True, flatten = False, name = None, indices = None):
+		# augmented 	: (K, N, H, W, C) cache of the N examples of the training split
+		# labels 		: labels of the N cache rows
+		# indices 		: cache rows that belong to this dataset (None: all of them)
+
+		self._augmented = augmented
+
+		dataset_store.DataSet.__init__(self, augmented[0], labels, num_classes, one_hot=one_hot, flatten=flatten, name=name, split='train', indices=indices)
+
+	@property
+	def num_augmented_epochs(self):
+		return self._augmented.shape[0]
+
+	def subset(self, num_examples):
+		return self.select(self.indices[:num_examples])
+
+	def select(self, indices):
+		# indices are cache rows
+		return AugmentedDataSet(self._augmented, self._base_labels, self._num_classes, one_hot=self._one_hot, flatten=self._flatten, name=self._name, indices=indices)
+
+	def next_batch(self, batch_size, shuffle = True):
+		# a batch that completes an epoch is read from the augmented copy of the epoch it started in
+		epoch 	= self._epochs_completed % self.num_augmented_epochs
+		indices = self._next_indices(batch_size, shuffle)
+
+		if self._indices is not None:
+			# sorted rows give sequential reads on the memory map, the batch content is the same
+			indices = np.sort(self._indices[indices])
+
+		images = dataset_store.ImageView(self._augmented[epoch], self._flatten)
+		labels = dataset_store.LabelView(self._base_labels, self._num_classes, self._one_hot)
+		return images[indices], labels[indices]
+
+
+def cache_rows(split_indices, indices):
+	# positions of the examples indices (of the base buffers) in split_indices, i.e. their rows in the cache
+	order 	= np.argsort(split_indices, kind='mergesort')
+	rows 	= order[np.clip(np.searchsorted(split_indices, indices, sorter=order), 0, len(order) - 1)]
+
+	if not np.array_equal(split_indices[rows], indices):
+		raise ValueError('{} examples are not part of the training split'.format(int(np.sum(split_indices[rows] != indices))))
+
+	return rows
+
+def is_materializable(train_set):
+	# only the training split of a dataset of the store has a cache (not e.g. the generated SYNTHETIC data)
+	return train_set.name is not None and train_set.split == 'train'
+
+def augmented_data_set(train_set, epochs, seed = 0, store_dir = dataset_store.STORE_DIR):
+	# returns an AugmentedDataSet for the training DataSet of the store (also for its subsets, e.g. CIFAR_nk or
+	# seeded subsets), with the examples of train_set in the same order
+	# the cache of the whole training split is created if it does not exist yet
+
+	if not is_materializable(train_set):
+		raise ValueError('Augmentation epochs can only be materialized for the training split of a stored dataset')
+
+	if not is_cached(train_set.name, epochs, seed, store_dir):
+		write_cache(train_set.name, epochs, seed, store_dir)
+
+	augmented 		= load_cache(train_set.name, epochs, seed, store_dir)
+	_, labels 		= dataset_store.load_base(train_set.name, store_dir)
+	split_indices 	= dataset_store.load_indices(train_set.name, 'train', store_dir)
+
+	assert augmented.shape[1] == split_indices.shape[0], 'cache rows: {} training split: {}'.format(augmented.shape[1], split_indices.shape[0])
+
+	rows = cache_rows(split_indices, train_set.indices)
+
+	return AugmentedDataSet(augmented, labels[split_indices], train_set.num_classes, one_hot=train_set.one_hot, flatten=train_set.flatten, name=train_set.name, indices=rows)
+
+
+if __name__ == '__main__':
+
+	if len(sys.argv) not in [3, 4]:
+		print('Usage: python -m scripts.augmentation_cache dataset epochs [seed]')
+		print('dataset : (CIFAR10 | CKPLUS-f<frames> | CKPLUS-f<frames>-all)')
+		print('epochs  : number of augmented copies of the training split')
+		print('seed    : random seed of the augmentation (default: 0)')
+		sys.exit(1)
+
+	dataset_name 	= sys.argv[1]
+	num_epochs 		= int(sys.argv[2])
+	augment_seed 	= int(sys.argv[3]) if len(sys.argv) == 4 else 0
+
+	if is_cached(dataset_name, num_epochs, augment_seed):
+		print('{} is already cached in {}'.format(dataset_name, cache_path(dataset_name, num_epochs, augment_seed)))
+	else:
+		write_cache(dataset_name, num_epochs, augment_seed)
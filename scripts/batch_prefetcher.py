@@ -0,0 +1,77 @@
+# --------------------------------------------------------------------------------------
+# background producer for the in-memory datasets (MNIST, CIFAR_nk, CK+): the next batches
+# are drawn, shaped and typed for the input placeholders in a separate thread while the
+# current training step runs, the thread is stopped with the usual coord.request_stop()
+# --------------------------------------------------------------------------------------
+
+import threading
+
+import numpy as np
+from six.moves import queue
+
+class BatchPrefetcher:
+
+	def __init__(self, dataset, batch_size, coord, image_shape = None, image_dtype = np.float32, label_dtype = None, capacity = 2, transform = None):
+		# dataset 		: object with a next_batch(batch_size) method (e.g. data.train)
+		# coord 		: tf.train.Coordinator that stops the producer thread
+		# image_shape 	: shape of a single input image as expected by the placeholder (None: keep)
+		# capacity 		: number of prepared batches (2: double buffering, 3: triple buffering)
+		# transform 	: optional function (images, labels) -> (images, labels) applied in the producer thread
+
+		self.dataset 		= dataset
+		self.batch_size 	= batch_size
+		self.coord 			= coord
+
+		self.image_shape 	= None if image_shape is None else tuple(image_shape)
+		self.image_dtype 	= image_dtype
+		self.label_dtype 	= label_dtype
+		self.transform 		= transform
+
+		self._queue 	= queue.Queue(maxsize = capacity)
+		self._thread 	= threading.Thread(target = self._run, name = 'batch_prefetcher')
+		self._thread.daemon = True
+
+	def start(self):
+		# returns the started threads (to be passed to coord.join())
+		self._thread.start()
+		return [self._thread]
+
+	def _prepare_batch(self):
+		images, labels = self.dataset.next_batch(self.batch_size)
+
+		if self.transform is not None:
+			images, labels = self.transform(images, labels)
+
+		if self.image_shape is not None:
+			images = images.reshape((-1,) + self.image_shape)
+
+		images = np.ascontiguousarray(images, dtype = self.image_dtype)
+
+		if self.label_dtype is not None:
+			labels = np.asarray(labels, dtype = self.label_dtype)
+
+		return images, labels
+
+	def _run(self):
+		with self.coord.stop_on_exception():
+			while not self.coord.should_stop():
+				batch = self._prepare_batch()
+
+				# wait for a free slot, but keep checking whether training was stopped
+				while not self.coord.should_stop():
+					try:
+						self._queue.put(batch, timeout = 0.1)
+						break
+					except queue.Full:
+						pass
+
+	def next_batch(self):
+		# returns the next prepared (images, labels) batch
+		while True:
+			try:
+				return self._queue.get(timeout = 0.1)
+			except queue.Empty:
+				if self.coord.should_stop():
+					# re-raises an exception of the producer thread if there was one
+					self.coord.raise_requested_exception()
+					raise RuntimeError('batch prefetcher was stopped')
@@ -0,0 +1,88 @@
+# ------------------------------------------------------------------------------------------
+# calibration of the CIFAR-10 queue pipeline (cifar10_input.distorted_inputs): measures the
+# throughput (images / s, input only) for a grid of reader pipelines, enqueue threads and queue
+# capacities and prints the fastest setting as entries for the [CAE] / [CNN] config sections
+#
+# every setting is measured in a fresh graph with a small shuffling queue, so the warm-up
+# batches drain the initial fill and the timed batches show the steady-state rate
+#
+# usage:
+#	python -m scripts.calibrate_cifar_input [data_dir] [batch_size] [num_batches]
+# ------------------------------------------------------------------------------------------
+
+import sys, time, multiprocessing
+
+import tensorflow as tf
+
+import scripts.from_github.cifar10_input as cifar10_input
+
+# fraction of the training set kept in the queue during the measurement (the training default is 0.4)
+MIN_FRACTION_OF_EXAMPLES_IN_QUEUE 	= 0.02
+WARMUP_BATCHES 						= 20
+CAPACITY_BATCHES 					= [1, cifar10_input.CAPACITY_BATCHES, 8]
+
+
+def _candidates(max_value):
+	# 1, 2, 4, ... up to max_value (inclusive)
+	values = []
+	value = 1
+	while value < max_value:
+		values.append(value)
+		value *= 2
+	return values + [max_value]
+
+def measure(data_dir, batch_size, num_batches, num_readers, num_preprocess_threads, capacity_batches):
+	# images per second delivered by distorted_inputs with the given setting
+	with tf.Graph().as_default():
+		image_batch, label_batch = cifar10_input.distorted_inputs(data_dir, batch_size, num_readers=num_readers, num_preprocess_threads=num_preprocess_threads, capacity_batches=capacity_batches, min_fraction_of_examples_in_queue=MIN_FRACTION_OF_EXAMPLES_IN_QUEUE)
+
+		with tf.Session() as sess:
+			coord = tf.train.Coordinator()
+			threads = tf.train.start_queue_runners(sess=sess, coord=coord)
+
+			for _ in range(WARMUP_BATCHES):
+				sess.run([image_batch, label_batch])
+
+			start = time.time()
+			for _ in range(num_batches):
+				sess.run([image_batch, label_batch])
+			duration = time.time() - start
+
+			coord.request_stop()
+			coord.join(threads)
+
+	return num_batches * batch_size / duration
+
+def calibrate(data_dir, batch_size = 128, num_batches = 100):
+	# returns (images / s, num_readers, num_preprocess_threads, capacity_batches) of the fastest setting
+	num_cpus = multiprocessing.cpu_count()
+
+	results = []
+	for num_readers in _candidates(max(1, num_cpus // 2)):
+		for num_preprocess_threads in _candidates(2 * num_cpus):
+			if num_preprocess_threads < num_readers:
+				continue
+			for capacity_batches in CAPACITY_BATCHES:
+				images_per_second = measure(data_dir, batch_size, num_batches, num_readers, num_preprocess_threads, capacity_batches)
+				print('readers {:2d} threads {:3d} capacity {:2d} batches: {:8.1f} images/s'.format(num_readers, num_preprocess_threads, capacity_batches, images_per_second))
+				results.append((images_per_second, num_readers, num_preprocess_threads, capacity_batches))
+
+	return max(results)
+
+
+if __name__ == '__main__':
+
+	if len(sys.argv) > 4:
+		print('Usage: python -m scripts.calibrate_cifar_input [data_dir] [batch_size] [num_batches]')
+		sys.exit(1)
+
+	cifar_dir 	= sys.argv[1] if len(sys.argv) > 1 else 'cifar10_data/cifar-10-batches-bin'
+	batch_size 	= int(sys.argv[2]) if len(sys.argv) > 2 else 128
+	num_batches = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+	images_per_second, num_readers, num_preprocess_threads, capacity_batches = calibrate(cifar_dir, batch_size, num_batches)
+
+	print('Fastest setting ({:.1f} images/s on {} cpus), add to the [CAE] / [CNN] config section:'.format(images_per_second, multiprocessing.cpu_count()))
+	print('cifar_input_readers = {}'.format(num_readers))
+	print('cifar_input_threads = {}'.format(num_preprocess_threads))
+	print('cifar_queue_capacity_batches = {}'.format(capacity_batches))
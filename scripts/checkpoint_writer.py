@@ -0,0 +1,103 @@
+# --------------------------------------------------------------------------------------
+# asynchronous checkpoints for train_ae / train_cnn: save() only copies the variable values
+# out of the training session, the checkpoint files are written by a background thread
+# (e.g. to network-mounted weights/ directories) while training continues
+#
+# the thread restores the snapshot into copies of the variables in a separate graph and
+# saves them with one tf.train.Saver per checkpoint kind ('checkpoint', 'best'). The files
+# are read by tf.train.Saver(variables_dict) of the model as before (no .meta files).
+# At most capacity snapshots wait for the writer, save() blocks while the queue is full.
+# --------------------------------------------------------------------------------------
+
+import atexit, threading
+
+import tensorflow as tf
+from six.moves import queue
+
+class CheckpointWriter:
+
+	def __init__(self, variables_dict, savers = ('checkpoint', 'best'), max_to_keep = 1, capacity = 2):
+		# variables_dict 	: {name in the checkpoint: variable} (e.g. all_variables_dict of the CAE / CNN)
+		# savers 			: checkpoint kinds, every kind keeps its own max_to_keep most recent checkpoints
+		# capacity 			: number of snapshots waiting to be written
+
+		self._names 	= sorted(variables_dict.keys())
+		self._variables = [variables_dict[name] for name in self._names]
+
+		self._graph = tf.Graph()
+		with self._graph.as_default():
+			self._inputs = [tf.placeholder(variable.dtype.base_dtype, name='{}_value'.format(name)) for name, variable in zip(self._names, self._variables)]
+			copies = [tf.Variable(value, validate_shape=False, name=name) for name, value in zip(self._names, self._inputs)]
+
+			self._restore_snapshot = tf.variables_initializer(copies)
+			self._savers = dict((saver, tf.train.Saver(dict(zip(self._names, copies)), max_to_keep=max_to_keep)) for saver in savers)
+
+		self._session = tf.Session(graph=self._graph)
+
+		self._error 	= None
+		self._closed 	= False
+
+		self._queue 	= queue.Queue(maxsize = capacity)
+		self._thread 	= threading.Thread(target = self._run, name = 'checkpoint_writer')
+		self._thread.daemon = True
+		self._thread.start()
+
+		# pending checkpoints are written even if training ends without close()
+		atexit.register(self.close)
+
+	def _run(self):
+		while True:
+			job = self._queue.get()
+
+			try:
+				if job is None:
+					return
+
+				values, paths, step = job
+
+				if self._error is None:
+					self._session.run(self._restore_snapshot, feed_dict=dict(zip(self._inputs, values)))
+
+					for saver, path in sorted(paths.items()):
+						save_path = self._savers[saver].save(self._session, path, global_step=step, write_meta_graph=False)
+						print('Model was saved in {}'.format(save_path))
+
+			except Exception as e:
+				# reported by the next save / flush / close call
+				self._error = e
+
+			finally:
+				self._queue.task_done()
+
+	def _raise_error(self):
+		if self._error is not None:
+			raise RuntimeError('Writing a checkpoint failed: {}'.format(self._error))
+
+	def save(self, sess, paths, step = None, values = None):
+		# paths 	: {checkpoint kind: path prefix}, e.g. {'checkpoint': ..., 'best': ...}, all checkpoints of one call are
+		# 			  written from the same snapshot of the variables (taken now)
+		# values 	: {name: value} snapshot taken before (e.g. by a ConcurrentEvaluator), sess is not used then
+		self._raise_error()
+
+		if values is None:
+			values = sess.run(self._variables)
+		else:
+			values = [values[name] for name in self._names]
+
+		self._queue.put((values, dict(paths), step))
+
+	def flush(self):
+		# waits until all pending checkpoints are written (e.g. before restoring one of them)
+		self._queue.join()
+		self._raise_error()
+
+	def close(self):
+		if self._closed:
+			return
+		self._closed = True
+
+		self._queue.put(None)
+		self._thread.join()
+		self._session.close()
+
+		self._raise_error()
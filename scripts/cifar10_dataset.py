@@ -0,0 +1,159 @@
+# ------------------------------------------------------------------------------------------
+# tf.data input pipeline for the CIFAR-10 binary files (alternative to the queue runners in
+# scripts/from_github/cifar10_input.py with the same interface and the same preprocessing)
+#
+# records are decoded with a parallel map, the random distortions are applied to whole
+# batches and the batches are prefetched, no queue runner threads are needed
+# ------------------------------------------------------------------------------------------
+
+import os
+import multiprocessing
+
+import tensorflow as tf
+
+from scripts.from_github.cifar10_input import IMAGE_SIZE, NUM_EXAMPLES_PER_EPOCH_FOR_TRAIN
+
+# dimensions of the CIFAR-10 binary records
+LABEL_BYTES 	= 1
+HEIGHT 			= 32
+WIDTH 			= 32
+DEPTH 			= 3
+IMAGE_BYTES 	= HEIGHT * WIDTH * DEPTH
+RECORD_BYTES 	= LABEL_BYTES + IMAGE_BYTES
+
+# same fraction of the training set that the shuffle queue of cifar10_input keeps
+MIN_FRACTION_OF_EXAMPLES_IN_BUFFER = 0.4
+
+
+def _autotune():
+	# autotuned parallelism if the installed tensorflow supports it (>= 1.8), one call per cpu otherwise
+	experimental = getattr(tf.data, 'experimental', None)
+	if experimental is not None and hasattr(experimental, 'AUTOTUNE'):
+		return experimental.AUTOTUNE
+	if hasattr(tf.contrib.data, 'AUTOTUNE'):
+		return tf.contrib.data.AUTOTUNE
+	return multiprocessing.cpu_count()
+
+def train_filenames(data_dir):
+	return [os.path.join(data_dir, 'data_batch_%d.bin' % i) for i in range(1, 6)]
+
+def test_filenames(data_dir):
+	return [os.path.join(data_dir, 'test_batch.bin')]
+
+def _check_files(filenames):
+	for f in filenames:
+		if not tf.gfile.Exists(f):
+			raise ValueError('Failed to find file: ' + f)
+
+def decode_record(record):
+	# one binary record -> uint8 image [32, 32, 3] and int32 label
+	record_bytes = tf.decode_raw(record, tf.uint8)
+
+	label = tf.cast(record_bytes[0], tf.int32)
+
+	depth_major = tf.reshape(record_bytes[LABEL_BYTES:RECORD_BYTES], [DEPTH, HEIGHT, WIDTH])
+	image = tf.transpose(depth_major, [1, 2, 0])
+
+	return image, label
+
+def distort_batch(images, labels):
+	# random crop, horizontal flip, brightness and contrast for a whole uint8 batch [N, 32, 32, 3]
+	# (same distortions as cifar10_input.distorted_inputs, drawn independently for every image)
+
+	images = tf.cast(images, tf.float32)
+	batch_size = tf.shape(images)[0]
+
+	# random [IMAGE_SIZE, IMAGE_SIZE] crop: boxes of exactly IMAGE_SIZE pixels sample the original pixels without interpolation
+	offset_y = tf.cast(tf.random_uniform([batch_size], 0, HEIGHT - IMAGE_SIZE + 1, dtype=tf.int32), tf.float32)
+	offset_x = tf.cast(tf.random_uniform([batch_size], 0, WIDTH - IMAGE_SIZE + 1, dtype=tf.int32), tf.float32)
+	boxes = tf.stack([	offset_y / (HEIGHT - 1),
+						offset_x / (WIDTH - 1),
+						(offset_y + IMAGE_SIZE - 1) / (HEIGHT - 1),
+						(offset_x + IMAGE_SIZE - 1) / (WIDTH - 1)], axis=1)
+	images = tf.image.crop_and_resize(images, boxes, tf.range(batch_size), [IMAGE_SIZE, IMAGE_SIZE])
+
+	# random horizontal flip
+	flip = tf.random_uniform([batch_size]) < 0.5
+	images = tf.where(flip, tf.reverse(images, [2]), images)
+
+	# random brightness (max_delta=63) and contrast (lower=0.2, upper=1.8)
+	images = images + tf.random_uniform([batch_size, 1, 1, 1], -63., 63.)
+
+	contrast_factor = tf.random_uniform([batch_size, 1, 1, 1], 0.2, 1.8)
+	channel_mean = tf.reduce_mean(images, axis=[1, 2], keep_dims=True)
+	images = (images - channel_mean) * contrast_factor + channel_mean
+
+	# rescale to [0, 1] (see from_github/README.md)
+	images = images / 255.
+	images.set_shape([None, IMAGE_SIZE, IMAGE_SIZE, DEPTH])
+
+	return images, labels
+
+def crop_batch(images, labels):
+	# central [IMAGE_SIZE, IMAGE_SIZE] crop of a uint8 batch, rescaled to [0, 1]
+	offset_y = (HEIGHT - IMAGE_SIZE) // 2
+	offset_x = (WIDTH - IMAGE_SIZE) // 2
+
+	images = tf.cast(images[:, offset_y:offset_y + IMAGE_SIZE, offset_x:offset_x + IMAGE_SIZE, :], tf.float32) / 255.
+	images.set_shape([None, IMAGE_SIZE, IMAGE_SIZE, DEPTH])
+
+	return images, labels
+
+def batch_records(dataset, batch_size, preprocess_batch):
+	# decodes the records of dataset, batches and preprocesses them, returns the (images, labels) nodes
+	parallel_calls = _autotune()
+
+	dataset = dataset.repeat()
+	dataset = dataset.map(decode_record, num_parallel_calls=parallel_calls)
+	dataset = dataset.batch(batch_size)
+	dataset = dataset.map(preprocess_batch, num_parallel_calls=parallel_calls)
+	dataset = dataset.prefetch(parallel_calls)
+
+	images, labels = dataset.make_one_shot_iterator().get_next()
+
+	return images, tf.reshape(labels, [-1])
+
+def distorted_inputs(data_dir, batch_size, shuffle_buffer_size = None):
+	"""Construct distorted input for CIFAR training using tf.data.
+
+	Args:
+		data_dir: Path to the CIFAR-10 data directory.
+		batch_size: Number of images per batch.
+		shuffle_buffer_size: Number of records in the shuffle buffer (default: 40% of the training set).
+
+	Returns:
+		images: Images. 4D tensor of [batch_size, IMAGE_SIZE, IMAGE_SIZE, 3] size.
+		labels: Labels. 1D tensor of [batch_size] size.
+	"""
+	filenames = train_filenames(data_dir)
+	_check_files(filenames)
+
+	if shuffle_buffer_size is None:
+		shuffle_buffer_size = int(NUM_EXAMPLES_PER_EPOCH_FOR_TRAIN * MIN_FRACTION_OF_EXAMPLES_IN_BUFFER)
+
+	dataset = tf.data.FixedLengthRecordDataset(filenames, RECORD_BYTES)
+	dataset = dataset.shuffle(shuffle_buffer_size)
+
+	return batch_records(dataset, batch_size, distort_batch)
+
+def inputs(eval_data, data_dir, batch_size):
+	"""Construct input for CIFAR evaluation using tf.data.
+
+	Args:
+		eval_data: bool, indicating if one should use the train or eval data set.
+		data_dir: Path to the CIFAR-10 data directory.
+		batch_size: Number of images per batch.
+
+	Returns:
+		images: Images. 4D tensor of [batch_size, IMAGE_SIZE, IMAGE_SIZE, 3] size.
+		labels: Labels. 1D tensor of [batch_size] size.
+	"""
+	if eval_data:
+		filenames = test_filenames(data_dir)
+	else:
+		filenames = train_filenames(data_dir)
+	_check_files(filenames)
+
+	dataset = tf.data.FixedLengthRecordDataset(filenames, RECORD_BYTES)
+
+	return batch_records(dataset, batch_size, crop_batch)
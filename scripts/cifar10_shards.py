@@ -0,0 +1,93 @@
+# ------------------------------------------------------------------------------------------
+# pre-shuffled CIFAR-10 training shards: the training records are shuffled once offline and
+# written into several shard files (same binary record format as the original batches)
+#
+# the reader interleaves the shards (in a new random order every epoch) and only needs a
+# small shuffle buffer, training therefore starts without filling a 20000 image queue.
+# distorted_inputs and inputs have the interface of cifar10_input and cifar10_dataset
+#
+# usage (one-time, optional since distorted_inputs writes missing shards):
+#	python -m scripts.cifar10_shards [data_dir] [num_shards]
+# ------------------------------------------------------------------------------------------
+
+import os, sys, glob, shutil, tempfile
+
+import numpy as np
+import tensorflow as tf
+
+# evaluation input (inputs) is read from the original files in their order
+from scripts.cifar10_dataset import RECORD_BYTES, train_filenames, _check_files, batch_records, distort_batch, inputs
+
+SHARD_DIR_NAME 		= 'shuffled_shards'
+NUM_SHARDS 			= 10
+# shards read at the same time and records in the shuffle buffer
+CYCLE_LENGTH 		= 4
+SHUFFLE_BUFFER_SIZE = 1000
+
+
+def shard_dir(data_dir):
+	return os.path.join(data_dir, SHARD_DIR_NAME)
+
+def shard_filenames(data_dir):
+	return sorted(glob.glob(os.path.join(shard_dir(data_dir), 'shard_*.bin')))
+
+def write_shards(data_dir, num_shards = NUM_SHARDS, seed = 0):
+	# shuffles all training records once and splits them into num_shards files
+	# written into a temporary folder that is renamed at the end (concurrent jobs see all shards or none)
+
+	filenames = train_filenames(data_dir)
+	_check_files(filenames)
+
+	records = np.concatenate([np.fromfile(f, dtype=np.uint8).reshape(-1, RECORD_BYTES) for f in filenames])
+	records = records[np.random.RandomState(seed).permutation(records.shape[0])]
+
+	tmp_dir = tempfile.mkdtemp(prefix='.' + SHARD_DIR_NAME + '-', dir=data_dir)
+
+	for i, shard in enumerate(np.array_split(records, num_shards)):
+		shard.tofile(os.path.join(tmp_dir, 'shard_{:03d}.bin'.format(i)))
+
+	try:
+		os.rename(tmp_dir, shard_dir(data_dir))
+	except OSError:
+		# another process finished the same shards first
+		shutil.rmtree(tmp_dir, ignore_errors=True)
+
+	print('Wrote {} shuffled shards of {} training records to {}'.format(num_shards, records.shape[0], shard_dir(data_dir)))
+
+def distorted_inputs(data_dir, batch_size, shuffle_buffer_size = SHUFFLE_BUFFER_SIZE):
+	"""Construct distorted input for CIFAR training from the pre-shuffled shards.
+
+	Args:
+		data_dir: Path to the CIFAR-10 data directory.
+		batch_size: Number of images per batch.
+		shuffle_buffer_size: Number of records in the shuffle buffer.
+
+	Returns:
+		images: Images. 4D tensor of [batch_size, IMAGE_SIZE, IMAGE_SIZE, 3] size.
+		labels: Labels. 1D tensor of [batch_size] size.
+	"""
+	if not shard_filenames(data_dir):
+		write_shards(data_dir)
+
+	filenames = shard_filenames(data_dir)
+
+	files = tf.data.Dataset.from_tensor_slices(filenames).shuffle(len(filenames)).repeat()
+	dataset = files.interleave(lambda filename: tf.data.FixedLengthRecordDataset(filename, RECORD_BYTES), cycle_length=min(CYCLE_LENGTH, len(filenames)), block_length=1)
+	dataset = dataset.shuffle(shuffle_buffer_size)
+
+	return batch_records(dataset, batch_size, distort_batch)
+
+
+if __name__ == '__main__':
+
+	if len(sys.argv) > 3:
+		print('Usage: python -m scripts.cifar10_shards [data_dir] [num_shards]')
+		sys.exit(1)
+
+	cifar_dir 	= sys.argv[1] if len(sys.argv) > 1 else 'cifar10_data/cifar-10-batches-bin'
+	num_files 	= int(sys.argv[2]) if len(sys.argv) > 2 else NUM_SHARDS
+
+	if shard_filenames(cifar_dir):
+		print('Shards already exist in {}'.format(shard_dir(cifar_dir)))
+	else:
+		write_shards(cifar_dir, num_files)
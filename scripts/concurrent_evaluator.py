@@ -0,0 +1,100 @@
+# ------------------------------------------------------------------------------------------
+# concurrent evaluation for train_ae / train_cnn: submit() only copies the model variables out
+# of the training session, a background thread loads the snapshot into a second session on the
+# same graph and evaluates it there while training continues
+#
+#	evaluator = ConcurrentEvaluator(cnn.all_variables_dict, evaluate, report)
+#	evaluator.submit(sess, i)
+#
+#	evaluate(eval_sess) 			: returns the evaluation result, only runs nodes that read the
+#									  snapshot variables (e.g. accuracy with keep_prob fed)
+#	report(step, result, values) 	: called in the thread with the step of the snapshot and its
+#									  variable values {name: value} (e.g. for CheckpointWriter.save)
+#
+# At most capacity snapshots wait for the evaluation, submit() blocks while the queue is full,
+# so every submitted snapshot is evaluated.
+# ------------------------------------------------------------------------------------------
+
+import atexit, threading
+
+import tensorflow as tf
+from six.moves import queue
+
+class ConcurrentEvaluator:
+
+	def __init__(self, variables_dict, evaluate, report, capacity = 1, config = None):
+		# variables_dict 	: {name: variable} of all variables the evaluation reads (e.g. all_variables_dict of the CAE / CNN)
+		# config 			: tf.ConfigProto of the evaluation session
+
+		self._names 		= sorted(variables_dict.keys())
+		self._variables 	= [variables_dict[name] for name in self._names]
+		self._evaluate 		= evaluate
+		self._report 		= report
+
+		graph = self._variables[0].graph
+
+		with graph.as_default():
+			with tf.name_scope('concurrent_evaluator'):
+				self._inputs = [tf.placeholder(variable.dtype.base_dtype, variable.get_shape()) for variable in self._variables]
+				self._load_snapshot = tf.group(*[tf.assign(variable, value, validate_shape=False) for variable, value in zip(self._variables, self._inputs)])
+
+		# the variables of the second session are independent of the training session
+		self._session = tf.Session(graph=graph, config=config)
+
+		self._error 	= None
+		self._closed 	= False
+
+		self._queue 	= queue.Queue(maxsize = capacity)
+		self._thread 	= threading.Thread(target = self._run, name = 'concurrent_evaluator')
+		self._thread.daemon = True
+		self._thread.start()
+
+		atexit.register(self.close)
+
+	def _run(self):
+		while True:
+			job = self._queue.get()
+
+			try:
+				if job is None:
+					return
+
+				step, values = job
+
+				if self._error is None:
+					self._session.run(self._load_snapshot, feed_dict=dict(zip(self._inputs, values)))
+					self._report(step, self._evaluate(self._session), dict(zip(self._names, values)))
+
+			except Exception as e:
+				# reported by the next submit / flush / close call
+				self._error = e
+
+			finally:
+				self._queue.task_done()
+
+	def _raise_error(self):
+		if self._error is not None:
+			raise RuntimeError('Concurrent evaluation failed: {}'.format(self._error))
+
+	def submit(self, sess, step):
+		# evaluates the current variable values of sess, reported with step
+		self._raise_error()
+
+		values = sess.run(self._variables)
+		self._queue.put((step, values))
+
+	def flush(self):
+		# waits until all submitted snapshots are evaluated and reported
+		self._queue.join()
+		self._raise_error()
+
+	def close(self):
+		if self._closed:
+			return
+		self._closed = True
+
+		self._queue.put(None)
+		self._thread.join()
+		self._session.close()
+
+		self._raise_error()
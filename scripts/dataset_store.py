@@ -0,0 +1,408 @@
+# ----------------------------------------------------------------------------------------
+# on-disk dataset store: every dataset is converted once into uint8 NHWC images and int8
+# labels (one .npy file each, shared by all splits) plus one index file per split and is
+# memory-mapped by all later runs
+#
+# usage (one-time conversion, optional since read_data_sets converts missing datasets):
+#	python -m scripts.dataset_store MNIST CIFAR10 CKPLUS-f3 CKPLUS-f100-all
+# ----------------------------------------------------------------------------------------
+
+import os, sys, json, shutil, tempfile
+import collections
+
+import numpy as np
+
+STORE_DIR 	= os.path.join('datasets', 'store')
+SPLITS 		= ['train', 'validation', 'test']
+# layout version (2: one images / labels file for all splits and an index file per split,
+# 3: CIFAR10 training indices in the order of the former random split instead of sorted)
+STORE_VERSION 	= 3
+
+# same layout as tensorflow.contrib.learn.python.learn.datasets.base.Datasets
+Datasets = collections.namedtuple('Datasets', ['train', 'validation', 'test'])
+
+
+def dense_to_one_hot(labels, num_classes):
+	one_hot = np.zeros((labels.shape[0], num_classes), dtype=np.float32)
+	one_hot[np.arange(labels.shape[0]), labels.astype(np.int64)] = 1.
+	return one_hot
+
+
+class ImageView:
+	# read-only view on a uint8 image array, only the accessed part is converted to float32 in [0, 1]
+	# indices: examples of the array that belong to the view (None: all of them)
+
+	def __init__(self, images, flatten = False, indices = None):
+		self._images 	= images
+		self._flatten 	= flatten
+		self._indices 	= indices
+
+	def __len__(self):
+		if self._indices is None:
+			return self._images.shape[0]
+		return self._indices.shape[0]
+
+	@property
+	def shape(self):
+		if self._flatten:
+			return (len(self), int(np.prod(self._images.shape[1:])))
+		return (len(self),) + self._images.shape[1:]
+
+	def __getitem__(self, key):
+		if self._indices is not None:
+			key = self._indices[key]
+		images = np.asarray(self._images[key], dtype=np.float32) * (1. / 255)
+		if self._flatten:
+			images = images.reshape(images.shape[:-3] + (-1,))
+		return images
+
+
+class LabelView:
+	# read-only view on integer labels, expanded to one-hot vectors on access if needed
+
+	def __init__(self, labels, num_classes, one_hot = True, indices = None):
+		self._labels 		= labels
+		self._num_classes 	= num_classes
+		self._one_hot 		= one_hot
+		self._indices 		= indices
+
+	def __len__(self):
+		if self._indices is None:
+			return self._labels.shape[0]
+		return self._indices.shape[0]
+
+	@property
+	def shape(self):
+		if self._one_hot:
+			return (len(self), self._num_classes)
+		return (len(self),)
+
+	def __getitem__(self, key):
+		if self._indices is not None:
+			key = self._indices[key]
+		labels = np.asarray(self._labels[key])
+		if not self._one_hot:
+			return labels.astype(np.int64)
+		if labels.ndim == 0:
+			return dense_to_one_hot(labels[None], self._num_classes)[0]
+		return dense_to_one_hot(labels, self._num_classes)
+
+
+class DataSet:
+	# drop-in replacement for the tensorflow mnist DataSet working on (memory-mapped) uint8 arrays
+	# images and labels stay in their compact form, next_batch() only converts the requested batch
+	# splits and subsets are index arrays over the same base buffers, they never copy the images
+
+	def __init__(self, images, labels, num_classes, one_hot = True, flatten = False, name = None, split = None, indices = None):
+		# images, labels 	: base buffers, images in NHWC layout with values in [0, 255], integer labels
+		# indices 			: examples of the base buffers that belong to this dataset (None: all of them)
+
+		assert images.shape[0] == labels.shape[0], 'images.shape: {} labels.shape: {}'.format(images.shape, labels.shape)
+
+		self._base_images 	= images
+		self._base_labels 	= labels
+		self._indices 		= None if indices is None else np.asarray(indices, dtype=np.int64)
+		self._num_classes 	= num_classes
+		self._one_hot 		= one_hot
+		self._flatten 		= flatten
+
+		# store name and split the arrays come from (None for datasets built from other arrays)
+		self._name 			= name
+		self._split 		= split
+
+		self._num_examples 		= images.shape[0] if indices is None else self._indices.shape[0]
+		self._epochs_completed 	= 0
+		self._index_in_epoch 	= 0
+		self._perm 				= None
+
+	@property
+	def images(self):
+		return ImageView(self._base_images, self._flatten, self._indices)
+
+	@property
+	def labels(self):
+		return LabelView(self._base_labels, self._num_classes, self._one_hot, self._indices)
+
+	@property
+	def raw_images(self):
+		# compact uint8 images of this dataset (gathered from the base buffer for index selections)
+		if self._indices is None:
+			return self._base_images
+		return self._base_images[self._indices]
+
+	@property
+	def raw_labels(self):
+		if self._indices is None:
+			return self._base_labels
+		return self._base_labels[self._indices]
+
+	@property
+	def indices(self):
+		# indices of the examples in the base buffers
+		if self._indices is None:
+			return np.arange(self._num_examples)
+		return self._indices
+
+	@property
+	def name(self):
+		return self._name
+
+	@property
+	def split(self):
+		return self._split
+
+	@property
+	def one_hot(self):
+		return self._one_hot
+
+	@property
+	def flatten(self):
+		return self._flatten
+
+	@property
+	def num_classes(self):
+		return self._num_classes
+
+	@property
+	def num_examples(self):
+		return self._num_examples
+
+	@property
+	def epochs_completed(self):
+		return self._epochs_completed
+
+	def subset(self, num_examples):
+		# dataset on the first num_examples samples (slice of the base buffers or of the index array, no copy)
+		if self._indices is None:
+			return DataSet(self._base_images[:num_examples], self._base_labels[:num_examples], self._num_classes, one_hot=self._one_hot, flatten=self._flatten, name=self._name, split=self._split)
+		return self.select(self._indices[:num_examples])
+
+	def select(self, indices):
+		# dataset on the given examples of the base buffers (sharing them with this dataset)
+		return DataSet(self._base_images, self._base_labels, self._num_classes, one_hot=self._one_hot, flatten=self._flatten, name=self._name, split=self._split, indices=indices)
+
+	def next_batch(self, batch_size, shuffle = True):
+		indices = self._next_indices(batch_size, shuffle)
+
+		if self._indices is not None:
+			# sorted indices give sequential reads on the memory map, the batch content is the same
+			indices = np.sort(self._indices[indices])
+
+		return ImageView(self._base_images, self._flatten)[indices], LabelView(self._base_labels, self._num_classes, self._one_hot)[indices]
+
+	def _new_permutation(self, shuffle):
+		if shuffle:
+			return np.random.permutation(self._num_examples)
+		return np.arange(self._num_examples)
+
+	def _next_indices(self, batch_size, shuffle):
+
+		if self._perm is None:
+			self._perm = self._new_permutation(shuffle)
+
+		start = self._index_in_epoch
+
+		if start + batch_size > self._num_examples:
+			# finish the current epoch and start a new one with the rest of the batch
+			rest = self._perm[start:]
+			self._epochs_completed += 1
+			self._perm = self._new_permutation(shuffle)
+			self._index_in_epoch = batch_size - rest.shape[0]
+			indices = np.concatenate([rest, self._perm[:self._index_in_epoch]])
+
+		else:
+			self._index_in_epoch += batch_size
+			indices = self._perm[start:self._index_in_epoch]
+
+		# sorted indices give sequential reads on the memory map, the batch content is the same
+		return np.sort(indices)
+
+
+## ########## ##
+# STORE LAYOUT #
+## ########## ##
+
+def store_path(name, store_dir = STORE_DIR):
+	return os.path.join(store_dir, name)
+
+def source_fingerprint(name):
+	# summary of the raw data a store is converted from, a store of another fingerprint is converted again
+	# (CK+: new subject folders or labelled sequences), None: the store is never converted again
+	if name.startswith('CKPLUS-f'):
+		import scripts.load_ckplus as load_ckplus
+		return load_ckplus.source_fingerprint()
+	return None
+
+def is_stored(name, store_dir = STORE_DIR):
+	# True if the store of name has the current layout and was converted from the current raw data
+	meta_file = os.path.join(store_path(name, store_dir), 'meta.json')
+	if not os.path.isfile(meta_file):
+		return False
+	with open(meta_file, 'r') as f:
+		meta = json.load(f)
+
+	if meta.get('version') != STORE_VERSION:
+		return False
+
+	source = source_fingerprint(name)
+	if source is not None and meta.get('source') != source:
+		print('The raw data of dataset {} changed since its conversion ({} -> {})'.format(name, meta.get('source'), source))
+		return False
+
+	return True
+
+def write_dataset(name, images, labels, split_indices, num_classes, store_dir = STORE_DIR, source = None):
+	# images, labels 	: all examples of the dataset (images in NHWC layout with values in [0, 255]), written once
+	# split_indices 	: {split: indices of the examples of the split}, splits may share examples
+	# source 			: source_fingerprint of the raw data
+	# the files are written into a temporary folder that is renamed at the end, concurrent
+	# runs therefore either see a complete store or none at all
+
+	if not os.path.exists(store_dir):
+		try:
+			os.makedirs(store_dir)
+		except OSError:
+			pass
+
+	tmp_dir = tempfile.mkdtemp(prefix='.{}-'.format(name), dir=store_dir)
+
+	images = np.asarray(images)
+	if images.ndim == 3:
+		images = images[..., None]
+
+	# np.save writes non-contiguous views (e.g. transposed CIFAR batches) chunk-wise without a full copy
+	np.save(os.path.join(tmp_dir, 'images.npy'), images.astype(np.uint8, copy=False))
+	np.save(os.path.join(tmp_dir, 'labels.npy'), np.asarray(labels).astype(np.int8))
+
+	meta = {'version': STORE_VERSION, 'source': source, 'num_classes': num_classes, 'num_examples': int(images.shape[0]), 'image_shape': list(images.shape[1:]), 'splits': {}}
+
+	for split in SPLITS:
+		indices = np.asarray(split_indices[split], dtype=np.int64)
+		np.save(os.path.join(tmp_dir, '{}_indices.npy'.format(split)), indices)
+		meta['splits'][split] = {'num_examples': int(indices.shape[0])}
+
+	with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+		json.dump(meta, f, indent=1)
+
+	path = store_path(name, store_dir)
+	if os.path.isdir(path) and not is_stored(name, store_dir):
+		# store of an older layout or of older raw data (augmentation caches included)
+		shutil.rmtree(path, ignore_errors=True)
+
+	try:
+		os.rename(tmp_dir, path)
+	except OSError:
+		# another process finished the same conversion first
+		shutil.rmtree(tmp_dir, ignore_errors=True)
+
+	print('Stored dataset {} in {}'.format(name, path))
+
+def read_meta(name, store_dir = STORE_DIR):
+	with open(os.path.join(store_path(name, store_dir), 'meta.json'), 'r') as f:
+		return json.load(f)
+
+def load_base(name, store_dir = STORE_DIR):
+	# returns the memory-mapped (images, labels) of all examples, nothing is read before it is accessed
+	path = store_path(name, store_dir)
+	images = np.load(os.path.join(path, 'images.npy'), mmap_mode='r')
+	labels = np.load(os.path.join(path, 'labels.npy'), mmap_mode='r')
+	return images, labels
+
+def load_indices(name, split, store_dir = STORE_DIR):
+	return np.load(os.path.join(store_path(name, store_dir), '{}_indices.npy'.format(split)))
+
+
+## ######### ##
+# CONVERSION  #
+## ######### ##
+
+def ckplus_store_name(frames = 3, split = True):
+	# e.g. CKPLUS-f3 (subject split) or CKPLUS-f100-all (no split)
+	return 'CKPLUS-f{}{}'.format(frames, '' if split else '-all')
+
+def _convert_mnist():
+	from tensorflow.python.framework import dtypes
+	from tensorflow.examples.tutorials.mnist import input_data
+
+	mnist = input_data.read_data_sets("MNIST_data/", one_hot=False, dtype=dtypes.uint8, reshape=False)
+
+	images = np.concatenate([getattr(mnist, split).images for split in SPLITS])
+	labels = np.concatenate([getattr(mnist, split).labels for split in SPLITS])
+
+	split_indices = {}
+	start = 0
+	for split in SPLITS:
+		num_examples = getattr(mnist, split).num_examples
+		split_indices[split] = np.arange(start, start + num_examples)
+		start += num_examples
+
+	return (images, labels, split_indices), 10
+
+def _convert_cifar():
+	import scripts.load_cifar as load_cifar
+	return load_cifar.read_raw_data_sets(), load_cifar.NUM_CLASSES
+
+def _convert_ckplus(name):
+	import scripts.load_ckplus as load_ckplus
+
+	parts 	= name.split('-')
+	frames 	= int(parts[1][1:])
+	split 	= 'all' not in parts[2:]
+
+	return load_ckplus.read_raw_data_sets(split=split, frames=frames), load_ckplus.NUM_CLASSES
+
+def convert(name, store_dir = STORE_DIR):
+
+	print('Converting dataset {} into the dataset store'.format(name))
+
+	# taken before reading the raw data, data added during the conversion triggers the next one
+	source = source_fingerprint(name)
+
+	if name == 'MNIST':
+		raw, num_classes = _convert_mnist()
+	elif name == 'CIFAR10':
+		raw, num_classes = _convert_cifar()
+	elif name.startswith('CKPLUS-f'):
+		raw, num_classes = _convert_ckplus(name)
+	else:
+		raise ValueError('Unknown dataset {} (MNIST | CIFAR10 | CKPLUS-f<frames>[-all])'.format(name))
+
+	images, labels, split_indices = raw
+	write_dataset(name, images, labels, split_indices, num_classes, store_dir, source)
+
+
+## ##### ##
+# LOADING #
+## ##### ##
+
+def read_data_sets(name, one_hot = True, flatten = False, store_dir = STORE_DIR):
+	# returns Datasets(train, validation, test) backed by the memory-mapped store
+	# flatten: return images as (N, H*W*C) vectors (MNIST and CK+ placeholders)
+
+	if not is_stored(name, store_dir):
+		convert(name, store_dir)
+
+	num_classes = read_meta(name, store_dir)['num_classes']
+
+	# all splits are index arrays over the same memory maps
+	images, labels = load_base(name, store_dir)
+
+	splits = {}
+	for split in SPLITS:
+		splits[split] = DataSet(images, labels, num_classes, one_hot=one_hot, flatten=flatten, name=name, split=split, indices=load_indices(name, split, store_dir))
+
+	return Datasets(**splits)
+
+
+if __name__ == '__main__':
+
+	if len(sys.argv) < 2:
+		print('Usage: python -m scripts.dataset_store dataset [dataset ...]')
+		print('dataset : (MNIST | CIFAR10 | CKPLUS-f<frames> | CKPLUS-f<frames>-all)')
+		sys.exit(1)
+
+	for dataset_name in sys.argv[1:]:
+		if is_stored(dataset_name):
+			print('{} is already stored in {}'.format(dataset_name, store_path(dataset_name)))
+		else:
+			convert(dataset_name)
@@ -0,0 +1,176 @@
+# ------------------------------------------------------------------------------------------
+# dataset registry: datasets are resolved from specification strings
+#
+#	NAME[:key=value[,key=value ...]]
+#
+#	MNIST[:n=<train examples>,seed=<s>] 	28x28 digits from the dataset store
+#	CIFAR[:n=<train examples>,seed=<s>] 	32x32x3 CIFAR-10 images from the dataset store
+#	CIFAR10 								24x24x3 CIFAR-10 crops from the binary files (input queues in train_ae / train_cnn)
+#	CKPLUS[:frames=<f>,split=<0|1>] 		68x65 CK+ face patches from the dataset store
+#	SYNTHETIC:like=<MNIST|CIFAR|CIFAR10|CKPLUS>[,n=<train examples>,seed=<s>]
+#											generated data of the same shapes (offline benchmarks, see synthetic_data.py)
+#
+# e.g. MNIST:n=2500, CIFAR:n=7k,seed=3, CKPLUS:frames=3. Without seed, n selects the first n
+# training examples (as the former MNIST_1k / CIFAR_nk datasets), with a seed a random subset.
+# Subsets are index arrays into the memory-mapped store, only the used rows are ever read.
+# The former dataset names (MNIST_SMALL, MNIST_1k, MNIST_10k, CIFAR_nk) are still accepted.
+# ------------------------------------------------------------------------------------------
+
+import os, re
+import collections
+
+import numpy as np
+
+# data 		: Datasets(train, validation, test) or 'cifar_10' (signals train_ae / train_cnn to use the CIFAR-10 input queues)
+# data_dir 	: directory of the CIFAR-10 binary files for 'cifar_10' (None: default location)
+DatasetDescription = collections.namedtuple('DatasetDescription', ['data', 'input_size', 'num_classes', 'one_hot_labels', 'nhwd_shape', 'data_dir'])
+DatasetDescription.__new__.__defaults__ = (None,)
+
+# synthetic CIFAR-10 binary files (one folder per seed and size)
+SYNTHETIC_CIFAR10_DIR = os.path.join('cifar10_data', 'synthetic-{}-{}-batches-bin')
+
+LEGACY_NAMES = {
+	'MNIST_SMALL' 	: 'MNIST:n=1k',
+	'MNIST_1k' 		: 'MNIST:n=1k',
+	'MNIST_10k' 	: 'MNIST:n=10k',
+}
+
+
+def _parse_count(value):
+	# 2500 | 7k
+	if value.lower().endswith('k'):
+		return int(value[:-1]) * 1000
+	return int(value)
+
+def parse_spec(spec):
+	# returns (name, {key: value}) of a dataset specification string, former names are translated first
+
+	legacy = re.match(r'^CIFAR_(\d+)k$', spec)
+	if legacy is not None:
+		spec = 'CIFAR:n={}k'.format(legacy.group(1))
+	spec = LEGACY_NAMES.get(spec, spec)
+
+	name, _, options = spec.partition(':')
+
+	parsed = {}
+	for option in filter(None, options.split(',')):
+		key, separator, value = option.partition('=')
+		if not separator:
+			raise ValueError('Dataset option {} of {} is not of the form key=value'.format(option, spec))
+		parsed[key.strip()] = value.strip()
+
+	return name, parsed
+
+def dataset_family(spec):
+	# MNIST | CIFAR | CIFAR10 | CKPLUS: the dataset of spec, or the dataset a SYNTHETIC spec imitates
+	name, options = parse_spec(spec)
+	if name == 'SYNTHETIC':
+		return options.get('like')
+	return name
+
+def _train_subset(data, n, seed):
+	# training set restricted to n examples (first n or a seeded random subset), validation and test unchanged
+	import scripts.dataset_store as dataset_store
+
+	if n is None:
+		return data
+
+	n = _parse_count(n)
+	if n <= 0:
+		raise ValueError('Number of training examples must be positive, is: {}'.format(n))
+
+	if n > data.train.num_examples:
+		print('Only {} training images available, using all of them'.format(data.train.num_examples))
+		n = data.train.num_examples
+
+	if seed is None:
+		train = data.train.subset(n)
+	else:
+		indices = np.random.RandomState(int(seed)).choice(data.train.indices, n, replace=False)
+		train = data.train.select(np.sort(indices))
+
+	print('Using {} of {} training images'.format(n, data.train.num_examples))
+
+	return dataset_store.Datasets(train=train, validation=data.validation, test=data.test)
+
+def _load_mnist(n = None, seed = None):
+	import scripts.dataset_store as dataset_store
+
+	data = _train_subset(dataset_store.read_data_sets('MNIST', one_hot=True, flatten=True), n, seed)
+	return DatasetDescription(data, (28, 28), 10, True, False)
+
+def _load_cifar(n = None, seed = None):
+	import scripts.dataset_store as dataset_store
+
+	data = _train_subset(dataset_store.read_data_sets('CIFAR10', one_hot=True), n, seed)
+	return DatasetDescription(data, (32, 32, 3), 10, True, True)
+
+def _load_cifar10():
+	from scripts.from_github.cifar10 import maybe_download_and_extract
+
+	maybe_download_and_extract()
+	# this cifar-10 version does not use a one-hot encoding
+	return DatasetDescription('cifar_10', (24, 24, 3), 10, False, True)
+
+def _load_ckplus(frames = 3, split = 1):
+	import scripts.dataset_store as dataset_store
+
+	data = dataset_store.read_data_sets(dataset_store.ckplus_store_name(frames=int(frames), split=bool(int(split))), one_hot=True, flatten=True)
+	return DatasetDescription(data, (68, 65), data.train.num_classes, True, False)
+
+def _load_synthetic(like = None, n = None, seed = 0):
+	import scripts.synthetic_data as synthetic_data
+
+	num_train = None if n is None else _parse_count(n)
+	seed = int(seed)
+
+	if like == 'CIFAR10':
+		num_train = 50000 if num_train is None else num_train
+		data_dir = SYNTHETIC_CIFAR10_DIR.format(num_train, seed)
+		if not os.path.isdir(data_dir):
+			synthetic_data.write_cifar10_bin(data_dir, num_train=num_train, seed=seed)
+		return DatasetDescription('cifar_10', (24, 24, 3), 10, False, True, data_dir)
+
+	if like not in synthetic_data.SHAPES:
+		raise ValueError('SYNTHETIC needs like=MNIST | CIFAR | CIFAR10 | CKPLUS, is: {}'.format(like))
+
+	image_shape, num_classes, _ = synthetic_data.SHAPES[like]
+
+	# MNIST and CK+ are fed as flattened vectors
+	flatten = image_shape[2] == 1
+	data = synthetic_data.read_data_sets(like, num_train, seed, one_hot=True, flatten=flatten)
+
+	if flatten:
+		return DatasetDescription(data, image_shape[:2], num_classes, True, False)
+	return DatasetDescription(data, image_shape, num_classes, True, True)
+
+# name: (loader, accepted options)
+REGISTRY = collections.OrderedDict([
+	('MNIST', 	(_load_mnist, 	['n', 'seed'])),
+	('CIFAR', 	(_load_cifar, 	['n', 'seed'])),
+	('CIFAR10', (_load_cifar10, [])),
+	('CKPLUS', 	(_load_ckplus, 	['frames', 'split'])),
+	('SYNTHETIC', (_load_synthetic, ['like', 'n', 'seed'])),
+])
+
+
+def load_dataset(spec, **defaults):
+	# returns the DatasetDescription of spec
+	# defaults: option values used if spec does not set them (ignored by datasets that do not accept them),
+	#			e.g. load_dataset(DATASET, frames=100, split=0) for the CK+ autoencoder data
+
+	name, options = parse_spec(spec)
+
+	if name not in REGISTRY:
+		raise ValueError('Unknown dataset {} (available: {})'.format(spec, ' | '.join(REGISTRY.keys())))
+
+	loader, accepted = REGISTRY[name]
+
+	unknown = [key for key in options if key not in accepted]
+	if unknown:
+		raise ValueError('Dataset {} does not accept the option(s) {} (accepted: {})'.format(name, ', '.join(unknown), ', '.join(accepted) or 'none'))
+
+	kwargs = dict((key, value) for key, value in defaults.items() if key in accepted)
+	kwargs.update(options)
+
+	return loader(**kwargs)
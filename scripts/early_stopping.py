@@ -0,0 +1,65 @@
+# ------------------------------------------------------------------------------------------
+# early stopping and step size drops for train_ae / train_cnn, driven by the evaluation metric
+# of the check iterations (CNN: accuracy, mode 'max' / CAE: regularized reconstruction error, mode 'min')
+#
+#	early_stopping = EarlyStopping('max', patience=10, min_delta=0.001, plateau_patience=4)
+#	early_stopping.update(accuracy) 	-> 'improved' | 'plateau' | 'stop' | None
+#
+# a check improves the metric if it beats the best value so far by more than min_delta.
+# After plateau_patience checks without improvement the step size factor is multiplied by
+# step_size_drop (set_step_size_factor_op of the CAE / CNN), after patience checks without
+# improvement the training stops. Patience values of 0 disable the corresponding action.
+# The step size factor is not stored in the checkpoints, a resumed training starts with the full step size.
+# ------------------------------------------------------------------------------------------
+
+class EarlyStopping:
+
+	def __init__(self, mode, patience = 0, min_delta = 0, plateau_patience = 0, step_size_drop = 0.1):
+		# mode 				: 'max' | 'min', direction of an improvement of the metric
+		# patience 			: checks without improvement until the training stops
+		# plateau_patience 	: checks without improvement until the step size is dropped (again)
+
+		if mode not in ['max', 'min']:
+			raise ValueError('Unknown early stopping mode {} (max | min)'.format(mode))
+
+		self.mode 				= mode
+		self.patience 			= patience
+		self.min_delta 			= abs(min_delta)
+		self.plateau_patience 	= plateau_patience
+		self.step_size_drop 	= step_size_drop
+
+		self.best 				= None
+		self.step_size_factor 	= 1.0
+		self.stop 				= False
+
+		self._checks_without_improvement 	= 0
+		self._checks_since_drop 			= 0
+
+	def _improves(self, metric):
+		if self.best is None:
+			return True
+		if self.mode == 'max':
+			return metric > self.best + self.min_delta
+		return metric < self.best - self.min_delta
+
+	def update(self, metric):
+		# registers the metric of one check iteration, returns the resulting action
+		if self._improves(metric):
+			self.best = metric
+			self._checks_without_improvement 	= 0
+			self._checks_since_drop 			= 0
+			return 'improved'
+
+		self._checks_without_improvement 	+= 1
+		self._checks_since_drop 			+= 1
+
+		if self.patience > 0 and self._checks_without_improvement >= self.patience:
+			self.stop = True
+			return 'stop'
+
+		if self.plateau_patience > 0 and self._checks_since_drop >= self.plateau_patience:
+			self.step_size_factor *= self.step_size_drop
+			self._checks_since_drop = 0
+			return 'plateau'
+
+		return None
@@ -0,0 +1,112 @@
+# ------------------------------------------------------------------------------------------
+# fixed evaluation sets: the validation / test images are preprocessed once into arrays of
+# the placeholder shape and dtype, every evaluation is exactly one pass over them in fixed,
+# non-shuffled batches (no DataSet epoch state, no input queue, no reshaping per batch)
+# ------------------------------------------------------------------------------------------
+
+import numpy as np
+
+from scripts.cifar10_dataset import LABEL_BYTES, RECORD_BYTES, HEIGHT, WIDTH, DEPTH, train_filenames, test_filenames, _check_files
+from scripts.from_github.cifar10_input import IMAGE_SIZE
+
+
+class EvaluationSet:
+
+	def __init__(self, images, labels, batch_size):
+		# images, labels 	: arrays as fed to the placeholders
+		# batch_size 		: maximal number of images per evaluation batch (prevent memory overflow)
+
+		assert images.shape[0] == labels.shape[0], 'images.shape: {} labels.shape: {}'.format(images.shape, labels.shape)
+
+		self.images 	= images
+		self.labels 	= labels
+		self.batch_size = batch_size
+
+	@property
+	def num_examples(self):
+		return self.images.shape[0]
+
+	@property
+	def num_batches(self):
+		return (self.num_examples + self.batch_size - 1) // self.batch_size
+
+	@property
+	def last_batch_size(self):
+		return self.num_examples - (self.num_batches - 1) * self.batch_size
+
+	def batches(self):
+		# yields (images, labels) views of all batches in a fixed order
+		for start in range(0, self.num_examples, self.batch_size):
+			yield self.images[start:start + self.batch_size], self.labels[start:start + self.batch_size]
+
+	def summary_batch(self, max_images, accumulation_steps):
+		# (images, labels) of the first max_images examples cut to a multiple of accumulation_steps, since the
+		# gradient summaries split the batch into the micro batches of the training step
+		# sets smaller than accumulation_steps are repeated to accumulation_steps images (one per micro batch)
+		if self.num_examples == 0:
+			raise ValueError('The evaluation set is empty, no summary images')
+
+		num_images = min(max_images, self.num_examples)
+
+		if num_images < accumulation_steps:
+			indices = np.arange(accumulation_steps) % num_images
+			return self.images[indices], self.labels[indices]
+
+		num_images -= num_images % accumulation_steps
+		return self.images[:num_images], self.labels[:num_images]
+
+
+def _num_examples(num_examples, max_examples):
+	# num_examples <= 0 or None: all examples
+	if num_examples is None or num_examples <= 0:
+		return max_examples
+	return min(num_examples, max_examples)
+
+def from_data_set(dataset, image_shape, label_dtype, num_examples = None, batch_size = 1024):
+	# evaluation set on the first num_examples images of a DataSet
+	# image_shape : shape of a single image as expected by the input placeholder
+
+	n = _num_examples(num_examples, dataset.images.shape[0])
+
+	images = np.ascontiguousarray(np.reshape(dataset.images[:n], (n,) + tuple(image_shape)), dtype=np.float32)
+	labels = np.ascontiguousarray(dataset.labels[:n], dtype=label_dtype)
+
+	return EvaluationSet(images, labels, batch_size)
+
+def read_cifar10(eval_data, data_dir, num_examples = None):
+	# decodes the first num_examples records of the CIFAR-10 training (eval_data False) or test files with the
+	# preprocessing of cifar10_input.inputs: central [IMAGE_SIZE, IMAGE_SIZE] crop, rescaled to [0, 1]
+
+	filenames = test_filenames(data_dir) if eval_data else train_filenames(data_dir)
+	_check_files(filenames)
+
+	records = []
+	num_records = 0
+
+	for f in filenames:
+		if num_examples is not None and 0 < num_examples <= num_records:
+			break
+		records.append(np.fromfile(f, dtype=np.uint8).reshape(-1, RECORD_BYTES))
+		num_records += records[-1].shape[0]
+
+	records = np.concatenate(records)
+	records = records[:_num_examples(num_examples, records.shape[0])]
+
+	return decode_records(records)
+
+def decode_records(records):
+	# (N, RECORD_BYTES) uint8 records -> float32 images [N, IMAGE_SIZE, IMAGE_SIZE, 3] in [0, 1] and int64 labels
+	labels = records[:, 0].astype(np.int64)
+
+	images = records[:, LABEL_BYTES:].reshape(-1, DEPTH, HEIGHT, WIDTH).transpose(0, 2, 3, 1)
+
+	offset_y = (HEIGHT - IMAGE_SIZE) // 2
+	offset_x = (WIDTH - IMAGE_SIZE) // 2
+	images = np.ascontiguousarray(images[:, offset_y:offset_y + IMAGE_SIZE, offset_x:offset_x + IMAGE_SIZE, :], dtype=np.float32)
+	images *= 1. / 255
+
+	return images, labels
+
+def cifar10_evaluation_set(eval_data, data_dir, label_dtype = np.int64, num_examples = None, batch_size = 1024):
+	images, labels = read_cifar10(eval_data, data_dir, num_examples)
+	return EvaluationSet(images, labels.astype(label_dtype), batch_size)
@@ -34,6 +34,15 @@ NUM_CLASSES = 10
 NUM_EXAMPLES_PER_EPOCH_FOR_TRAIN = 50000
 NUM_EXAMPLES_PER_EPOCH_FOR_EVAL = 10000
 
+# Defaults of the input queue (see distorted_inputs), the calibration script
+# scripts/calibrate_cifar_input.py finds good values for the current host.
+NUM_READERS = 1
+NUM_PREPROCESS_THREADS = 16
+CAPACITY_BATCHES = 3
+
+# Graph collection with the fill level (fraction) of every example queue.
+QUEUE_FILL_COLLECTION = 'cifar10_input_queue_fill'
+
 
 def read_cifar10(filename_queue):
   """Reads and parses examples from CIFAR10 data files.
@@ -99,37 +108,60 @@ def read_cifar10(filename_queue):
 
 
 def _generate_image_and_label_batch(image, label, min_queue_examples,
-                                    batch_size, shuffle):
+                                    batch_size, shuffle,
+                                    num_preprocess_threads=None,
+                                    capacity_batches=None):
   """Construct a queued batch of images and labels.
 
   Args:
-    image: 3-D Tensor of [height, width, 3] of type.float32.
-    label: 1-D Tensor of type.int32
+    image: 3-D Tensor of [height, width, 3] of type.float32, or a list of
+      such Tensors (one per reader).
+    label: 1-D Tensor of type.int32, or a list of such Tensors.
     min_queue_examples: int32, minimum number of samples to retain
       in the queue that provides of batches of examples.
     batch_size: Number of images per batch.
     shuffle: boolean indicating whether to use a shuffling queue.
+    num_preprocess_threads: Number of enqueuing threads
+      (default: NUM_PREPROCESS_THREADS).
+    capacity_batches: Queue capacity in batches on top of min_queue_examples
+      (default: CAPACITY_BATCHES).
 
   Returns:
     images: Images. 4D tensor of [batch_size, height, width, 3] size.
     labels: Labels. 1D tensor of [batch_size] size.
   """
+  if num_preprocess_threads is None:
+    num_preprocess_threads = NUM_PREPROCESS_THREADS
+  if capacity_batches is None:
+    capacity_batches = CAPACITY_BATCHES
+
+  if not isinstance(image, (list, tuple)):
+    image, label = [image], [label]
+
+  capacity = min_queue_examples + capacity_batches * batch_size
+
   # Create a queue that shuffles the examples, and then
   # read 'batch_size' images + labels from the example queue.
-  num_preprocess_threads = 16
+  # The threads are spread over the readers (one reader: all threads share it).
+  dtypes = [image[0].dtype, label[0].dtype]
+  shapes = [image[0].get_shape(), label[0].get_shape()]
   if shuffle:
-    images, label_batch = tf.train.shuffle_batch(
-        [image, label],
-        batch_size=batch_size,
-        num_threads=num_preprocess_threads,
-        capacity=min_queue_examples + 3 * batch_size,
-        min_after_dequeue=min_queue_examples)
+    queue = tf.RandomShuffleQueue(capacity=capacity,
+                                  min_after_dequeue=min_queue_examples,
+                                  dtypes=dtypes, shapes=shapes)
   else:
-    images, label_batch = tf.train.batch(
-        [image, label],
-        batch_size=batch_size,
-        num_threads=num_preprocess_threads,
-        capacity=min_queue_examples + 3 * batch_size)
+    queue = tf.FIFOQueue(capacity=capacity, dtypes=dtypes, shapes=shapes)
+
+  num_threads = max(num_preprocess_threads, len(image))
+  enqueue_ops = [queue.enqueue([image[i % len(image)], label[i % len(image)]])
+                 for i in xrange(num_threads)]
+  tf.train.add_queue_runner(tf.train.QueueRunner(queue, enqueue_ops))
+
+  images, label_batch = queue.dequeue_many(batch_size)
+
+  # Fill level of the example queue (1.0: full), collected for monitoring.
+  fill_fraction = tf.cast(queue.size(), tf.float32) / capacity
+  tf.add_to_collection(QUEUE_FILL_COLLECTION, fill_fraction)
 
   # Display the training images in the visualizer.
   tf.summary.image('images', images)
@@ -137,12 +169,21 @@ def _generate_image_and_label_batch(image, label, min_queue_examples,
   return images, tf.reshape(label_batch, [batch_size])
 
 
-def distorted_inputs(data_dir, batch_size):
+def distorted_inputs(data_dir, batch_size, num_readers=None,
+                     num_preprocess_threads=None, capacity_batches=None,
+                     min_fraction_of_examples_in_queue=0.4):
   """Construct distorted input for CIFAR training using the Reader ops.
 
   Args:
     data_dir: Path to the CIFAR-10 data directory.
     batch_size: Number of images per batch.
+    num_readers: Number of independent readers (default: NUM_READERS).
+    num_preprocess_threads: Number of enqueuing threads
+      (default: NUM_PREPROCESS_THREADS).
+    capacity_batches: Queue capacity in batches on top of the examples kept
+      for shuffling (default: CAPACITY_BATCHES).
+    min_fraction_of_examples_in_queue: Fraction of the training set kept in
+      the queue for shuffling.
 
   Returns:
     images: Images. 4D tensor of [batch_size, IMAGE_SIZE, IMAGE_SIZE, 3] size.
@@ -154,52 +195,64 @@ def distorted_inputs(data_dir, batch_size):
     if not tf.gfile.Exists(f):
       raise ValueError('Failed to find file: ' + f)
 
+  if num_readers is None:
+    num_readers = NUM_READERS
+
   # Create a queue that produces the filenames to read.
   filename_queue = tf.train.string_input_producer(filenames)
 
-  # Read examples from files in the filename queue.
-  read_input = read_cifar10(filename_queue)
-  reshaped_image = tf.cast(read_input.uint8image, tf.float32)
-
   height = IMAGE_SIZE
   width = IMAGE_SIZE
 
-  # Image processing for training the network. Note the many random
-  # distortions applied to the image.
+  images = []
+  labels = []
 
-  # Randomly crop a [height, width] section of the image.
-  distorted_image = tf.random_crop(reshaped_image, [height, width, 3])
+  # Read examples from files in the filename queue (N-way read parallelism,
+  # see read_cifar10).
+  for _ in xrange(num_readers):
+    read_input = read_cifar10(filename_queue)
+    reshaped_image = tf.cast(read_input.uint8image, tf.float32)
 
-  # Randomly flip the image horizontally.
-  distorted_image = tf.image.random_flip_left_right(distorted_image)
+    # Image processing for training the network. Note the many random
+    # distortions applied to the image.
 
-  # Because these operations are not commutative, consider randomizing
-  # the order their operation.
-  # NOTE: since per_image_standardization zeros the mean and makes
-  # the stddev unit, this likely has no effect see tensorflow#1458.
-  distorted_image = tf.image.random_brightness(distorted_image,
-                                               max_delta=63)
-  distorted_image = tf.image.random_contrast(distorted_image,
-                                             lower=0.2, upper=1.8)
+    # Randomly crop a [height, width] section of the image.
+    distorted_image = tf.random_crop(reshaped_image, [height, width, 3])
 
-  # Subtract off the mean and divide by the variance of the pixels.
-  float_image = distorted_image / 255. # tf.image.per_image_standardization(distorted_image)
+    # Randomly flip the image horizontally.
+    distorted_image = tf.image.random_flip_left_right(distorted_image)
 
-  # Set the shapes of tensors.
-  float_image.set_shape([height, width, 3])
-  read_input.label.set_shape([1])
+    # Because these operations are not commutative, consider randomizing
+    # the order their operation.
+    # NOTE: since per_image_standardization zeros the mean and makes
+    # the stddev unit, this likely has no effect see tensorflow#1458.
+    distorted_image = tf.image.random_brightness(distorted_image,
+                                                 max_delta=63)
+    distorted_image = tf.image.random_contrast(distorted_image,
+                                               lower=0.2, upper=1.8)
+
+    # Subtract off the mean and divide by the variance of the pixels.
+    float_image = distorted_image / 255. # tf.image.per_image_standardization(distorted_image)
+
+    # Set the shapes of tensors.
+    float_image.set_shape([height, width, 3])
+    read_input.label.set_shape([1])
+
+    images.append(float_image)
+    labels.append(read_input.label)
 
   # Ensure that the random shuffling has good mixing properties.
-  min_fraction_of_examples_in_queue = 0.4
   min_queue_examples = int(NUM_EXAMPLES_PER_EPOCH_FOR_TRAIN *
                            min_fraction_of_examples_in_queue)
   print ('Filling queue with %d CIFAR images before starting to train. '
          'This will take a few minutes.' % min_queue_examples)
 
   # Generate a batch of images and labels by building up a queue of examples.
-  return _generate_image_and_label_batch(float_image, read_input.label,
+  return _generate_image_and_label_batch(images, labels,
                                          min_queue_examples, batch_size,
-                                         shuffle=True)
+                                         shuffle=True,
+                                         num_preprocess_threads=num_preprocess_threads,
+                                         capacity_batches=capacity_batches)
 
 
 def inputs(eval_data, data_dir, batch_size):
@@ -0,0 +1,34 @@
+# ------------------------------------------------------------------------------------------
+# op leak diagnostic for train_ae / train_cnn: the number of operations in the graph is written
+# to tensorboard (graph/num_ops) at every check iteration. The graph is complete before the
+# training loop starts, every op added between two checks is reported as a leak (e.g. a model
+# property or a tf.Variable that creates new nodes on every call)
+#
+# finalizing the graph (finalize_graph of the trainers) turns such leaks into errors
+# ------------------------------------------------------------------------------------------
+
+import tensorflow as tf
+
+class GraphMonitor:
+
+	def __init__(self, writer, graph):
+		self.writer = writer
+		self.graph 	= graph
+
+		self._num_ops = None
+
+	def write_summary(self, step):
+		# writes the current number of operations, returns the number of operations added since the previous call
+		num_ops = len(self.graph.get_operations())
+
+		summary = tf.Summary()
+		summary.value.add(tag='graph/num_ops', simple_value=num_ops)
+		self.writer.add_summary(summary, step)
+
+		added_ops = 0 if self._num_ops is None else num_ops - self._num_ops
+		self._num_ops = num_ops
+
+		if added_ops > 0:
+			print('WARNING: {} operations were added to the graph since the last check ({} in total)'.format(added_ops, num_ops))
+
+		return added_ops
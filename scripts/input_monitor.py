@@ -0,0 +1,44 @@
+# ------------------------------------------------------------------------------------------
+# input pipeline instrumentation for train_ae / train_cnn: the time the training loop waits
+# for its next batch and the fill level of the cifar10_input example queues are written to
+# tensorboard (input/dequeue_wait_ms, input/queue_fill_fraction) at every check iteration
+# ------------------------------------------------------------------------------------------
+
+import tensorflow as tf
+
+from scripts.from_github.cifar10_input import QUEUE_FILL_COLLECTION
+
+class InputMonitor:
+
+	def __init__(self, writer):
+		# needs to be created after the input pipeline (collects the queue fill nodes of the graph)
+		self.writer = writer
+
+		self._fill_nodes 	= tf.get_collection(QUEUE_FILL_COLLECTION)
+		self._wait_time 	= 0.
+		self._num_batches 	= 0
+
+	def add_wait(self, seconds):
+		# time spent fetching one training batch
+		self._wait_time 	+= seconds
+		self._num_batches 	+= 1
+
+	def write_summary(self, sess, step):
+		# writes the average wait since the last call and the current queue fill levels, returns the average wait in ms
+		summary = tf.Summary()
+
+		average_wait_ms = 1000. * self._wait_time / max(self._num_batches, 1)
+		if self._num_batches > 0:
+			summary.value.add(tag='input/dequeue_wait_ms', simple_value=average_wait_ms)
+
+		if self._fill_nodes:
+			for queue_indx, fill_fraction in enumerate(sess.run(self._fill_nodes)):
+				tag = 'input/queue_fill_fraction' if queue_indx == 0 else 'input/queue_fill_fraction_{}'.format(queue_indx)
+				summary.value.add(tag=tag, simple_value=float(fill_fraction))
+
+		self.writer.add_summary(summary, step)
+
+		self._wait_time 	= 0.
+		self._num_batches 	= 0
+
+		return average_wait_ms
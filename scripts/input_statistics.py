@@ -0,0 +1,155 @@
+# ------------------------------------------------------------------------------------------
+# input normalization: per-channel mean / std and optionally a ZCA whitening matrix of the
+# training images, computed in one streaming pass (chunk-wise sums and an incremental
+# covariance), cached on disk per dataset specification and applied in the graph as
+# constants on top of the [0, 1] input images
+#
+#	standardize : x <- (x - mean_c) / std_c
+#	zca 		: standardized x, decorrelated with W = U diag(1 / sqrt(S + ZCA_EPSILON)) U^T
+#				  of the covariance U S U^T of the standardized training images
+#
+# the ZCA matrix has (H*W*C)^2 entries (37.7 MB for CIFAR) and is embedded in the graph
+# ------------------------------------------------------------------------------------------
+
+import os, re, tempfile
+
+import numpy as np
+
+STATISTICS_DIR 	= os.path.join('datasets', 'statistics')
+MODES 			= ['none', 'standardize', 'zca']
+
+# images per chunk of the streaming pass and regularization of the whitening
+CHUNK_SIZE 		= 1000
+ZCA_EPSILON 	= 1e-2
+
+
+def statistics_path(spec, mode, store_dir = STATISTICS_DIR):
+	# one file per dataset specification (e.g. CIFAR_n_7k_seed_3-zca.npz)
+	return os.path.join(store_dir, '{}-{}.npz'.format(re.sub(r'[^A-Za-z0-9]+', '_', spec), mode))
+
+def _data_set_chunks(train_set, image_shape):
+	# [0, 1] float chunks of a DataSet (only one chunk is in memory at a time)
+	for start in range(0, train_set.num_examples, CHUNK_SIZE):
+		yield np.reshape(train_set.images[start:start + CHUNK_SIZE], (-1,) + tuple(image_shape))
+
+def _cifar10_chunks(data_dir):
+	# centrally cropped [0, 1] training images of the CIFAR-10 binary files, one file at a time
+	from scripts.cifar10_dataset import RECORD_BYTES, train_filenames, _check_files
+	from scripts.evaluation_set import decode_records
+
+	filenames = train_filenames(data_dir)
+	_check_files(filenames)
+
+	for f in filenames:
+		yield decode_records(np.fromfile(f, dtype=np.uint8).reshape(-1, RECORD_BYTES))[0]
+
+def compute_statistics(chunks, zca = False):
+	# chunks: iterable of float image batches (N, H, W, C), returns {'mean', 'std'[, 'zca_mean', 'zca_matrix']}
+
+	num_images 		= 0
+	channel_sum 	= 0.
+	channel_sq_sum 	= 0.
+	pixel_sum 		= 0.
+	pixel_outer_sum = 0.
+
+	for images in chunks:
+		images = np.asarray(images, dtype=np.float64)
+		image_shape = images.shape[1:]
+
+		num_images 		+= images.shape[0]
+		channel_sum 	+= images.sum(axis=(0, 1, 2))
+		channel_sq_sum 	+= np.square(images).sum(axis=(0, 1, 2))
+
+		if zca:
+			# incremental (uncentered) covariance of the flattened images
+			flat = images.reshape(images.shape[0], -1)
+			pixel_sum 		+= flat.sum(axis=0)
+			pixel_outer_sum += flat.T.dot(flat)
+
+	num_pixels = num_images * image_shape[0] * image_shape[1]
+
+	mean 	= channel_sum / num_pixels
+	std 	= np.sqrt(np.maximum(channel_sq_sum / num_pixels - np.square(mean), 1e-12))
+
+	statistics = {'mean': mean.astype(np.float32), 'std': std.astype(np.float32)}
+
+	if zca:
+		# covariance of the standardized images (channels are the fastest changing dimension)
+		pixel_mean 	= pixel_sum / num_images
+		pixel_scale = np.tile(1. / std, image_shape[0] * image_shape[1])
+
+		covariance = pixel_outer_sum / num_images - np.outer(pixel_mean, pixel_mean)
+		covariance *= np.outer(pixel_scale, pixel_scale)
+
+		eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+		zca_matrix = (eigenvectors / np.sqrt(np.maximum(eigenvalues, 0.) + ZCA_EPSILON)).dot(eigenvectors.T)
+
+		statistics['zca_mean'] 		= ((pixel_mean - np.tile(mean, image_shape[0] * image_shape[1])) * pixel_scale).astype(np.float32)
+		statistics['zca_matrix'] 	= zca_matrix.astype(np.float32)
+
+	return statistics
+
+def _save_atomic(path, statistics):
+	directory = os.path.dirname(path)
+	if not os.path.exists(directory):
+		try:
+			os.makedirs(directory)
+		except OSError:
+			pass
+
+	fd, tmp_path = tempfile.mkstemp(suffix='.npz', dir=directory)
+	with os.fdopen(fd, 'wb') as f:
+		np.savez(f, **statistics)
+	os.rename(tmp_path, path)
+
+def load_statistics(spec, mode, data, input_size, data_dir = None, store_dir = STATISTICS_DIR):
+	# returns the cached statistics of the training images of spec, computes and caches them if necessary
+	# data: Datasets or 'cifar_10' (binary files in data_dir, default: train_cnn.CIFAR_LOCATION)
+
+	if mode not in MODES[1:]:
+		raise ValueError('Unknown input normalization {} ({})'.format(mode, ' | '.join(MODES)))
+
+	path = statistics_path(spec, mode, store_dir)
+
+	if os.path.isfile(path):
+		with np.load(path) as cached:
+			return dict((key, cached[key]) for key in cached.files)
+
+	print('Computing the {} statistics of {} (cached in {})'.format(mode, spec, path))
+
+	image_shape = tuple(input_size) if len(input_size) == 3 else tuple(input_size) + (1,)
+
+	if data == 'cifar_10':
+		if data_dir is None:
+			from scripts.train_cnn import CIFAR_LOCATION
+			data_dir = CIFAR_LOCATION
+		chunks = _cifar10_chunks(data_dir)
+	else:
+		chunks = _data_set_chunks(data.train, image_shape)
+
+	statistics = compute_statistics(chunks, zca=(mode == 'zca'))
+	_save_atomic(path, statistics)
+
+	return statistics
+
+def constants(statistics, name = 'input_statistics'):
+	# the statistics as graph constants, to share them between several normalize calls (e.g. inside a training loop)
+	import tensorflow as tf
+
+	with tf.name_scope(name):
+		return dict((key, tf.constant(value, name=key)) for key, value in statistics.items())
+
+def normalize(x_image, statistics, name = 'input_normalization'):
+	# applies the statistics (arrays or the nodes of constants) to the NHWC input node, all statistics are graph constants
+	import tensorflow as tf
+
+	with tf.name_scope(name):
+		normalized = (x_image - tf.convert_to_tensor(statistics['mean'], name='mean')) / tf.convert_to_tensor(statistics['std'], name='std')
+
+		if 'zca_matrix' in statistics:
+			image_shape = x_image.get_shape().as_list()[1:]
+			flat = tf.reshape(normalized, [-1, int(np.prod(image_shape))])
+			flat = tf.matmul(flat - tf.convert_to_tensor(statistics['zca_mean'], name='zca_mean'), tf.convert_to_tensor(statistics['zca_matrix'], name='zca_matrix'))
+			normalized = tf.reshape(flat, [-1] + image_shape)
+
+	return normalized
@@ -1,11 +1,9 @@
 import numpy as np
 import os.path
-from sklearn.model_selection import train_test_split
 import tarfile
 import urllib
 
-from tensorflow.contrib.learn.python.learn.datasets.base import Datasets
-from tensorflow.contrib.learn.python.learn.datasets.mnist import DataSet, dense_to_one_hot
+from scripts.dataset_store import Datasets, DataSet, SPLITS
 
 
 NUM_CLASSES = 10
@@ -14,7 +12,9 @@ cifar_dir = "datasets/cifar-10-batches-py/"
 batches = ["data_batch_1", "data_batch_2", "data_batch_3", "data_batch_4", "data_batch_5"]
 
 
-def read_data_sets(validation_size = 5000, one_hot=True):
+def read_raw_data_sets(validation_size = 5000):
+    # returns (images, labels, {split: indices}): uint8 NHWC images and integer labels of the 50000 training
+    # and 10000 test images in one buffer (no scaling, no one-hot), the splits are index arrays into it
     cifar_filename = "datasets/" + "cifar-10-python.tar.gz"
 
     try:
@@ -31,37 +31,41 @@ def read_data_sets(validation_size = 5000, one_hot=True):
         tar.close()
         os.remove(cifar_filename)
 
-    # Process batches
+    # Process batches (training batches followed by the test batch, stacked once)
     all_batch_images = []
     all_batch_labels = []
-    for batch_name in batches:
+    for batch_name in batches + ["test_batch"]:
         batch = np.load(cifar_dir + batch_name)
         batch_images = batch['data']
         all_batch_images.append(batch_images)
         batch_labels = batch['labels']
         all_batch_labels.extend(batch_labels)
 
+    # NHWC view on the stacked batches (no copy)
     all_batch_images = np.vstack(all_batch_images).reshape(-1, 3, 32, 32)
     all_batch_images = all_batch_images.transpose([0, 2, 3, 1])
-    all_batch_labels = np.array(all_batch_labels)
+    all_batch_labels = np.array(all_batch_labels, dtype=np.int8)
 
-    train_images, validation_images, train_labels, validation_labels = train_test_split(all_batch_images, all_batch_labels, test_size = validation_size, random_state=0)
+    num_train = len(batches) * 10000
 
+    # random validation split of the training images, same split and order as the former
+    # train_test_split(random_state=0): CIFAR_<n>k takes the first n examples of this order.
+    # The indices stay unsorted, next_batch sorts the indices of every batch for the reads
+    perm = np.random.RandomState(0).permutation(num_train)
 
-    test_batch = np.load(cifar_dir + "test_batch")
-    test_images = test_batch['data'].reshape(-1, 3, 32, 32)
-    test_images = test_images.transpose([0, 2, 3, 1])
+    split_indices = {'train': perm[validation_size:],
+                     'validation': perm[:validation_size],
+                     'test': np.arange(num_train, all_batch_images.shape[0])}
 
-    test_labels = np.array(test_batch['labels'])
+    return all_batch_images, all_batch_labels, split_indices
 
 
-    if one_hot:
-        train_labels = dense_to_one_hot(train_labels, NUM_CLASSES)
-        validation_labels = dense_to_one_hot(validation_labels, NUM_CLASSES)
-        test_labels = dense_to_one_hot(test_labels, NUM_CLASSES)
+def read_data_sets(validation_size = 5000, one_hot=True):
+    # all splits share the uint8 buffer, images are scaled and labels expanded per batch
+    images, labels, split_indices = read_raw_data_sets(validation_size)
 
-    train = DataSet(train_images, train_labels, reshape=False)
-    validation = DataSet(validation_images, validation_labels, reshape=False)
-    test = DataSet(test_images, test_labels, reshape=False)
+    datasets = {}
+    for split in SPLITS:
+        datasets[split] = DataSet(images, labels, NUM_CLASSES, one_hot=one_hot, indices=split_indices[split])
 
-    return Datasets(train=train, validation=validation, test=test)
+    return Datasets(**datasets)
@@ -1,16 +1,18 @@
 import os
+import json
+import contextlib
+import multiprocessing
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 import numpy as np
-import pandas as pd
 from PIL import Image
 import random
 
-import scipy.misc
-from sklearn.model_selection import train_test_split
-
-from tensorflow.contrib.learn.python.learn.datasets.base import Datasets
-from tensorflow.contrib.learn.python.learn.datasets.mnist import DataSet, dense_to_one_hot
-import traceback
+from scripts.dataset_store import Datasets, DataSet, SPLITS
 
 PATCH_SIZE = (325, 340)
 INPUT_SIZE = (65,68)
@@ -19,6 +21,16 @@ NUM_CLASSES = 7
 
 dataset_path = "datasets/cohn-kanade-images"
 emotions_path = "datasets/Emotion"
+landmarks_path = "datasets/Landmarks"
+
+# preprocessed landmarks and face patches (built once, shared by all runs)
+cache_path = "datasets/ckplus_cache"
+landmark_cache_file = os.path.join(cache_path, "landmarks.npz")
+patch_cache_file = os.path.join(cache_path, "patches.npy")
+manifest_file = os.path.join(cache_path, "manifest.json")
+
+# number of worker processes used for parsing and cropping (None: one per cpu)
+NUM_PROCESSES = None
 
 landmarks = {}
 
@@ -41,156 +53,351 @@ def identify_patch(landmarks):
 
     return (left, top, right, bottom)
 
+def _sequence_files(root):
+    # yields (subject, sequence, filename) for all files in root/subject/sequence/
+    for subject in sorted(os.listdir(root)):
+        if os.path.isdir(os.path.join(root, subject)):
+            for sequence in sorted(os.listdir(os.path.join(root, subject))):
+                if os.path.isdir(os.path.join(root, subject, sequence)):
+                    for filename in sorted(os.listdir(os.path.join(root, subject, sequence))):
+                        yield subject, sequence, filename
+
+def _save_atomic(path, save_fn):
+    # write to a temporary file first so that concurrent runs never read half written caches
+    if not os.path.exists(cache_path):
+        try:
+            os.makedirs(cache_path)
+        except OSError:
+            pass
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        save_fn(f)
+    os.rename(tmp_path, path)
+
+def _map_parallel(function, jobs, chunksize):
+    pool = multiprocessing.Pool(NUM_PROCESSES)
+    try:
+        return pool.map(function, jobs, chunksize=chunksize)
+    finally:
+        pool.close()
+        pool.join()
+
+def _parse_landmark_file(path):
+    return np.genfromtxt(path, dtype=np.float32).reshape(-1, 2)
+
+def build_landmark_cache():
+    # parses all landmark text files once (in parallel) into a single packed array file:
+    # keys[i] owns the points[offsets[i]:offsets[i+1]]
+    print("Building landmark cache")
+    keys = []
+    files = []
+    for subject, sequence, filename in _sequence_files(landmarks_path):
+        keys.append(normalize_filename(os.path.join(subject, sequence, filename)))
+        files.append(os.path.join(landmarks_path, subject, sequence, filename))
+
+    points = _map_parallel(_parse_landmark_file, files, chunksize=64)
+
+    offsets = np.zeros(len(points) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(p) for p in points])
+    packed = np.concatenate(points) if points else np.zeros((0, 2), dtype=np.float32)
+
+    _save_atomic(landmark_cache_file, lambda f: np.savez(f, keys=np.array(keys), offsets=offsets, points=packed))
+    print("{} landmark files cached in {}".format(len(keys), landmark_cache_file))
+
 def load_landmarks():
     print("Loading landmarks")
-    dataset_path = "datasets/Landmarks"
-    x_dists = []
-    y_dists = []
-    all_landmarks = {}
-    for subject in os.listdir(dataset_path):
-        if os.path.isdir(os.path.join(dataset_path, subject)):
-            for sequence in os.listdir(os.path.join(dataset_path, subject)):
-                if os.path.isdir(os.path.join(dataset_path, subject, sequence)):
-                    for landmarks in os.listdir(os.path.join(dataset_path, subject, sequence)):
-                        l_data = np.genfromtxt(os.path.join(dataset_path, subject, sequence, landmarks))
-                        all_landmarks[normalize_filename(os.path.join(subject, sequence, landmarks))] = l_data
-                        try:
-                            x_dists.append(np.max(l_data[:,0]) - np.min(l_data[:,0]))
-                            y_dists.append(np.max(l_data[:,1]) - np.min(l_data[:,1]))
-                        except:
-                            print(traceback.format_exc())
-    return all_landmarks
-
-def create_image_thumbnail(img_path):
-    global landmarks
-    image_path = normalize_filename(img_path)
-    thumb_size = INPUT_SIZE
-    thumb_path = '.'.join(img_path.split('.')[:-1]) + '_patch_' + str(thumb_size[0]) + str(thumb_size[1]) + '.png'
-    thumb_path = os.path.join(dataset_path, thumb_path)
-
+    if not os.path.isfile(landmark_cache_file):
+        build_landmark_cache()
 
-    if not os.path.isfile(thumb_path):
-        if not landmarks:
-            # Load landmarks
-            landmarks = load_landmarks()
+    cache = np.load(landmark_cache_file)
+    keys, offsets, points = cache['keys'], cache['offsets'], cache['points']
 
-        image = Image.open(os.path.join(dataset_path, image_path) + '.png')
-        image = image.crop(identify_patch(landmarks[image_path]))
-        image = image.resize(thumb_size, Image.ANTIALIAS)
+    return dict((str(key), points[offsets[i]:offsets[i+1]]) for i, key in enumerate(keys))
 
-        if not image.size == INPUT_SIZE:
-            print("Image ratio not matching")
-            raise Exception("Image ratio not matching")
-        image.save(thumb_path)
+def _create_patch(job):
+    # crop the face patch around the landmarks and scale it to the network input size
+    image_file, box = job
+    image = Image.open(image_file)
+    image = image.crop(box)
+    image = image.resize(INPUT_SIZE, Image.ANTIALIAS).convert('L')
 
-    return thumb_path
+    if not image.size == INPUT_SIZE:
+        print("Image ratio not matching")
+        raise Exception("Image ratio not matching")
 
+    return np.asarray(image, dtype=np.uint8)
 
-def read_from_folders(folders, frames):
-    # Load Emotions / Labels
+def create_patches(frame_names):
+    # crops and resizes the given frames (subject/sequence/frame, without extension) in parallel,
+    # returns one contiguous uint8 array of shape (N, 68, 65)
+    global landmarks
+    if not landmarks:
+        landmarks = load_landmarks()
+
+    jobs = [(os.path.join(dataset_path, name) + '.png', identify_patch(landmarks[name])) for name in frame_names]
+
+    patches = np.empty((len(jobs), INPUT_SIZE[1], INPUT_SIZE[0]), dtype=np.uint8)
+    for i, patch in enumerate(_map_parallel(_create_patch, jobs, chunksize=32)):
+        patches[i] = patch
+
+    return patches
+
+@contextlib.contextmanager
+def _cache_lock():
+    # serializes manifest / patch cache updates of concurrent runs
+    if not os.path.exists(cache_path):
+        try:
+            os.makedirs(cache_path)
+        except OSError:
+            pass
+    with open(os.path.join(cache_path, '.lock'), 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def frame_name(subject, sequence, frame):
+    # e.g. S005/001/S005_001_00000011 (the key used for landmarks and images)
+    return os.path.join(subject, sequence, '{}_{}_{}'.format(subject, sequence, str(frame).rjust(8, '0')))
+
+def _subject_peaks(subject):
+    # {sequence: (peak_frame, label)} of every labelled sequence of a subject
+    peaks = {}
+    if os.path.isdir(os.path.join(emotions_path, subject)):
+        for sequence in os.listdir(os.path.join(emotions_path, subject)):
+            sequence_path = os.path.join(emotions_path, subject, sequence)
+            if os.path.isdir(sequence_path) and len(os.listdir(sequence_path)) > 0:
+                emo_file = os.listdir(sequence_path)[0]
+                peak_frame = int(emo_file.split('.')[0].split('_')[-2])
+
+                with open(os.path.join(sequence_path, emo_file), 'r') as f:
+                    emotion = int(float(f.read()))
+                peaks[sequence] = (peak_frame, emotion - 1)
+
+    return peaks
+
+def source_fingerprint():
+    # {'subjects': ..., 'labelled_sequences': ...} of the image and emotion folders (only the folders are listed),
+    # stored with the CK+ datasets of the dataset store: a store of other counts is converted again. None if the
+    # CK+ folders are not there (a store copied without the raw data stays in use)
+    if not os.path.isdir(dataset_path) or not os.path.isdir(emotions_path):
+        return None
+
+    subjects = [subject for subject in os.listdir(dataset_path) if os.path.isdir(os.path.join(dataset_path, subject))]
+
+    labelled_sequences = 0
+    for subject in os.listdir(emotions_path):
+        subject_path = os.path.join(emotions_path, subject)
+        if os.path.isdir(subject_path):
+            for sequence in os.listdir(subject_path):
+                sequence_path = os.path.join(subject_path, sequence)
+                if os.path.isdir(sequence_path) and len(os.listdir(sequence_path)) > 0:
+                    labelled_sequences += 1
+
+    return {'subjects': len(subjects), 'labelled_sequences': labelled_sequences}
+
+def _indexed_peaks(rows):
+    # {sequence: (peak_frame, label)} of the manifest rows of a subject
+    return dict((row[0], (row[2], row[3])) for row in rows)
+
+def _index_subject(subject, peaks=None, rows=None):
+    # one pass over the image folders of a subject, returns the manifest rows [sequence, frame, peak_frame, label,
+    # patch_offset] of all frames up to the labelled peak frame. The patch offsets of the previous rows of the
+    # subject are kept (the patch of a frame does not depend on its label)
+    if peaks is None:
+        peaks = _subject_peaks(subject)
+
+    offsets = dict(((row[0], row[1]), row[4]) for row in rows or [])
+
+    rows = []
+    subject_path = os.path.join(dataset_path, subject)
+    for sequence in sorted(os.listdir(subject_path)):
+        if sequence not in peaks or not os.path.isdir(os.path.join(subject_path, sequence)):
+            continue
+        peak_frame, label = peaks[sequence]
+        for pngfile in sorted(os.listdir(os.path.join(subject_path, sequence))):
+            if not pngfile.endswith('.png') or "thumb" in pngfile or "patch" in pngfile:
+                continue
+            try:
+                frame = int(pngfile.split('.')[0].split('_')[2])
+            except (IndexError, ValueError):
+                continue
+            if frame <= peak_frame:
+                rows.append([sequence, frame, peak_frame, label, offsets.get((sequence, frame), -1)])
+
+    return rows
+
+def _write_manifest(manifest):
+    _save_atomic(manifest_file, lambda f: f.write(json.dumps(manifest).encode('utf-8')))
+
+def _read_manifest():
+    # the persisted manifest, an empty one if there is none (patch offsets are only valid together with their manifest)
+    if os.path.isfile(manifest_file):
+        with open(manifest_file, 'r') as f:
+            return json.load(f)
+    return {'subjects': {}, 'num_patches': 0}
+
+def load_manifest():
+    # returns the persisted manifest {'subjects': {subject: rows}}. Subjects that appeared since the last run are
+    # indexed and added, subjects whose emotion labels changed (new or relabelled sequences) are indexed again,
+    # the patches of their already cropped frames are kept
+    with _cache_lock():
+        manifest = _read_manifest()
+
+        new_subjects, changed_subjects = 0, 0
+        for subject in sorted(os.listdir(dataset_path)):
+            if not os.path.isdir(os.path.join(dataset_path, subject)):
+                continue
+
+            peaks = _subject_peaks(subject)
+            rows = manifest['subjects'].get(subject)
+
+            if rows is None:
+                manifest['subjects'][subject] = _index_subject(subject, peaks)
+                new_subjects += 1
+            elif _indexed_peaks(rows) != peaks:
+                manifest['subjects'][subject] = _index_subject(subject, peaks, rows)
+                changed_subjects += 1
+
+        if new_subjects or changed_subjects:
+            print("Indexing {} new and {} relabelled CK+ subjects".format(new_subjects, changed_subjects))
+            _write_manifest(manifest)
+
+    return manifest
+
+def select_frames(manifest, folders, frames):
+    # returns the manifest entries [(subject, row)] of the last `frames` frames up to the peak of every labelled sequence
+    selection = []
     if frames:
-        emotions = []
         for subject in folders:
-            if os.path.isdir(os.path.join(emotions_path, subject)):
-                for sequence in os.listdir(os.path.join(emotions_path, subject)):
-                    if os.path.isdir(os.path.join(emotions_path, subject, sequence)):
-                        if len(os.listdir(os.path.join(emotions_path, subject, sequence))) > 0:
-                            emo_file = os.listdir(os.path.join(emotions_path, subject, sequence))[0]
-                            filename = '_'.join(emo_file.split('.')[0].split('_')[:-1])
-
-                            with open(os.path.join(emotions_path, subject, sequence, emo_file), 'r') as f:
-                                emotion=int(float(f.read()))
-                            emotions.append({'filename': filename, 'emotion': emotion})
-
-                            if frames > 1:
-                                base_filename = '_'.join(filename.split('_')[:-1])
-                                frame_number = int(filename.split('_')[-1])
-
-                                for i in range(frames-1):
-                                    filename = base_filename + '_' + str(frame_number-i-1).rjust(8, '0')
-                                    emotions.append({'filename': filename, 'emotion': emotion})
-
-    # Load images
-    data = []
-    for subject in os.listdir(dataset_path):
-        if os.path.isdir(os.path.join(dataset_path, subject)):
-            for sequence in os.listdir(os.path.join(dataset_path, subject)):
-                if os.path.isdir(os.path.join(dataset_path, subject, sequence)):
-                    for pngfile in os.listdir(os.path.join(dataset_path, subject, sequence)):
-                        if frames is None and not ("thumb" in pngfile or "patch" in pngfile):
-                            emotion = 0
-                        elif frames:
-                            try:
-                                # Try to assign corresponding emotion, raises IndexError if not found
-                                emotion = [e['emotion'] for e in emotions if e['filename'] == pngfile.split('.')[:-1][0]][0]
-
-                                # Create thumbnail of image
-                                img_path = os.path.join(subject, sequence, pngfile)
-                                thumb_path = create_image_thumbnail(img_path)
-
-                                image = scipy.misc.imread(thumb_path, mode='F').flatten()
-                                if len(image) == 4420:
-
-                                    # Normalize pixel values
-                                    #image = image * (1. / 255)
-
-                                    image_dict = dict(enumerate(image))
-                                    image_dict['emotion'] = emotion - 1
-                                    data.append(image_dict)
-                                else:
-                                    print("Image " + pngfile + " has wrong dimensions")
-                            except IndexError:
-                                pass
-    return data
+            for row in manifest['subjects'].get(subject, []):
+                if row[2] - row[1] < frames:
+                    selection.append((subject, row))
+    return selection
 
+def _merge_manifest(manifest, persisted):
+    # adopts the persisted manifest (e.g. patches appended by a concurrent run since manifest was loaded): subjects
+    # only known to manifest are added to it, the rows of manifest take over the persisted patch offsets
+    for subject, rows in manifest['subjects'].items():
+        if subject not in persisted['subjects']:
+            persisted['subjects'][subject] = rows
 
-def read_data_sets(split=True, num_train_folders=90, num_test_folders=24, one_hot=True, frames=3):
+    persisted_offsets = dict(((subject, row[0], row[1]), row[4]) for subject, rows in persisted['subjects'].items() for row in rows)
+    for subject, rows in manifest['subjects'].items():
+        for row in rows:
+            if row[4] < 0:
+                row[4] = persisted_offsets.get((subject, row[0], row[1]), -1)
+
+    return persisted
+
+def create_missing_patches(manifest, selection):
+    # crops the selected frames that have no patch yet and appends them to the patch cache
+    if all(row[4] >= 0 for subject, row in selection):
+        return
+
+    with _cache_lock():
+        # offsets are computed from the manifest on disk, another run may have appended patches in the meantime
+        persisted = _merge_manifest(manifest, _read_manifest())
+
+        missing = [(subject, row) for subject, row in selection if row[4] < 0]
+        if missing:
+            num_patches = persisted['num_patches']
+            if num_patches > 0:
+                old_patches = np.load(patch_cache_file, mmap_mode='r')[:num_patches]
+            else:
+                old_patches = np.zeros((0, INPUT_SIZE[1], INPUT_SIZE[0]), dtype=np.uint8)
+
+            print("Creating {} CK+ patches".format(len(missing)))
+            new_patches = create_patches([frame_name(subject, row[0], row[1]) for subject, row in missing])
+            patches = np.concatenate([old_patches, new_patches])
+
+            offsets = dict(((subject, row[0], row[1]), num_patches + i) for i, (subject, row) in enumerate(missing))
+            for subject, rows in persisted['subjects'].items():
+                for row in rows:
+                    row[4] = offsets.get((subject, row[0], row[1]), row[4])
+            for subject, row in missing:
+                row[4] = offsets[(subject, row[0], row[1])]
+            persisted['num_patches'] = int(patches.shape[0])
+
+            _save_atomic(patch_cache_file, lambda f: np.save(f, patches))
+            _write_manifest(persisted)
+
+        manifest['num_patches'] = persisted['num_patches']
+
+def load_patches(manifest, selection):
+    # returns the patches of the selected frames (uint8, (N, 68, 65))
+    create_missing_patches(manifest, selection)
+
+    if not selection:
+        return np.zeros((0, INPUT_SIZE[1], INPUT_SIZE[0]), dtype=np.uint8)
+
+    patches = np.load(patch_cache_file, mmap_mode='r')
+    return np.asarray(patches[[row[4] for subject, row in selection]])
 
+
+def read_from_folders(folders, frames, manifest=None):
+    # returns (images, labels): uint8 patches of shape (N, 68, 65) and the emotion labels (0..6)
+    if manifest is None:
+        manifest = load_manifest()
+
+    selection = select_frames(manifest, folders, frames)
+
+    images = load_patches(manifest, selection)
+    labels = np.array([row[3] for subject, row in selection], dtype=np.int64)
+
+    return images, labels
+
+
+def split_folders(split=True, num_train_folders=90, num_test_folders=24):
+    # deterministic subject split, returns {split: folders}
     all_folders = os.listdir(emotions_path)
     random.Random(0).shuffle(all_folders)
 
     if split:
-        train_folders = all_folders[:num_train_folders]
-        test_folders = all_folders[num_train_folders:num_train_folders+num_test_folders]
-        validation_folders = all_folders[num_train_folders+num_test_folders:]
-
-        train_df = pd.DataFrame(read_from_folders(train_folders, frames))
-        validation_df = pd.DataFrame(read_from_folders(validation_folders, frames))
-        test_df = pd.DataFrame(read_from_folders(test_folders, frames))
-        print("{} CK+ TRAIN datapoints loaded".format(len(train_df)))
-        print("{} CK+ VALIDATION datapoints loaded".format(len(validation_df)))
-        print("{} CK+ TEST datapoints loaded".format(len(test_df)))
-    else:
-        train_df = pd.DataFrame(read_from_folders(all_folders, frames))
-        validation_df = train_df.copy()
-        test_df = train_df.copy()
-        print("{} CK+ TRAIN datapoints loaded".format(len(train_df)))
-
-    if one_hot:
-        train_labels = dense_to_one_hot(train_df['emotion'].values, NUM_CLASSES)
-        validation_labels = dense_to_one_hot(validation_df['emotion'].values, NUM_CLASSES)
-        test_labels = dense_to_one_hot(test_df['emotion'].values, NUM_CLASSES)
+        return {'train': all_folders[:num_train_folders],
+                'test': all_folders[num_train_folders:num_train_folders+num_test_folders],
+                'validation': all_folders[num_train_folders+num_test_folders:]}
     else:
-        train_labels = train_df['emotion']
-        validation_labels = validation_df['emotion']
-        test_labels = test_df['emotion']
-    del train_df['emotion']
-    del validation_df['emotion']
-    del test_df['emotion']
-
-    train_idx = np.arange(len(train_labels))
-    validation_idx = np.arange(len(validation_labels))
-    test_idx = np.arange(len(test_labels))
-    np.random.shuffle(train_idx)
-    np.random.shuffle(validation_idx)
-    np.random.shuffle(test_idx)
-
-    train_images = train_df.as_matrix()
-    validation_images = validation_df.as_matrix()
-    test_images = test_df.as_matrix()
-
-    train = DataSet(train_images[train_idx,:], train_labels[train_idx], reshape=False)
-    validation = DataSet(validation_images[validation_idx,:], validation_labels[validation_idx], reshape=False)
-    test = DataSet(test_images[test_idx,:], test_labels[test_idx], reshape=False)
-
-    return Datasets(train=train, validation=validation, test=test)
+        return {'train': all_folders}
+
+
+def read_raw_data_sets(split=True, num_train_folders=90, num_test_folders=24, frames=3):
+    # returns (images, labels, {split: indices}): uint8 images of shape (N, 68, 65, 1) and integer labels of all
+    # splits in one buffer, the splits are index arrays into it (without a split, validation and test share the
+    # training indices)
+    manifest = load_manifest()
+    folders_per_split = split_folders(split, num_train_folders, num_test_folders)
+
+    split_names = [split_name for split_name in SPLITS if split_name in folders_per_split]
+
+    selection = []
+    split_indices = {}
+    for split_name in split_names:
+        split_selection = select_frames(manifest, folders_per_split[split_name], frames)
+        split_indices[split_name] = np.arange(len(selection), len(selection) + len(split_selection))
+        selection += split_selection
+        print("{} CK+ {} datapoints selected".format(len(split_selection), split_name.upper()))
+
+    # crop the missing patches of all splits in one parallel pass and read them once
+    images = load_patches(manifest, selection)
+    labels = np.array([row[3] for subject, row in selection], dtype=np.int64)
+
+    if not split:
+        split_indices['validation'] = split_indices['train']
+        split_indices['test'] = split_indices['train']
+
+    return images[..., None], labels, split_indices
+
+
+def read_data_sets(split=True, num_train_folders=90, num_test_folders=24, one_hot=True, frames=3):
+    # flattened images, every split is a shuffled index array over the same uint8 buffer
+    images, labels, split_indices = read_raw_data_sets(split, num_train_folders, num_test_folders, frames)
+
+    datasets = {}
+    for split_name in SPLITS:
+        datasets[split_name] = DataSet(images, labels, NUM_CLASSES, one_hot=one_hot, flatten=True, indices=np.random.permutation(split_indices[split_name]))
+
+    return Datasets(**datasets)
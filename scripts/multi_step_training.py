@@ -0,0 +1,48 @@
+# ------------------------------------------------------------------------------------------
+# several training steps per sess.run: a tf.while_loop draws a batch from an in-graph batch
+# source (ResidentDataSet.batch) and applies one optimization step (CAE / CNN training_step)
+# per iteration, so small models do not pay the session overhead for every single step
+#
+#	training = MultiStepTraining(100, resident.batch, lambda images, labels: cnn.training_step(images, labels))
+#	training.run(sess, training.steps_until(i, chk_iterations, max_iterations), {keep_prob: 0.5})
+#
+# the loop runs the steps strictly one after another (every step reads the variables updated
+# by the previous one), values computed outside the loop (e.g. a decayed learning rate) are
+# read once per run
+# ------------------------------------------------------------------------------------------
+
+import tensorflow as tf
+
+class MultiStepTraining:
+
+	def __init__(self, steps_per_run, batch_fn, step_fn, name = 'multi_step_training'):
+		# steps_per_run : maximal number of training steps per run
+		# batch_fn 		: returns new batch tensors, called once inside the loop body
+		# step_fn 		: step_fn(*batch) returns the optimization op of one step
+
+		self.steps_per_run = steps_per_run
+
+		with tf.name_scope(name):
+
+			# fewer steps are run at the end of a check interval or of the training
+			self.num_steps = tf.placeholder_with_default(steps_per_run, [], name='num_steps')
+
+			def body(step):
+				with tf.control_dependencies([step]):
+					train_op = step_fn(*batch_fn())
+
+				with tf.control_dependencies([train_op]):
+					return step + 1
+
+			self.run_op = tf.while_loop(lambda step: step < self.num_steps, body, [tf.constant(0)], parallel_iterations=1, back_prop=False)
+
+	def steps_until(self, iteration, chk_iterations, max_iterations):
+		# number of steps of the next run starting at iteration, runs end at the check iterations and at max_iterations
+		return min(self.steps_per_run, chk_iterations - iteration % chk_iterations, max_iterations - iteration)
+
+	def run(self, sess, num_steps, feed_dict = None):
+		# runs num_steps training steps, returns the number of steps
+		feed_dict = dict(feed_dict or {})
+		feed_dict[self.num_steps] = num_steps
+
+		return sess.run(self.run_op, feed_dict=feed_dict)
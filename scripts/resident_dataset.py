@@ -0,0 +1,69 @@
+# -------------------------------------------------------------------------------------------
+# graph-resident training set for small datasets (MNIST_1k, MNIST_SMALL, CIFAR_nk, ...)
+#
+# the uint8 images and labels of a store DataSet are copied once into non-trainable variables,
+# training batches are gathered in the graph with a shuffled index, so a training step needs
+# no feed_dict. The batches are meant as defaults of the input placeholders:
+#
+#	x = tf.placeholder_with_default(resident.images, [None, 784])
+#
+# sess.run(optimizer) then trains on the resident batches while evaluations still feed x
+# -------------------------------------------------------------------------------------------
+
+import numpy as np
+import tensorflow as tf
+
+class ResidentDataSet:
+
+	def __init__(self, dataset, batch_size, image_shape, one_hot = True, seed = None, name = 'resident_training_set'):
+		# dataset 		: store DataSet (scripts.dataset_store) providing raw_images, raw_labels and num_classes
+		# image_shape 	: shape of a single image as expected by the input placeholder (e.g. [784] or [32, 32, 3])
+		# one_hot 		: return one-hot float labels, otherwise int64 class indices
+
+		self._raw_images 	= dataset.raw_images
+		self._raw_labels 	= dataset.raw_labels
+
+		num_examples = self._raw_images.shape[0]
+
+		with tf.name_scope(name):
+
+			# initialized from placeholders so that the data does not end up in the graph definition,
+			# the variables are kept out of the global collection (initializer and savers ignore them)
+			self._images_init = tf.placeholder(tf.uint8, self._raw_images.shape, name='images_init')
+			self._labels_init = tf.placeholder(tf.int8, self._raw_labels.shape, name='labels_init')
+
+			self.images_variable = tf.Variable(self._images_init, trainable=False, collections=[], name='images')
+			self.labels_variable = tf.Variable(self._labels_init, trainable=False, collections=[], name='labels')
+
+			# reshuffled index over all epochs
+			index_dataset = tf.data.Dataset.range(num_examples).shuffle(num_examples, seed=seed).repeat().batch(batch_size)
+			self._index_iterator = index_dataset.make_one_shot_iterator()
+
+			self._image_shape 	= list(image_shape)
+			self._one_hot 		= one_hot
+			self._num_classes 	= dataset.num_classes
+
+			self.images, self.labels = self.batch()
+
+	def batch(self):
+		# new (images, labels) nodes drawing the next batch from the shared shuffled index, e.g. once per step inside a
+		# tf.while_loop (images and labels are the nodes created by the constructor)
+		indices = self._index_iterator.get_next()
+
+		images = tf.gather(self.images_variable, indices)
+		images = tf.cast(images, tf.float32) * (1. / 255)
+		images = tf.reshape(images, [-1] + self._image_shape, name='image_batch')
+
+		labels = tf.cast(tf.gather(self.labels_variable, indices), tf.int64)
+		if self._one_hot:
+			labels = tf.one_hot(labels, self._num_classes, dtype=tf.float32, name='label_batch')
+		else:
+			labels = tf.identity(labels, name='label_batch')
+
+		return images, labels
+
+	def initialize(self, sess):
+		# copies the training set into the graph (needs to be called once after the session was created)
+		sess.run([self.images_variable.initializer, self.labels_variable.initializer], feed_dict={
+					self._images_init: np.asarray(self._raw_images, dtype=np.uint8),
+					self._labels_init: np.asarray(self._raw_labels, dtype=np.int8)})
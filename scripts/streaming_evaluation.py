@@ -0,0 +1,46 @@
+# ------------------------------------------------------------------------------------------
+# streaming evaluation of the autoencoder: the reconstruction errors of an EvaluationSet are
+# accumulated in the graph (local metric variables) over fixed evaluation batches, only the
+# final means are fetched. The metrics are exact means over all evaluated pixels, whatever
+# the evaluation batch size
+#
+#	mse 			: mean squared reconstruction error
+#	cross_entropy 	: mean cross-entropy error (the optimized error of error_function cross_entropy)
+#	encoding_l1 	: mean L1 norm of the encoding of one image (regularization term of autoencoder.error)
+#
+# summaries are not part of the evaluation, train_ae runs them separately on a small batch
+# ------------------------------------------------------------------------------------------
+
+import tensorflow as tf
+
+class StreamingEvaluation:
+
+	def __init__(self, autoencoder, input_placeholder, evaluation_set, name = 'streaming_evaluation'):
+		# evaluation_set : scripts.evaluation_set.EvaluationSet of images in the format of input_placeholder
+
+		self.input_placeholder 	= input_placeholder
+		self.evaluation_set 	= evaluation_set
+
+		with tf.variable_scope(name) as scope:
+			squared_error = tf.squared_difference(autoencoder.reconstruction, autoencoder.data)
+
+			self.mse, mse_update 						= tf.metrics.mean(squared_error, name='mse')
+			self.cross_entropy, cross_entropy_update 	= tf.metrics.mean(autoencoder.ce_error, name='cross_entropy')
+
+			encoding 	= autoencoder.encoding
+			encoding_l1 = tf.reduce_sum(tf.abs(tf.reshape(encoding, [tf.shape(encoding)[0], -1])), axis=1)
+			self.encoding_l1, encoding_l1_update 		= tf.metrics.mean(encoding_l1, name='encoding_l1')
+
+			self._update 	= tf.group(mse_update, cross_entropy_update, encoding_l1_update)
+			self._reset 	= tf.variables_initializer(tf.get_collection(tf.GraphKeys.LOCAL_VARIABLES, scope=scope.name))
+
+	def evaluate(self, sess):
+		# one pass over the evaluation set, returns {'mse': ..., 'cross_entropy': ..., 'encoding_l1': ...}
+		sess.run(self._reset)
+
+		for images, _ in self.evaluation_set.batches():
+			sess.run(self._update, feed_dict={self.input_placeholder: images})
+
+		mse, cross_entropy, encoding_l1 = sess.run([self.mse, self.cross_entropy, self.encoding_l1])
+
+		return {'mse': float(mse), 'cross_entropy': float(cross_entropy), 'encoding_l1': float(encoding_l1)}
@@ -0,0 +1,88 @@
+# ------------------------------------------------------------------------------------------
+# synthetic datasets for offline benchmarks (no download, no licence-gated data): seeded uint8
+# images and int8 labels with the shapes of MNIST, CIFAR-10 and CK+, served by the same
+# DataSet class as the dataset store, and synthetic CIFAR-10 binary files for the queue path
+#
+# every class has a random template, the images are the template of their label mixed with
+# noise, so the networks can learn something while the throughput is measured
+# ------------------------------------------------------------------------------------------
+
+import os, shutil, tempfile
+
+import numpy as np
+
+from scripts.dataset_store import Datasets, DataSet, SPLITS
+
+# like: (image shape, number of classes, default number of {split: examples})
+SHAPES = {
+	'MNIST' 	: ((28, 28, 1), 10, {'train': 55000, 'validation': 5000, 'test': 10000}),
+	'CIFAR' 	: ((32, 32, 3), 10, {'train': 45000, 'validation': 5000, 'test': 10000}),
+	'CKPLUS' 	: ((68, 65, 1), 7, 	{'train': 900, 'validation': 100, 'test': 300}),
+}
+
+# weight of the class template in the synthetic images
+TEMPLATE_WEIGHT = 0.5
+
+
+def generate(image_shape, num_classes, num_examples, seed = 0):
+	# returns num_examples uint8 images of image_shape and their int8 labels
+	rng = np.random.RandomState(seed)
+
+	templates 	= rng.randint(0, 256, size=(num_classes,) + tuple(image_shape)).astype(np.float32)
+	labels 		= rng.randint(0, num_classes, size=num_examples).astype(np.int8)
+
+	images = rng.randint(0, 256, size=(num_examples,) + tuple(image_shape)).astype(np.float32)
+	images *= 1. - TEMPLATE_WEIGHT
+	images += TEMPLATE_WEIGHT * templates[labels]
+
+	return images.astype(np.uint8), labels
+
+def read_data_sets(like, num_train = None, seed = 0, one_hot = True, flatten = False):
+	# Datasets(train, validation, test) with the shapes of like (MNIST | CIFAR | CKPLUS), all splits are
+	# index arrays over one generated buffer (same layout as the dataset store)
+
+	if like not in SHAPES:
+		raise ValueError('Unknown synthetic dataset {} ({})'.format(like, ' | '.join(sorted(SHAPES.keys()))))
+
+	image_shape, num_classes, split_sizes = SHAPES[like]
+
+	split_sizes = dict(split_sizes)
+	if num_train is not None:
+		split_sizes['train'] = num_train
+
+	images, labels = generate(image_shape, num_classes, sum(split_sizes.values()), seed)
+
+	splits = {}
+	start = 0
+	for split in SPLITS:
+		indices = np.arange(start, start + split_sizes[split])
+		splits[split] = DataSet(images, labels, num_classes, one_hot=one_hot, flatten=flatten, name=None, split=split, indices=indices)
+		start += split_sizes[split]
+
+	return Datasets(**splits)
+
+def write_cifar10_bin(data_dir, num_train = 50000, num_test = 10000, seed = 0):
+	# writes data_batch_1.bin ... data_batch_5.bin and test_batch.bin in the CIFAR-10 binary record format
+	# (label byte followed by the depth-major 32x32x3 image) for the cifar10_input / cifar10_dataset pipelines
+
+	images, labels = generate((32, 32, 3), 10, num_train + num_test, seed)
+
+	records = np.concatenate([labels.astype(np.uint8)[:, None], images.transpose(0, 3, 1, 2).reshape(images.shape[0], -1)], axis=1)
+
+	parent_dir = os.path.dirname(os.path.abspath(data_dir))
+	if not os.path.exists(parent_dir):
+		os.makedirs(parent_dir)
+
+	tmp_dir = tempfile.mkdtemp(prefix='.synthetic-', dir=parent_dir)
+
+	for i, batch in enumerate(np.array_split(records[:num_train], 5)):
+		batch.tofile(os.path.join(tmp_dir, 'data_batch_{}.bin'.format(i + 1)))
+	records[num_train:].tofile(os.path.join(tmp_dir, 'test_batch.bin'))
+
+	try:
+		os.rename(tmp_dir, data_dir)
+	except OSError:
+		# another process finished the same files first
+		shutil.rmtree(tmp_dir, ignore_errors=True)
+
+	print('Wrote {} synthetic CIFAR-10 training and {} test records to {}'.format(num_train, num_test, data_dir))
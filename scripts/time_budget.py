@@ -0,0 +1,82 @@
+# ------------------------------------------------------------------------------------------
+# wall-clock budget for train_ae / train_cnn: the check iterations happen every check_seconds
+# instead of every chk_iterations, the training ends with a last check early enough that the
+# work after the training loop (reserved seconds, e.g. the final test set evaluation of
+# train_cnn) still fits into the budget
+#
+# the last check is scheduled from measured durations: it is due once the remaining time
+# does not cover the next training run (average step time), one more check (duration of the
+# last check), the reserved seconds and a safety margin
+#
+# runs of several training steps (multi_step_training) are limited to the steps that fit in
+# before the next check is due (max_steps), the checks therefore stay on schedule
+#
+# the clock starts when the TimeBudget is created (e.g. after loading the config)
+# ------------------------------------------------------------------------------------------
+
+import time
+
+# weight of a new measurement in the average step time
+STEP_TIME_DECAY = 0.1
+
+class TimeBudget:
+
+	def __init__(self, seconds, check_seconds, margin_seconds = 30):
+		# seconds 		: total budget
+		# check_seconds : time between two check iterations
+		# margin_seconds: kept free at the end of the budget (summaries, closing the session, ...)
+
+		self.seconds 		= seconds
+		self.check_seconds 	= check_seconds
+		self.margin_seconds = margin_seconds
+
+		self.start_time 		= time.time()
+		self.last_check_time 	= None
+		self.check_duration 	= 0
+		self.step_duration 		= 0
+		self.reserved_seconds 	= 0
+
+	def remaining(self):
+		return self.seconds - (time.time() - self.start_time)
+
+	def check_due(self):
+		# the first check happens right away, the following ones every check_seconds
+		return self.last_check_time is None or time.time() - self.last_check_time >= self.check_seconds
+
+	def last_check_due(self, num_steps = 1):
+		# True if a check after the next num_steps training steps would not fit in anymore, the current check is the last one
+		needed = num_steps * self.step_duration + self.check_duration + self.reserved_seconds + self.margin_seconds
+		return self.remaining() < needed
+
+	def max_steps(self, num_steps):
+		# number of the next num_steps training steps that fit in until the next check is due (at least one step,
+		# only one step as long as no step time is measured)
+		if self.step_duration == 0:
+			return min(num_steps, 1)
+
+		seconds = self.remaining() - (self.check_duration + self.reserved_seconds + self.margin_seconds)
+		if self.last_check_time is not None:
+			seconds = min(seconds, self.check_seconds - (time.time() - self.last_check_time))
+
+		return max(1, min(num_steps, int(seconds / self.step_duration)))
+
+	def checked(self, duration):
+		# registers a check iteration that took duration seconds
+		self.last_check_time 	= time.time()
+		self.check_duration 	= duration
+
+	def steps_done(self, num_steps, duration):
+		# registers num_steps training steps (including their input) that took duration seconds
+		if num_steps <= 0:
+			return
+
+		step_duration = duration / float(num_steps)
+
+		if self.step_duration == 0:
+			self.step_duration = step_duration
+		else:
+			self.step_duration += STEP_TIME_DECAY * (step_duration - self.step_duration)
+
+	def reserve(self, seconds):
+		# seconds needed after the training loop (estimated anew after every check)
+		self.reserved_seconds = seconds
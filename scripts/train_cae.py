@@ -1,29 +1,92 @@
 import tensorflow 	as tf
 import numpy		as np
-import sys, os
+import sys, os, time
 
 import scripts.from_github.cifar10_input as cifar10_input
+import scripts.cifar10_dataset as cifar10_dataset
+import scripts.cifar10_shards as cifar10_shards
+import scripts.evaluation_set as evaluation_set
+from scripts.batch_prefetcher import BatchPrefetcher
+from scripts.checkpoint_writer import CheckpointWriter
+from scripts.concurrent_evaluator import ConcurrentEvaluator
+from scripts.input_monitor import InputMonitor
+from scripts.graph_monitor import GraphMonitor
+from scripts.streaming_evaluation import StreamingEvaluation
 
 CIFAR_LOCATION = 'cifar10_data/cifar-10-batches-bin'
 
-def train_ae(sess, writer,  input_placeholder, autoencoder, data, cae_dir, weight_file_name, error_function = 'cross_entropy', batch_size=100, init_iteration = 0, max_iterations=1000, chk_iterations=500, save_prefix = None, minimal_reconstruction_error = sys.maxsize):
+# number of evaluation images the tensorboard summaries are computed on
+SUMMARY_IMAGES = 128
 
-	if data == 'cifar_10':
+# number of images the L1 regularization of the selection error counts (the size of the former evaluation batch,
+# keeps the errors comparable to the minimal reconstruction errors in the names of older checkpoints)
+REGULARIZATION_IMAGES = 128
+
+def train_ae(sess, writer,  input_placeholder, autoencoder, data, cae_dir, weight_file_name, error_function = 'cross_entropy', batch_size=100, init_iteration = 0, max_iterations=1000, chk_iterations=500, save_prefix = None, minimal_reconstruction_error = sys.maxsize, input_pipeline = 'queue', prefetch_batches = 2, resident_data = False, augmentation = None, cifar_dir = None, cifar_input_options = None, multi_step_training = None, expensive_summary_checks = 1, evaluation_set_size = -1, evaluation_batch_size = 500, concurrent_evaluation = False, early_stopping = None, time_budget = None, finalize_graph = False):
+
+	# augmentation: optional function (images, labels) -> (images, labels) applied to every training batch of the in-memory datasets
+	# cifar_dir: directory of the CIFAR-10 binary files (data == 'cifar_10', None: CIFAR_LOCATION)
+	# cifar_input_options: keyword arguments of cifar10_input.distorted_inputs (num_readers, num_preprocess_threads, capacity_batches) for the queue pipeline
+	# resident_data: the training batches are drawn in the graph (default value of input_placeholder)
+	# multi_step_training: MultiStepTraining on the resident batches, runs several training steps per sess.run (requires resident_data)
+	# expensive_summary_checks: the summaries above the scalar tier (merged_expensive) are written every this many check iterations
+	# evaluation_set_size: number of validation images (CIFAR10: training images) of the evaluation at every check iteration (<= 0: all, at most 10000 for CIFAR10)
+	# evaluation_batch_size: number of images per evaluation batch
+	# concurrent_evaluation: the evaluation set errors of every check iteration are computed in a background thread while training continues
+	# early_stopping: EarlyStopping ('min') on the evaluation set regularized reconstruction error, drops the step size on a plateau and ends the training
+	# time_budget: TimeBudget, check iterations every check_seconds instead of chk_iterations, the training ends before the budget is used up
+	# finalize_graph: the graph is finalized before the training loop, every op created afterwards raises an error
+	if resident_data:
+		prefetch_batches = 0
+
+	if cifar_dir is None:
+		cifar_dir = CIFAR_LOCATION
 
-		coord = tf.train.Coordinator()
 
-		image_batch, label_batch = cifar10_input.distorted_inputs(CIFAR_LOCATION, batch_size)
-		test_image_node, test_label_node = cifar10_input.inputs(False, CIFAR_LOCATION, batch_size)
+	coord = tf.train.Coordinator()
+	threads = []
+
+	if data == 'cifar_10':
+
+		# queue runners (cifar10_input), tf.data (cifar10_dataset) or pre-shuffled shards (cifar10_shards), all offer the same interface
+		if input_pipeline == 'dataset':
+			cifar_inputs = cifar10_dataset
+		elif input_pipeline == 'sharded':
+			cifar_inputs = cifar10_shards
+		else:
+			cifar_inputs = cifar10_input
 
-		# add the some test images to the summary 
-		autoencoder.add_summary(tf.summary.image('some example input', test_image_node))
-		autoencoder.update_summaries()
+		if cifar_inputs is cifar10_input and cifar_input_options:
+			image_batch, label_batch = cifar_inputs.distorted_inputs(cifar_dir, batch_size, **cifar_input_options)
+		else:
+			image_batch, label_batch = cifar_inputs.distorted_inputs(cifar_dir, batch_size)
 
 		threads = tf.train.start_queue_runners(sess=sess, coord=coord)
 
+		# centrally cropped training images, decoded once
+		if evaluation_set_size <= 0:
+			evaluation_set_size = 10000
+		validation_set = evaluation_set.cifar10_evaluation_set(False, cifar_dir, num_examples=min(evaluation_set_size, 10000), batch_size=evaluation_batch_size)
+
+	else:
+		# fixed validation images, converted once to the placeholder format
+		validation_set = evaluation_set.from_data_set(data.validation, input_placeholder.get_shape().as_list()[1:], None, num_examples=evaluation_set_size, batch_size=evaluation_batch_size)
+
+		if prefetch_batches > 0:
+			# prepare the next training batches in a background thread while the current step runs
+			batch_prefetcher = BatchPrefetcher(data.train, batch_size, coord, image_shape=input_placeholder.get_shape().as_list()[1:], capacity=prefetch_batches, transform=augmentation)
+			threads = batch_prefetcher.start()
+
+
 
+	# reconstruction errors over the whole evaluation set, accumulated in the graph
+	streaming_evaluation = StreamingEvaluation(autoencoder, input_placeholder, validation_set)
+
+	# the summaries are computed on the first evaluation images only (see EvaluationSet.summary_batch)
+	summary_images, _ = validation_set.summary_batch(SUMMARY_IMAGES, autoencoder.accumulation_steps)
 
 	print("Training for {} iterations with batchsize {}".format(max_iterations, batch_size))
+	print("Evaluating {} images in batches of {} at every check iteration".format(validation_set.num_examples, validation_set.batch_size))
 	print("Error function is {}".format(error_function))
 
 	if error_function == 'mse':
@@ -32,63 +95,192 @@ def train_ae(sess, writer,  input_placeholder, autoencoder, data, cae_dir, weigh
 		optimizer_node = autoencoder.optimize
 
 
-	# create two different savers (always store the model from the last 5 check iterations and the current model with the best accuracy)
-	chk_it_saver 	= tf.train.Saver(autoencoder.all_variables_dict, max_to_keep = 1)
-	best_it_saver 	= tf.train.Saver(autoencoder.all_variables_dict, max_to_keep = 1)
+	# checkpoints of the last check iteration and of the model with the minimal reconstruction error, written in a background thread
+	if save_prefix is not None:
+		checkpoint_writer = CheckpointWriter(autoencoder.all_variables_dict)
+
+
+	# dequeue wait and queue fill level summaries
+	input_monitor = InputMonitor(writer)
+
+	# number of graph operations at every check iteration
+	graph_monitor = GraphMonitor(writer, sess.graph)
+
+	# the minimal error is updated by report_evaluation (in the evaluator thread for concurrent evaluation)
+	evaluation_state = {'minimal_reconstruction_error': minimal_reconstruction_error, 'seconds': 0}
+
+	def evaluate(eval_sess):
+		evaluation_start = time.time()
+		evaluation = streaming_evaluation.evaluate(eval_sess)
+		evaluation_state['seconds'] = time.time() - evaluation_start
+		return evaluation
+
+	def report_evaluation(step, evaluation, values = None):
+		# values: snapshot of the evaluated variables, None: the current variables of sess are saved
 
+		# model selection on the error of autoencoder.error (mean squared error plus the regularization of the encoding) of
+		# the whole evaluation set, the L1 norm counts REGULARIZATION_IMAGES images
+		average_reconstruction_error = evaluation['mse'] + autoencoder.regularization_factor * REGULARIZATION_IMAGES * evaluation['encoding_l1']
 
-	for i in range(init_iteration, max_iterations):
+		print('it {} avg_re {} (mse {}, cross-entropy {})'.format(step, average_reconstruction_error, evaluation['mse'], evaluation['cross_entropy']))
+
+		evaluation_summary = tf.Summary()
+		evaluation_summary.value.add(tag='evaluation/error', simple_value=average_reconstruction_error)
+		evaluation_summary.value.add(tag='evaluation/mse', simple_value=evaluation['mse'])
+		evaluation_summary.value.add(tag='evaluation/cross_entropy', simple_value=evaluation['cross_entropy'])
+		writer.add_summary(evaluation_summary, step)
+
+		save_paths = {}
+
+		if save_prefix is not None:
+			print('...save iteration weights to file ')
+			save_paths['checkpoint'] = os.path.join(save_prefix, 'cae_model-mre-{}'.format(evaluation_state['minimal_reconstruction_error']))
+
+		if average_reconstruction_error < evaluation_state['minimal_reconstruction_error']:
+			print('...found new weight configuration with minimal reconstruction error')
+
+			evaluation_state['minimal_reconstruction_error'] = average_reconstruction_error
+
+			if save_prefix is not None:
+				print('...save new found best weights to file ')
+				save_paths['best'] = os.path.join(save_prefix, 'best', 'cae_model-mre-{}'.format(average_reconstruction_error))
+
+		if save_paths:
+			# both checkpoints are written from one snapshot
+			checkpoint_writer.save(sess, save_paths, step, values=values)
+
+		if early_stopping is not None:
+			action = early_stopping.update(average_reconstruction_error)
+
+			if action == 'plateau':
+				print('...no improvement for {} checks, step size factor {}'.format(early_stopping.plateau_patience, early_stopping.step_size_factor))
+				sess.run(autoencoder.set_step_size_factor_op, feed_dict={autoencoder.step_size_factor_input: early_stopping.step_size_factor})
+
+			elif action == 'stop':
+				print('...no improvement for {} checks, the training stops'.format(early_stopping.patience))
+
+	if concurrent_evaluation:
+		# evaluates snapshots of the weights in a second session, the results are tagged with the snapshot iteration
+		concurrent_evaluator = ConcurrentEvaluator(autoencoder.all_variables_dict, evaluate, report_evaluation)
+	else:
+		concurrent_evaluator = None
+
+	if time_budget is not None:
+		# the check iterations are scheduled by the time budget, the runs of multi_step_training end when the next check is due
+		chk_iterations = max_iterations
+
+	if finalize_graph:
+		# guard against op leaks: creating an op in the training loop raises an error
+		sess.graph.finalize()
+
+	num_checks = 0
+
+	i = init_iteration
+	while i < max_iterations:
+
+		fetch_start = time.time()
 
 		if data == 'cifar_10':
 			batch_xs, batch_ys = sess.run([image_batch, label_batch])
 
+		elif resident_data:
+			batch_xs, batch_ys = None, None
+
+		elif prefetch_batches > 0:
+			batch_xs, batch_ys = batch_prefetcher.next_batch()
+
 		else:
 			batch_xs, batch_ys = data.train.next_batch(batch_size)
+			if augmentation is not None:
+				batch_xs, batch_ys = augmentation(batch_xs, batch_ys)
+
+		fetch_seconds = time.time() - fetch_start
+		input_monitor.add_wait(fetch_seconds)
 
 		if chk_iterations > 100 and i % 100 == 0:
 			print('...iteration {}'.format(i))
 
+		if time_budget is None:
+			last_check 	= False
+			check 		= i % chk_iterations == 0
+		else:
+			last_check 	= time_budget.last_check_due()
+			check 		= last_check or time_budget.check_due()
 	  
-		if i % chk_iterations == 0:
+		if check:
+
+			check_start = time.time()
+
+			if num_checks % expensive_summary_checks == 0:
+				summary_node = autoencoder.merged_expensive
+			else:
+				summary_node = autoencoder.merged
+
+			num_checks += 1
 
+			writer.add_summary(sess.run(summary_node, feed_dict={input_placeholder: summary_images}), i)
 
-			if data == 'cifar_10':
-				test_images, test_labels = sess.run([test_image_node, test_label_node])
+			print('average input wait {:.2f} ms per batch'.format(input_monitor.write_summary(sess, i)))
+			graph_monitor.write_summary(i)
 
+			if concurrent_evaluator is not None:
+				# evaluated and reported by the evaluator thread, training continues
+				concurrent_evaluator.submit(sess, i)
 			else:
-				test_images, test_labels = data.validation.images[:128], data.validation.labels[:128]
+				report_evaluation(i, evaluate(sess))
 
+			if early_stopping is not None and early_stopping.stop:
+				# with concurrent evaluation the training stops at the first check after the decision
+				print('Early stopping at iteration {}'.format(i))
+				break
 
-			summary, reconstruction_error = sess.run([autoencoder.merged, autoencoder.error], feed_dict={input_placeholder: test_images})
+			if time_budget is not None:
+				time_budget.checked(time.time() - check_start)
 
-			average_reconstruction_error = np.mean(reconstruction_error)
+				if concurrent_evaluator is not None:
+					# the evaluation of the last snapshot happens after the training loop
+					time_budget.reserve(evaluation_state['seconds'])
 
-			print('it {} avg_re {}'.format(i, average_reconstruction_error))
+				if last_check:
+					print('Time budget: last check at iteration {}, {:.0f} s left'.format(i, time_budget.remaining()))
+					break
 
-			if save_prefix is not None:
-				file_path = os.path.join(save_prefix, 'cae_model-mre-{}'.format(minimal_reconstruction_error))
-				print('...save iteration weights to file ')
-				autoencoder.store_model_to_file(sess, file_path, i, saver=chk_it_saver)
+		step_start = time.time()
 
-			if average_reconstruction_error < minimal_reconstruction_error:
-				print('...found new weight configuration with minimal reconstruction error')
+		if multi_step_training is not None:
+			# training steps up to the next check iteration in one run
+			num_steps = multi_step_training.steps_until(i, chk_iterations, max_iterations)
+			if time_budget is not None:
+				num_steps = time_budget.max_steps(num_steps)
 
-				minimal_reconstruction_error = average_reconstruction_error
+			num_steps = multi_step_training.run(sess, num_steps)
+			i += num_steps
 
-				if save_prefix is not None:
-					file_path = os.path.join(save_prefix, 'best', 'cae_model-mre-{}'.format(minimal_reconstruction_error))
-					print('...save new found best weights to file ')
-					autoencoder.store_model_to_file(sess, file_path, i, saver=best_it_saver)
+			if time_budget is not None:
+				time_budget.steps_done(num_steps, fetch_seconds + time.time() - step_start)
+			continue
 
+		if resident_data:
+			sess.run(optimizer_node)
+		else:
+			sess.run(optimizer_node, feed_dict={input_placeholder: batch_xs})
 
-			writer.add_summary(summary, i)
-			
-		sess.run(optimizer_node, feed_dict={input_placeholder: batch_xs})
+		if time_budget is not None:
+			time_budget.steps_done(1, fetch_seconds + time.time() - step_start)
 
+		i += 1
 
-	if data == 'cifar_10':
-		coord.request_stop()
-		coord.join(threads)
+
+	if concurrent_evaluator is not None:
+		# evaluate the remaining snapshots, their checkpoints are saved before the writer is closed
+		concurrent_evaluator.close()
+
+	coord.request_stop()
+	coord.join(threads)
+
+	if save_prefix is not None:
+		# wait for the pending checkpoints
+		checkpoint_writer.close()
 
 
 
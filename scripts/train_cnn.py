@@ -1,12 +1,37 @@
 import tensorflow 	as tf 
 import numpy 		as np 
-import os
+import os, time
 
 import scripts.from_github.cifar10_input as cifar10_input
+import scripts.cifar10_dataset as cifar10_dataset
+import scripts.cifar10_shards as cifar10_shards
+import scripts.evaluation_set as evaluation_set
+from scripts.batch_prefetcher import BatchPrefetcher
+from scripts.checkpoint_writer import CheckpointWriter
+from scripts.concurrent_evaluator import ConcurrentEvaluator
+from scripts.input_monitor import InputMonitor
+from scripts.graph_monitor import GraphMonitor
 
 CIFAR_LOCATION = 'cifar10_data/cifar-10-batches-bin'
 
-def train_cnn(sess, cnn, data, x, y, keep_prob, dropout_k_p, batch_size, init_iteration, max_iterations, chk_iterations, writer, fine_tuning_only, save_prefix = None, best_accuracy_so_far = 0, num_test_images = 1024, test_batch_size = 1024, evaluate_using_test_set = False, final_test_evaluation = True, best_model_for_test = True):
+def train_cnn(sess, cnn, data, x, y, keep_prob, dropout_k_p, batch_size, init_iteration, max_iterations, chk_iterations, writer, fine_tuning_only, save_prefix = None, best_accuracy_so_far = 0, num_test_images = 1024, test_batch_size = 1024, evaluate_using_test_set = False, final_test_evaluation = True, best_model_for_test = True, input_pipeline = 'queue', prefetch_batches = 2, resident_data = False, augmentation = None, cifar_dir = None, cifar_input_options = None, multi_step_training = None, expensive_summary_checks = 1, concurrent_evaluation = False, early_stopping = None, time_budget = None, finalize_graph = False):
+
+	# augmentation: optional function (images, labels) -> (images, labels) applied to every training batch of the in-memory datasets
+	# cifar_dir: directory of the CIFAR-10 binary files (data == 'cifar_10', None: CIFAR_LOCATION)
+	# cifar_input_options: keyword arguments of cifar10_input.distorted_inputs (num_readers, num_preprocess_threads, capacity_batches) for the queue pipeline
+	# resident_data: the training batches are drawn in the graph (default values of x and y)
+	# multi_step_training: MultiStepTraining on the resident batches, runs several training steps per sess.run (requires resident_data)
+	# expensive_summary_checks: the summaries above the scalar tier (merged_expensive) are written every this many check iterations
+	# concurrent_evaluation: the evaluation set accuracy of every check iteration is computed in a background thread while training continues
+	# early_stopping: EarlyStopping ('max') on the evaluation set accuracy, drops the step size on a plateau and ends the training
+	# time_budget: TimeBudget, check iterations every check_seconds instead of chk_iterations, the training ends in time for the final test set evaluation
+	# finalize_graph: the graph is finalized before the training loop, every op created afterwards raises an error
+	if resident_data:
+		prefetch_batches = 0
+
+	if cifar_dir is None:
+		cifar_dir = CIFAR_LOCATION
+
 
 	print("Training CNN for {} iterations with batchsize {}".format(max_iterations, batch_size))
 
@@ -19,15 +44,23 @@ def train_cnn(sess, cnn, data, x, y, keep_prob, dropout_k_p, batch_size, init_it
 		print('Consider using the train / validation set to track progress during training and evaluate the accuracy using the test set in the end.')
 		final_test_evaluation = False
 
-	if data == 'cifar_10':
+	coord = tf.train.Coordinator()
+	threads = []
 
-		coord = tf.train.Coordinator()
+	if data == 'cifar_10':
 
-		image_batch, label_batch = cifar10_input.distorted_inputs(CIFAR_LOCATION, batch_size)
-		iteration_evaluation_image_node, iteration_evaluation_label_node = cifar10_input.inputs(evaluate_using_test_set, CIFAR_LOCATION, test_batch_size)
+		# queue runners (cifar10_input), tf.data (cifar10_dataset) or pre-shuffled shards (cifar10_shards), all offer the same interface
+		if input_pipeline == 'dataset':
+			cifar_inputs = cifar10_dataset
+		elif input_pipeline == 'sharded':
+			cifar_inputs = cifar10_shards
+		else:
+			cifar_inputs = cifar10_input
 
-		if final_test_evaluation:
-			test_image_node, test_label_node = cifar10_input.inputs(True, CIFAR_LOCATION, test_batch_size)
+		if cifar_inputs is cifar10_input and cifar_input_options:
+			image_batch, label_batch = cifar_inputs.distorted_inputs(cifar_dir, batch_size, **cifar_input_options)
+		else:
+			image_batch, label_batch = cifar_inputs.distorted_inputs(cifar_dir, batch_size)
 
 		threads = tf.train.start_queue_runners(sess=sess, coord=coord)
 
@@ -37,6 +70,12 @@ def train_cnn(sess, cnn, data, x, y, keep_prob, dropout_k_p, batch_size, init_it
 		else:
 			total_test_images = min(num_test_images, 10000)
 
+		# evaluation images are decoded and centrally cropped once
+		iteration_evaluation_set = evaluation_set.cifar10_evaluation_set(evaluate_using_test_set, cifar_dir, label_dtype=y.dtype.as_numpy_dtype, num_examples=total_test_images, batch_size=test_batch_size)
+
+		if final_test_evaluation:
+			test_set = evaluation_set.cifar10_evaluation_set(True, cifar_dir, label_dtype=y.dtype.as_numpy_dtype, batch_size=test_batch_size)
+
 		if evaluate_using_test_set:
 			iteration_evaluation_name = 'test'
 		else:
@@ -44,52 +83,159 @@ def train_cnn(sess, cnn, data, x, y, keep_prob, dropout_k_p, batch_size, init_it
 
 	else:
 
-		# choose dataset used for testing every chk_iterations-th iteration
+		# choose dataset used for testing every chk_iterations-th iteration (converted once to the placeholder format)
+		image_shape = x.get_shape().as_list()[1:]
+		label_dtype = y.dtype.as_numpy_dtype
+
 		if evaluate_using_test_set:
-			iteration_evaluation_set = data.test 
+			iteration_evaluation_set = evaluation_set.from_data_set(data.test, image_shape, label_dtype, num_test_images, test_batch_size)
 			iteration_evaluation_name = 'test'
 		else:
-			iteration_evaluation_set = data.validation 
+			iteration_evaluation_set = evaluation_set.from_data_set(data.validation, image_shape, label_dtype, num_test_images, test_batch_size)
 			iteration_evaluation_name = 'validation'
 
 			if final_test_evaluation:
-				test_set = data.test
+				test_set = evaluation_set.from_data_set(data.test, image_shape, label_dtype, batch_size=test_batch_size)
 
-		max_test_images = iteration_evaluation_set.images.shape[0]
-		if num_test_images <= 0:
-			total_test_images = max_test_images
-		else:
-			total_test_images = min(num_test_images, max_test_images)
+		if prefetch_batches > 0:
+			# prepare the next training batches in a background thread while the current step runs
+			batch_prefetcher = BatchPrefetcher(data.train, batch_size, coord, image_shape=x.get_shape().as_list()[1:], label_dtype=y.dtype.as_numpy_dtype, capacity=prefetch_batches, transform=augmentation)
+			threads = batch_prefetcher.start()
+
+
+	# checkpoints of the last check iteration and of the model with the best accuracy, written in a background thread
+	if save_prefix is not None:
+		checkpoint_writer = CheckpointWriter(cnn.all_variables_dict)
+
+	# restores the best model for the final test set evaluation
+	best_it_saver = tf.train.Saver(cnn.all_variables_dict)
+
+	# dequeue wait and queue fill level summaries
+	input_monitor = InputMonitor(writer)
+
+	# number of graph operations at every check iteration
+	graph_monitor = GraphMonitor(writer, sess.graph)
+
+	# the top accuracy is updated by report_evaluation (in the evaluator thread for concurrent evaluation)
+	evaluation_state = {'top_accuracy': best_accuracy_so_far, 'seconds': 0}
+
+	def evaluate(eval_sess):
+		# accuracy over exactly one pass of the evaluation set in fixed batches
+		evaluation_start = time.time()
+		total_accuracy = 0
+
+		for batch_indx, (test_images, test_labels) in enumerate(iteration_evaluation_set.batches()): 
+
+			print('...treating batch {}'.format(batch_indx))
+
+			avg_accuracy = eval_sess.run(cnn.accuracy, feed_dict={x: test_images, y: test_labels, keep_prob: 1.0})
+
+			total_accuracy += avg_accuracy * test_images.shape[0]
+
+		evaluation_state['seconds'] = time.time() - evaluation_start
+
+		return total_accuracy / iteration_evaluation_set.num_examples
+
+	def report_evaluation(step, total_accuracy, values = None):
+		# values: snapshot of the evaluated variables, None: the current variables of sess are saved
+		print('it {} accuracy {}'.format(step, total_accuracy))
+
+		save_paths = {}
+
+		# always keep the model from the last check iteration stored
+		if save_prefix is not None:
+				print('...save current iteration weights to file ')
+				save_paths['checkpoint'] = os.path.join(save_prefix, 'CNN-acc-{}'.format(total_accuracy))
+
+		if total_accuracy > evaluation_state['top_accuracy']:
+			print('...new top accuracy found')
+
+			evaluation_state['top_accuracy'] = total_accuracy
+
+			if save_prefix is not None:
+				print('...save new found best weights to file ')
+				save_paths['best'] = os.path.join(save_prefix, 'best', 'CNN-acc-{}'.format(total_accuracy))
+
+		if save_paths:
+			# both checkpoints are written from one snapshot
+			checkpoint_writer.save(sess, save_paths, step, values=values)
+
+		# summary protocol buffer, not a graph op (report_evaluation also runs in the evaluator thread)
+		total_batch_acc_summary = tf.Summary()
+		total_batch_acc_summary.value.add(tag='acc_over_all_ {}_batches'.format(iteration_evaluation_name), simple_value=total_accuracy)
+		writer.add_summary(total_batch_acc_summary, step)
 
+		if early_stopping is not None:
+			action = early_stopping.update(total_accuracy)
 
-	current_top_accuracy = best_accuracy_so_far
+			if action == 'plateau':
+				print('...no improvement for {} checks, step size factor {}'.format(early_stopping.plateau_patience, early_stopping.step_size_factor))
+				sess.run(cnn.set_step_size_factor_op, feed_dict={cnn.step_size_factor_input: early_stopping.step_size_factor})
 
-	# create two different savers (always store the model from the last 5 check iterations and the current model with the best accuracy)
-	chk_it_saver 	= tf.train.Saver(cnn.all_variables_dict, max_to_keep = 1)
-	best_it_saver 	= tf.train.Saver(cnn.all_variables_dict, max_to_keep = 1)
+			elif action == 'stop':
+				print('...no improvement for {} checks, the training stops'.format(early_stopping.patience))
 
-	#
-	total_test_set_accuracy = tf.Variable(0, '{}_set_accuracy'.format(iteration_evaluation_name))
+	if concurrent_evaluation:
+		# evaluates snapshots of the weights in a second session, the results are tagged with the snapshot iteration
+		concurrent_evaluator = ConcurrentEvaluator(cnn.all_variables_dict, evaluate, report_evaluation)
+	else:
+		concurrent_evaluator = None
+
+	def final_phase_seconds():
+		# time needed after the training loop, estimated from the duration of the last evaluation
+		seconds = 0
+		if concurrent_evaluator is not None:
+			# the evaluation of the last snapshot
+			seconds += evaluation_state['seconds']
+		if final_test_evaluation:
+			seconds += evaluation_state['seconds'] * test_set.num_examples / float(iteration_evaluation_set.num_examples)
+		return seconds
 
-	for i in range(init_iteration, max_iterations):
+	if time_budget is not None:
+		# the check iterations are scheduled by the time budget, the runs of multi_step_training end when the next check is due
+		chk_iterations = max_iterations
+
+	if finalize_graph:
+		# guard against op leaks: creating an op in the training loop raises an error
+		sess.graph.finalize()
+
+	num_checks = 0
+
+	i = init_iteration
+	while i < max_iterations:
 
 		if chk_iterations > 100 and i % 100 == 0:
 			print('...iteration {}'.format(i))
 
+		fetch_start = time.time()
+
 		if data == 'cifar_10':
 			batch_xs, batch_ys = sess.run([image_batch, label_batch])
 
+		elif resident_data:
+			batch_xs, batch_ys = None, None
+
+		elif prefetch_batches > 0:
+			batch_xs, batch_ys = batch_prefetcher.next_batch()
+
 		else:
 			batch_xs, batch_ys = data.train.next_batch(batch_size)
+			if augmentation is not None:
+				batch_xs, batch_ys = augmentation(batch_xs, batch_ys)
+
+		fetch_seconds = time.time() - fetch_start
+		input_monitor.add_wait(fetch_seconds)
+
+		if time_budget is None:
+			last_check 	= False
+			check 		= i % chk_iterations == 0
+		else:
+			last_check 	= time_budget.last_check_due()
+			check 		= last_check or time_budget.check_due()
 
-		if i % chk_iterations == 0:
+		if check:
 
-			# batch the test data (prevent memory overflow)
-			last_batch_size = total_test_images % test_batch_size
-			num_batches 	= total_test_images / test_batch_size + int(last_batch_size > 0)
-			
-			if last_batch_size == 0:
-				last_batch_size = test_batch_size
+			check_start = time.time()
 
 			print('---> Test Iteration')
 
@@ -97,133 +243,134 @@ def train_cnn(sess, cnn, data, x, y, keep_prob, dropout_k_p, batch_size, init_it
 				print('BE AWARE: we are currently only optimizing the dense layer weights, convolution weights and biases stay unchanged')
 			print('Current performance is evaluated using the {}-set'.format(iteration_evaluation_name))
 			print('Test batch size is {}'.format(test_batch_size))
-			print('We want to average over {} test images in total'.format(total_test_images))
-			print('This gives us {} batches, the last one having only {} images'.format(num_batches, last_batch_size))
+			print('We want to average over {} test images in total'.format(iteration_evaluation_set.num_examples))
+			print('This gives us {} batches, the last one having only {} images'.format(iteration_evaluation_set.num_batches, iteration_evaluation_set.last_batch_size))
 
-			total_accuracy = 0
+			# the summaries are evaluated in the training session, on the first evaluation batch
+			if num_checks % expensive_summary_checks == 0:
+				summary_node = cnn.merged_expensive
+			else:
+				summary_node = cnn.merged
 
-			for batch_indx in range(num_batches): 
+			num_checks += 1
 
-				print('...treating batch {}'.format(batch_indx))
+			summary_images, summary_labels = iteration_evaluation_set.summary_batch(iteration_evaluation_set.batch_size, cnn.accumulation_steps)
+			writer.add_summary(sess.run(summary_node, feed_dict={x: summary_images, y: summary_labels, keep_prob: 1.0}), i)
 
-				if batch_indx == num_batches - 1:
-					current_batch_size = last_batch_size
-				else:
-					current_batch_size = test_batch_size
+			print('average input wait {:.2f} ms per batch'.format(input_monitor.write_summary(sess, i)))
+			graph_monitor.write_summary(i)
 
-				if data == 'cifar_10':
-					test_images, test_labels = sess.run([iteration_evaluation_image_node, iteration_evaluation_label_node])
+			if concurrent_evaluator is not None:
+				# evaluated and reported by the evaluator thread, training continues
+				concurrent_evaluator.submit(sess, i)
+			else:
+				report_evaluation(i, evaluate(sess))
 
-				else:
-					test_images, test_labels = iteration_evaluation_set.next_batch(current_batch_size)
+			if early_stopping is not None and early_stopping.stop:
+				# with concurrent evaluation the training stops at the first check after the decision
+				print('Early stopping at iteration {}'.format(i))
+				break
 
-				avg_accuracy, summary = sess.run([cnn.accuracy, cnn.merged], feed_dict={x: test_images, y: test_labels, keep_prob: 1.0})
+			if time_budget is not None:
+				time_budget.checked(time.time() - check_start)
+				time_budget.reserve(final_phase_seconds())
 
-				total_accuracy += avg_accuracy * current_batch_size
+				if last_check:
+					print('Time budget: last check at iteration {}, {:.0f} s left'.format(i, time_budget.remaining()))
+					break
 
-			total_accuracy = total_accuracy / total_test_images
+		step_start = time.time()
 
-			print('it {} accuracy {}'.format(i, total_accuracy))
-			
+		# perform one training step
+		if resident_data:
+			train_feed_dict = {keep_prob: dropout_k_p}
+		else:
+			train_feed_dict = {x: batch_xs, y: batch_ys, keep_prob: dropout_k_p}
 
-			# always keep the models from the last 5 iterations stored
-			if save_prefix is not None:
-					file_path = os.path.join(save_prefix, 'CNN-acc-{}'.format(total_accuracy))
-					print('...save current iteration weights to file ')
-					cnn.store_model_to_file(sess, file_path, i, saver=chk_it_saver)
+		if multi_step_training is not None:
+			# training steps up to the next check iteration in one run, the global step is set afterwards
+			num_steps = multi_step_training.steps_until(i, chk_iterations, max_iterations)
+			if time_budget is not None:
+				num_steps = time_budget.max_steps(num_steps)
 
-			if total_accuracy > current_top_accuracy:
-				print('...new top accuracy found')
+			num_steps = multi_step_training.run(sess, num_steps, train_feed_dict)
+			i += num_steps
+			sess.run(cnn.set_global_step_op, feed_dict={cnn.global_step_setter_input: i})
 
-				current_top_accuracy = total_accuracy
+			if time_budget is not None:
+				time_budget.steps_done(num_steps, fetch_seconds + time.time() - step_start)
+			continue
 
-				if save_prefix is not None:
-					file_path = os.path.join(save_prefix, 'best', 'CNN-acc-{}'.format(current_top_accuracy))
-					print('...save new found best weights to file ')
-					cnn.store_model_to_file(sess, file_path, i, saver=best_it_saver)
+		if fine_tuning_only:
+			sess.run([cnn.optimize_dense_layers, cnn.increment_global_step_op], feed_dict=train_feed_dict)
+		else:
+			sess.run([cnn.optimize, cnn.increment_global_step_op], feed_dict=train_feed_dict)
 
-			with tf.name_scope('CNN'):
-				total_batch_acc_summary = tf.Summary()
-				total_batch_acc_summary.value.add(tag='acc_over_all_ {}_batches'.format(iteration_evaluation_name), simple_value=total_accuracy)
-				writer.add_summary(total_batch_acc_summary, i)
+		if time_budget is not None:
+			time_budget.steps_done(1, fetch_seconds + time.time() - step_start)
 
-			writer.add_summary(summary, i)
+		i += 1
 
-		# perform one training step
-		if fine_tuning_only:
-			sess.run([cnn.optimize_dense_layers, cnn.increment_global_step_op], feed_dict={x: batch_xs, y: batch_ys, keep_prob: dropout_k_p})
-		else:
-			sess.run([cnn.optimize, cnn.increment_global_step_op], feed_dict={x: batch_xs, y: batch_ys, keep_prob: dropout_k_p})
 
 
+	if concurrent_evaluator is not None:
+		# evaluate the remaining snapshots, their checkpoints are saved before the writer is closed
+		concurrent_evaluator.close()
 
 	print('...finished training') 
 
+	if save_prefix is not None:
+		# wait for the pending checkpoints
+		checkpoint_writer.close()
+
 	if final_test_evaluation:
 		print('The network was trained without presence of the test set.')
 		print('...Performing test set evaluation')
 
-		print('loading best model')
-		best_model_folder = os.path.join(save_prefix, 'best')
-		print('looking for best weights in {}'.format(best_model_folder))
+		# only restores and runs ops built before the training loop (the graph may be finalized)
+		latest_checkpoint = None
 
-		latest_checkpoint = tf.train.latest_checkpoint(best_model_folder)
+		if best_model_for_test and save_prefix is not None:
+			print('loading best model')
+			best_model_folder = os.path.join(save_prefix, 'best')
+			print('looking for best weights in {}'.format(best_model_folder))
 
-		best_it_saver.restore(sess, latest_checkpoint)
+			latest_checkpoint = tf.train.latest_checkpoint(best_model_folder)
 
-
-		if data == 'cifar_10':
-			total_test_images = 10000
-			print('Treating cifar10: the total test set size is {} images'.format(num_test_images))
+		if latest_checkpoint is not None:
+			best_it_saver.restore(sess, latest_checkpoint)
 		else:
-			total_test_images = test_set.images.shape[0]
-			print('Test set size is {}'.format(total_test_images))
+			print('no best model stored, the test set is evaluated with the weights of the last iteration')
+
 
-		# batch the test data (prevent memory overflow)
-		last_batch_size = total_test_images % test_batch_size
-		num_batches 	= total_test_images / test_batch_size + int(last_batch_size > 0)
-		
-		if last_batch_size == 0:
-			last_batch_size = test_batch_size
+		print('Test set size is {}'.format(test_set.num_examples))
 
 		print('-------------------------------------')
 		print('---> FINAL TEST SET EVALUATION <-----')
 		print('-------------------------------------')
 		print('Test batch size is {}'.format(test_batch_size))
-		print('We want to average over {} test images in total'.format(num_test_images))
-		print('This gives us {} batches, the last one having only {} images'.format(num_batches, last_batch_size))
+		print('We want to average over {} test images in total'.format(test_set.num_examples))
+		print('This gives us {} batches, the last one having only {} images'.format(test_set.num_batches, test_set.last_batch_size))
 
 		total_accuracy = 0
 
-		for batch_indx in range(num_batches): 
+		for batch_indx, (test_images, test_labels) in enumerate(test_set.batches()): 
 
 			print('...treating batch {}'.format(batch_indx))
 
-			if batch_indx == num_batches - 1:
-				current_batch_size = last_batch_size
-			else:
-				current_batch_size = test_batch_size
-
-			if data == 'cifar_10':
-				test_images, test_labels = sess.run([test_image_node, test_label_node])
+			avg_accuracy = sess.run(cnn.accuracy, feed_dict={x: test_images, y: test_labels, keep_prob: 1.0})
 
-			else:
-				test_images, test_labels = test_set.next_batch(current_batch_size)
-
-			avg_accuracy, summary = sess.run([cnn.accuracy, cnn.merged], feed_dict={x: test_images, y: test_labels, keep_prob: 1.0})
+			total_accuracy += avg_accuracy * test_images.shape[0]
 
-			total_accuracy += avg_accuracy * current_batch_size
+		total_accuracy = total_accuracy / test_set.num_examples
 
-		total_accuracy = total_accuracy / total_test_images
+		# summary protocol buffer, not a graph op
+		total_batch_acc_summary = tf.Summary()
+		total_batch_acc_summary.value.add(tag='final_test_set_accuracy', simple_value=total_accuracy)
+		writer.add_summary(total_batch_acc_summary, max_iterations)
 
-		with tf.name_scope('CNN'):
-				total_batch_acc_summary = tf.Summary()
-				total_batch_acc_summary.value.add(tag='final_test_set_accuracy', simple_value=total_accuracy)
-				writer.add_summary(total_batch_acc_summary, max_iterations)
 
-
-	if data == 'cifar_10':
-		coord.request_stop()
-		coord.join(threads)
+	coord.request_stop()
+	coord.join(threads)
 
 	
\ No newline at end of file
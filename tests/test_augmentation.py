@@ -0,0 +1,49 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from scripts.augmentation import BatchAugmenter, supports_augmentation
+
+
+def test_only_cifar_and_ckplus_are_augmented():
+	assert supports_augmentation('CIFAR')
+	assert supports_augmentation('CIFAR:n=7k,seed=3')
+	assert supports_augmentation('CIFAR_5k')
+	assert supports_augmentation('CKPLUS:frames=3')
+	assert supports_augmentation('SYNTHETIC:like=CIFAR,n=1k')
+
+	assert not supports_augmentation('MNIST')
+	assert not supports_augmentation('MNIST_1k')
+	assert not supports_augmentation('SYNTHETIC:like=MNIST')
+
+
+def test_augmented_batches_keep_shape_and_range():
+	images = np.random.RandomState(0).rand(16, 32 * 32 * 3).astype(np.float32)
+	labels = np.arange(16)
+
+	augmented, augmented_labels = BatchAugmenter((32, 32, 3), seed=1)(images, labels)
+
+	assert augmented.shape == images.shape
+	assert augmented.min() >= 0. and augmented.max() <= 1.
+	np.testing.assert_array_equal(augmented_labels, labels)
+
+
+def test_flips_only_mirror_horizontally():
+	images = np.random.RandomState(0).rand(64, 8, 8, 1).astype(np.float32)
+
+	augmented = BatchAugmenter((8, 8, 1), crop_padding=0, color=False, seed=1).augment(images)
+
+	mirrored = np.all(augmented == images[:, :, ::-1], axis=(1, 2, 3))
+	unchanged = np.all(augmented == images, axis=(1, 2, 3))
+
+	assert np.all(mirrored | unchanged)
+	assert 0 < mirrored.sum() < 64
+
+
+def test_same_seed_same_augmentation():
+	images = np.random.RandomState(0).rand(8, 16, 16, 3).astype(np.float32)
+
+	first 	= BatchAugmenter((16, 16, 3), seed=5).augment(images)
+	second 	= BatchAugmenter((16, 16, 3), seed=5).augment(images)
+
+	np.testing.assert_array_equal(first, second)
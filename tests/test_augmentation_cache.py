@@ -0,0 +1,85 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import scripts.augmentation_cache as augmentation_cache
+import scripts.dataset_store as dataset_store
+import scripts.datasets as datasets
+
+NUM_CLASSES = 7
+
+
+class IdentityAugmenter:
+
+	def __init__(self, shape, seed = 0):
+		pass
+
+	def augment(self, images):
+		return images
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+	# pixel values are the example ids, labels the ids modulo NUM_CLASSES, the training split is not in id order
+	monkeypatch.setattr(augmentation_cache, 'BatchAugmenter', IdentityAugmenter)
+
+	ids 	= np.arange(200)
+	images 	= np.tile(ids[:, None, None, None], (1, 4, 4, 3))
+	labels 	= ids % NUM_CLASSES
+
+	perm = np.random.RandomState(0).permutation(200)
+	split_indices = {'train': perm[:150], 'validation': perm[150:175], 'test': perm[175:]}
+
+	dataset_store.write_dataset('CIFAR10', images, labels, split_indices, NUM_CLASSES, str(tmp_path))
+
+	return str(tmp_path)
+
+
+def assert_aligned(train_set, num_batches = 20):
+	for _ in range(num_batches):
+		images, labels = train_set.next_batch(16)
+		ids = np.rint(images[:, 0, 0, 0] * 255).astype(np.int64)
+		np.testing.assert_array_equal(ids % NUM_CLASSES, np.argmax(labels, axis=1))
+
+
+@pytest.mark.parametrize('n, seed', [(None, None), ('50', None), ('50', '3')])
+def test_cached_rows_match_the_labels(store, n, seed):
+	data 	= datasets._train_subset(dataset_store.read_data_sets('CIFAR10', store_dir=store), n, seed)
+	train 	= augmentation_cache.augmented_data_set(data.train, 2, store_dir=store)
+
+	assert train.num_examples == data.train.num_examples
+	assert_aligned(train)
+
+	# same examples in the same order as the subset of the store
+	ids = np.rint(train.images[:][:, 0, 0, 0] * 255).astype(np.int64)
+	np.testing.assert_array_equal(ids, data.train.indices)
+
+
+def test_subsets_of_the_augmented_set_stay_aligned(store):
+	data 	= datasets._train_subset(dataset_store.read_data_sets('CIFAR10', store_dir=store), '80', '5')
+	train 	= augmentation_cache.augmented_data_set(data.train, 2, store_dir=store).subset(30)
+
+	assert train.num_examples == 30
+	assert_aligned(train)
+
+
+def test_examples_outside_the_training_split_are_rejected(store):
+	data = dataset_store.read_data_sets('CIFAR10', store_dir=store)
+
+	with pytest.raises(ValueError):
+		augmentation_cache.augmented_data_set(data.train.select(data.test.indices), 2, store_dir=store)
+
+
+def test_mnist_is_not_cached(store):
+	with pytest.raises(ValueError):
+		augmentation_cache.write_cache('MNIST', 2, store_dir=store)
+
+
+def test_synthetic_data_is_not_materialized(store):
+	train = datasets.load_dataset('SYNTHETIC:like=CIFAR,n=100,seed=1').data.train
+
+	assert not augmentation_cache.is_materializable(train)
+	assert augmentation_cache.is_materializable(dataset_store.read_data_sets('CIFAR10', store_dir=store).train)
+
+	with pytest.raises(ValueError):
+		augmentation_cache.augmented_data_set(train, 2, store_dir=store)
@@ -0,0 +1,57 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import scripts.dataset_store as dataset_store
+
+NUM_CLASSES = 7
+
+
+@pytest.fixture
+def store(tmp_path):
+	# pixel values are the example ids, labels the ids modulo NUM_CLASSES, the training split is not in id order
+	ids 	= np.arange(100)
+	images 	= np.tile(ids[:, None, None, None], (1, 2, 2, 1))
+
+	perm = np.random.RandomState(0).permutation(100)
+	split_indices = {'train': perm[:60], 'validation': perm[60:80], 'test': np.arange(80, 100)}
+
+	dataset_store.write_dataset('TEST', images, ids % NUM_CLASSES, split_indices, NUM_CLASSES, str(tmp_path))
+
+	return str(tmp_path), perm
+
+
+def image_ids(images):
+	return np.rint(images[:, 0, 0, 0] * 255).astype(np.int64)
+
+
+def test_splits_keep_the_order_of_their_indices(store):
+	store_dir, perm = store
+	data = dataset_store.read_data_sets('TEST', store_dir=store_dir)
+
+	np.testing.assert_array_equal(image_ids(data.train.images[:]), perm[:60])
+	np.testing.assert_array_equal(data.train.subset(10).indices, perm[:10])
+	np.testing.assert_array_equal(image_ids(data.train.subset(10).images[:]), perm[:10])
+
+
+def test_batches_cover_an_epoch_with_matching_labels(store):
+	store_dir, _ = store
+	train = dataset_store.read_data_sets('TEST', store_dir=store_dir).train.subset(30)
+
+	seen = []
+	for _ in range(3):
+		images, labels = train.next_batch(10)
+		ids = image_ids(images)
+		np.testing.assert_array_equal(ids % NUM_CLASSES, np.argmax(labels, axis=1))
+		seen.extend(ids)
+
+	assert sorted(seen) == sorted(train.indices)
+	assert train.epochs_completed == 0
+
+
+def test_flattened_views(store):
+	store_dir, _ = store
+	flat = dataset_store.read_data_sets('TEST', flatten=True, one_hot=False, store_dir=store_dir)
+
+	assert flat.test.images.shape == (20, 4)
+	assert flat.test.labels.shape == (20,)
@@ -0,0 +1,86 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import scripts.dataset_store as dataset_store
+import scripts.datasets as datasets
+
+
+@pytest.fixture
+def data():
+	# 10 classes, the training split is not in the order of the base buffers
+	images = np.zeros((300, 2, 2, 1), dtype=np.uint8)
+	labels = np.arange(300) % 10
+
+	perm = np.random.RandomState(0).permutation(200)
+	splits = {'train': perm, 'validation': np.arange(200, 250), 'test': np.arange(250, 300)}
+
+	return dataset_store.Datasets(**dict((split, dataset_store.DataSet(images, labels, 10, split=split, indices=indices)) for split, indices in splits.items()))
+
+
+@pytest.mark.parametrize('spec, expected', [
+	('MNIST', ('MNIST', {})),
+	('MNIST:n=2500', ('MNIST', {'n': '2500'})),
+	('CIFAR:n=7k,seed=3', ('CIFAR', {'n': '7k', 'seed': '3'})),
+	('CKPLUS:frames=3, split=0', ('CKPLUS', {'frames': '3', 'split': '0'})),
+	('MNIST_SMALL', ('MNIST', {'n': '1k'})),
+	('MNIST_1k', ('MNIST', {'n': '1k'})),
+	('MNIST_10k', ('MNIST', {'n': '10k'})),
+	('CIFAR_5k', ('CIFAR', {'n': '5k'})),
+])
+def test_parse_spec(spec, expected):
+	assert datasets.parse_spec(spec) == expected
+
+
+def test_invalid_specs():
+	with pytest.raises(ValueError):
+		datasets.parse_spec('MNIST:n')
+	with pytest.raises(ValueError):
+		datasets.load_dataset('IMAGENET')
+	with pytest.raises(ValueError):
+		datasets.load_dataset('CIFAR10:n=1k')
+
+
+def test_first_n_training_examples(data):
+	subset = datasets._train_subset(data, '50', None)
+
+	np.testing.assert_array_equal(subset.train.indices, data.train.indices[:50])
+	assert subset.validation is data.validation and subset.test is data.test
+
+
+def test_seeded_subsets(data):
+	subset 	= datasets._train_subset(data, '50', '3').train.indices
+	same 	= datasets._train_subset(data, '50', '3').train.indices
+	other 	= datasets._train_subset(data, '50', '4').train.indices
+
+	np.testing.assert_array_equal(subset, same)
+	assert not np.array_equal(subset, other)
+
+	# distinct training examples
+	assert len(set(subset)) == 50
+	assert set(subset) <= set(data.train.indices)
+
+
+def test_subset_sizes(data):
+	assert datasets._train_subset(data, '1k', None).train.num_examples == 200
+	assert datasets._train_subset(data, None, '3') is data
+
+	with pytest.raises(ValueError):
+		datasets._train_subset(data, '0', None)
+
+
+def test_synthetic_datasets_imitate_the_shapes():
+	description = datasets.load_dataset('SYNTHETIC:like=MNIST,n=100,seed=1')
+
+	assert description.input_size == (28, 28)
+	assert not description.nhwd_shape
+	assert description.data.train.num_examples == 100
+	assert description.data.train.images.shape == (100, 784)
+
+	images, labels = description.data.train.next_batch(10)
+	assert images.shape == (10, 784) and labels.shape == (10, 10)
+
+
+def test_dataset_family():
+	assert datasets.dataset_family('CIFAR_5k') == 'CIFAR'
+	assert datasets.dataset_family('SYNTHETIC:like=CKPLUS') == 'CKPLUS'
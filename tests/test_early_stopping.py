@@ -0,0 +1,84 @@
+import pytest
+
+from scripts.early_stopping import EarlyStopping
+
+
+def test_unknown_mode():
+	with pytest.raises(ValueError):
+		EarlyStopping('maximize')
+
+
+def test_improvements_beyond_min_delta():
+	early_stopping = EarlyStopping('max', patience=3, min_delta=0.01)
+
+	assert early_stopping.update(0.5) == 'improved'
+	assert early_stopping.update(0.505) is None
+	assert early_stopping.update(0.52) == 'improved'
+	assert early_stopping.best == 0.52
+
+	early_stopping = EarlyStopping('min', min_delta=0.1)
+
+	assert early_stopping.update(1.) == 'improved'
+	assert early_stopping.update(0.95) is None
+	assert early_stopping.update(0.8) == 'improved'
+	assert early_stopping.best == 0.8
+
+
+def test_stop_after_patience_checks_without_improvement():
+	early_stopping = EarlyStopping('min', patience=2)
+
+	early_stopping.update(1.)
+	assert early_stopping.update(1.) is None
+	assert not early_stopping.stop
+
+	assert early_stopping.update(2.) == 'stop'
+	assert early_stopping.stop
+
+
+def test_improvement_resets_the_patience():
+	early_stopping = EarlyStopping('max', patience=2)
+
+	early_stopping.update(0.5)
+	early_stopping.update(0.4)
+	early_stopping.update(0.6)
+
+	assert early_stopping.update(0.4) is None
+	assert early_stopping.update(0.4) == 'stop'
+
+
+def test_step_size_drops_on_plateaus():
+	early_stopping = EarlyStopping('max', plateau_patience=2, step_size_drop=0.5)
+
+	early_stopping.update(0.5)
+	assert early_stopping.update(0.5) is None
+	assert early_stopping.update(0.5) == 'plateau'
+	assert early_stopping.step_size_factor == 0.5
+
+	# the next drop after another plateau_patience checks
+	assert early_stopping.update(0.5) is None
+	assert early_stopping.update(0.5) == 'plateau'
+	assert early_stopping.step_size_factor == 0.25
+
+	# improvements keep the dropped step size
+	assert early_stopping.update(0.6) == 'improved'
+	assert early_stopping.step_size_factor == 0.25
+	assert not early_stopping.stop
+
+
+def test_stop_takes_precedence_over_a_drop():
+	early_stopping = EarlyStopping('max', patience=2, plateau_patience=2)
+
+	early_stopping.update(0.5)
+	early_stopping.update(0.5)
+
+	assert early_stopping.update(0.5) == 'stop'
+	assert early_stopping.step_size_factor == 1.0
+
+
+def test_disabled_patience():
+	early_stopping = EarlyStopping('max')
+
+	early_stopping.update(0.5)
+	for _ in range(100):
+		assert early_stopping.update(0.1) is None
+	assert not early_stopping.stop
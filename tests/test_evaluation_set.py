@@ -0,0 +1,29 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('tensorflow')
+
+from scripts.evaluation_set import EvaluationSet
+
+
+def evaluation_set(num_examples):
+	return EvaluationSet(np.arange(num_examples, dtype=np.float32).reshape(-1, 1), np.arange(num_examples), batch_size=8)
+
+
+def test_summary_batch_is_a_multiple_of_the_accumulation_steps():
+	images, labels = evaluation_set(10).summary_batch(8, 3)
+
+	assert images.shape == (6, 1)
+	assert labels.tolist() == [0, 1, 2, 3, 4, 5]
+
+
+def test_small_sets_are_repeated_to_one_image_per_micro_batch():
+	images, labels = evaluation_set(2).summary_batch(128, 4)
+
+	assert images.shape == (4, 1)
+	assert labels.tolist() == [0, 1, 0, 1]
+
+
+def test_empty_set_has_no_summary_batch():
+	with pytest.raises(ValueError):
+		evaluation_set(0).summary_batch(128, 4)
@@ -0,0 +1,67 @@
+# end-to-end runs of train_cnn / train_ae on synthetic MNIST with a finalized graph: every op
+# created after the graph is built (training loop, final test evaluation, best model restore)
+# raises an error
+
+import os
+
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+import scripts.synthetic_data as synthetic_data
+from models.cae.convolutional_autoencoder import CAE
+from models.cnn.cnn import CNN
+from scripts.train_cae import train_ae
+from scripts.train_cnn import train_cnn
+
+
+def mnist_inputs():
+	x = tf.placeholder(tf.float32, [None, 784])
+	return x, tf.reshape(x, [-1, 28, 28, 1])
+
+
+@pytest.mark.parametrize('with_checkpoints', [True, False])
+def test_cnn_training_with_finalized_graph(tmp_path, with_checkpoints):
+	data = synthetic_data.read_data_sets('MNIST', 256, seed=0, one_hot=True, flatten=True)
+
+	with tf.Graph().as_default():
+		x, x_image 	= mnist_inputs()
+		y 			= tf.placeholder(tf.float32, [None, 10])
+		keep_prob 	= tf.placeholder(tf.float32)
+
+		cnn = CNN(x_image, y, keep_prob, [(5, 5)], [4], [16], 'max_pooling', 'relu', step_size=0.01)
+
+		save_prefix = None
+		if with_checkpoints:
+			save_prefix = str(tmp_path / 'weights')
+			os.makedirs(os.path.join(save_prefix, 'best'))
+
+		with tf.Session() as sess:
+			sess.run(tf.global_variables_initializer())
+			writer = tf.summary.FileWriter(str(tmp_path / 'logs'), sess.graph)
+
+			train_cnn(sess, cnn, data, x, y, keep_prob, 0.5, 32, 0, 25, 10, writer, False, save_prefix, num_test_images=64, test_batch_size=32, prefetch_batches=0, finalize_graph=True)
+
+			assert sess.graph.finalized
+			writer.close()
+
+
+def test_cae_training_with_finalized_graph(tmp_path):
+	data = synthetic_data.read_data_sets('MNIST', 256, seed=0, one_hot=True, flatten=True)
+
+	with tf.Graph().as_default():
+		x, x_image = mnist_inputs()
+
+		autoencoder = CAE(x_image, [(5, 5)], [4], 0.01, 0.05, 0.001, 0.001, None, 'max_pooling', 'sigmoid', True)
+
+		save_prefix = str(tmp_path / 'weights')
+		os.makedirs(os.path.join(save_prefix, 'best'))
+
+		with tf.Session() as sess:
+			sess.run(tf.global_variables_initializer())
+			writer = tf.summary.FileWriter(str(tmp_path / 'logs'), sess.graph)
+
+			train_ae(sess, writer, x, autoencoder, data, None, None, 'mse', 32, 0, 25, 10, save_prefix=save_prefix, prefetch_batches=0, evaluation_set_size=64, evaluation_batch_size=32, finalize_graph=True)
+
+			assert sess.graph.finalized
+			writer.close()
@@ -0,0 +1,46 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+tf = pytest.importorskip('tensorflow')
+
+from lib.gradient_accumulation import accumulate_gradients
+
+
+def linear_model():
+	x = tf.placeholder(tf.float32, [None, 3])
+	y = tf.placeholder(tf.float32, [None, 1])
+	W = tf.Variable(np.arange(3, dtype=np.float32).reshape(3, 1))
+	b = tf.Variable(0.5)
+	return x, y, W, b
+
+
+def test_accumulated_gradients_match_the_batch_gradients():
+	with tf.Graph().as_default():
+		x, y, W, b = linear_model()
+
+		def error(data, target, scale = 1.0):
+			return scale * tf.reduce_sum(tf.square(tf.matmul(data, W) + b - target))
+
+		batch_gradients = tf.gradients(error(x, y), [W, b])
+		accumulated 	= accumulate_gradients(lambda data, target: tf.gradients(error(data, target), [W, b]), [x, y], [W, b], 4)
+
+		feed_dict = {x: np.random.RandomState(0).rand(8, 3), y: np.random.RandomState(1).rand(8, 1)}
+
+		with tf.Session() as sess:
+			sess.run(tf.global_variables_initializer())
+			expected, result = sess.run([batch_gradients, accumulated], feed_dict=feed_dict)
+
+	for e, r in zip(expected, result):
+		np.testing.assert_allclose(r, e, rtol=1e-5)
+
+
+def test_batch_size_has_to_divide_evenly():
+	with tf.Graph().as_default():
+		x, y, W, b = linear_model()
+
+		accumulated = accumulate_gradients(lambda data, target: tf.gradients(tf.reduce_sum(tf.matmul(data, W) - target), [W, b]), [x, y], [W, b], 4)
+
+		with tf.Session() as sess:
+			sess.run(tf.global_variables_initializer())
+			with pytest.raises(tf.errors.InvalidArgumentError):
+				sess.run(accumulated, feed_dict={x: np.ones((6, 3)), y: np.ones((6, 1))})
@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('PIL')
+
+import scripts.load_ckplus as load_ckplus
+
+
+def _add_sequence(root, subject, sequence, num_frames, emotion):
+	image_dir = os.path.join(root, 'images', subject, sequence)
+	os.makedirs(image_dir)
+	for frame in range(1, num_frames + 1):
+		open(os.path.join(image_dir, '{}_{}_{:08d}.png'.format(subject, sequence, frame)), 'w').close()
+
+	emotion_dir = os.path.join(root, 'emotions', subject, sequence)
+	os.makedirs(emotion_dir)
+	with open(os.path.join(emotion_dir, '{}_{}_{:08d}_emotion.txt'.format(subject, sequence, num_frames)), 'w') as f:
+		f.write('{}.0'.format(emotion))
+
+
+@pytest.fixture
+def ckplus(tmpdir, monkeypatch):
+	root = str(tmpdir)
+	cache = os.path.join(root, 'cache')
+
+	monkeypatch.setattr(load_ckplus, 'dataset_path', os.path.join(root, 'images'))
+	monkeypatch.setattr(load_ckplus, 'emotions_path', os.path.join(root, 'emotions'))
+	monkeypatch.setattr(load_ckplus, 'cache_path', cache)
+	monkeypatch.setattr(load_ckplus, 'patch_cache_file', os.path.join(cache, 'patches.npy'))
+	monkeypatch.setattr(load_ckplus, 'manifest_file', os.path.join(cache, 'manifest.json'))
+
+	# every patch is filled with the frame number of its file name, all cropped frames are recorded
+	created = []
+
+	def create_patches(frame_names):
+		created.extend(frame_names)
+		patches = np.zeros((len(frame_names), load_ckplus.INPUT_SIZE[1], load_ckplus.INPUT_SIZE[0]), dtype=np.uint8)
+		for i, name in enumerate(frame_names):
+			patches[i] = int(name.split('_')[-1])
+		return patches
+
+	monkeypatch.setattr(load_ckplus, 'create_patches', create_patches)
+	return root, created
+
+
+def test_concurrent_append_keeps_the_other_runs_patches(ckplus):
+	ckplus, created = ckplus
+	_add_sequence(ckplus, 'S001', '001', 3, 1)
+	_add_sequence(ckplus, 'S002', '001', 5, 2)
+
+	# both runs load the manifest before either one created patches
+	manifest_a = load_ckplus.load_manifest()
+	manifest_b = load_ckplus.load_manifest()
+
+	images_b, _ = load_ckplus.read_from_folders(['S002'], 3, manifest_b)
+	images_a, _ = load_ckplus.read_from_folders(['S001'], 3, manifest_a)
+
+	np.testing.assert_array_equal(images_b[:, 0, 0], [3, 4, 5])
+	np.testing.assert_array_equal(images_a[:, 0, 0], [1, 2, 3])
+
+	# a fresh run finds the patches of both runs at their offsets without cropping again
+	num_created = len(created)
+	images, _ = load_ckplus.read_from_folders(['S001', 'S002'], 3)
+	np.testing.assert_array_equal(images[:, 0, 0], [1, 2, 3, 3, 4, 5])
+	assert len(created) == num_created == 6
+
+
+def test_new_labels_of_indexed_subjects_are_picked_up(ckplus):
+	ckplus, created = ckplus
+	_add_sequence(ckplus, 'S001', '001', 3, 1)
+
+	_, labels = load_ckplus.read_from_folders(['S001'], 3)
+	np.testing.assert_array_equal(labels, [0, 0, 0])
+
+	# a newly labelled sequence of the same subject
+	_add_sequence(ckplus, 'S001', '002', 2, 4)
+
+	images, labels = load_ckplus.read_from_folders(['S001'], 3)
+	np.testing.assert_array_equal(labels, [0, 0, 0, 3, 3])
+	np.testing.assert_array_equal(images[:, 0, 0], [1, 2, 3, 1, 2])
+
+	# the patches of the first sequence are kept
+	assert len(created) == 5
+
+
+def test_store_is_converted_again_for_new_subjects(ckplus, tmpdir):
+	import scripts.dataset_store as dataset_store
+
+	ckplus, created = ckplus
+	store_dir = str(tmpdir.join('store'))
+	_add_sequence(ckplus, 'S001', '001', 3, 1)
+
+	assert dataset_store.read_data_sets('CKPLUS-f3-all', store_dir=store_dir).train.num_examples == 3
+	assert dataset_store.is_stored('CKPLUS-f3-all', store_dir)
+
+	# a new subject folder makes the store stale, only its patches are cropped
+	_add_sequence(ckplus, 'S002', '001', 5, 2)
+	assert not dataset_store.is_stored('CKPLUS-f3-all', store_dir)
+
+	assert dataset_store.read_data_sets('CKPLUS-f3-all', store_dir=store_dir).train.num_examples == 6
+	assert len(created) == 6
@@ -0,0 +1,78 @@
+import pytest
+
+from lib.summary_tiers import TIERS, tiers_up_to
+
+
+def test_tiers_contain_the_lower_tiers():
+	assert tiers_up_to('scalars') == ['scalars']
+	assert tiers_up_to('standard') == ['scalars', 'standard']
+	assert tiers_up_to('full') == TIERS
+
+
+def test_unknown_tier():
+	with pytest.raises(ValueError):
+		tiers_up_to('all')
+
+
+# the merged summaries of small models built for every tier: merged holds the scalars only,
+# merged_expensive adds the summaries of the higher tiers
+
+@pytest.fixture
+def tf():
+	return pytest.importorskip('tensorflow')
+
+def build_cnn(tf, tier):
+	from models.cnn.cnn import CNN
+
+	x 			= tf.placeholder(tf.float32, [None, 28, 28, 1])
+	y 			= tf.placeholder(tf.float32, [None, 10])
+	keep_prob 	= tf.placeholder(tf.float32)
+
+	return CNN(x, y, keep_prob, [(5, 5)], [4], [16], 'max_pooling', 'relu', step_size=0.01, summary_tier=tier)
+
+def build_cae(tf, tier):
+	from models.cae.convolutional_autoencoder import CAE
+
+	x = tf.placeholder(tf.float32, [None, 28, 28, 1])
+
+	return CAE(x, [(5, 5)], [4], 0.01, 0.05, 0.001, 0.001, None, 'max_pooling', 'relu', True, intialization_debug_output=False, summary_tier=tier)
+
+def summary_ops(merged):
+	return [summary.op for summary in merged.op.inputs]
+
+def names(ops, op_type):
+	return [op.name for op in ops if op.type == op_type]
+
+
+@pytest.mark.parametrize('build', ['cnn', 'cae'])
+@pytest.mark.parametrize('tier', TIERS)
+def test_merged_summaries_of_the_tiers(tf, build, tier):
+	with tf.Graph().as_default():
+		model = {'cnn': build_cnn, 'cae': build_cae}[build](tf, tier)
+
+		# the cheap summaries of every check iteration
+		cheap = summary_ops(model.merged)
+		assert cheap and all(op.type == 'ScalarSummary' for op in cheap)
+
+		if tier == 'scalars':
+			assert model.merged_expensive is model.merged
+			return
+
+		expensive 	= summary_ops(model.merged_expensive)
+		histograms 	= names(expensive, 'HistogramSummary')
+		images 		= names(expensive, 'ImageSummary')
+
+		assert set(cheap) < set(expensive)
+		assert any('encoding_histogram' in name for name in histograms)
+
+		# one tiled image of all first layer filters instead of one image per filter
+		filter_images = [op for op in expensive if op.type == 'ImageSummary' and 'first_layer_filters' in op.name]
+		assert len(filter_images) == 1
+		assert filter_images[0].inputs[1].get_shape().as_list()[0] == 1
+
+		if build == 'cae':
+			assert any('input' in name for name in images) and any('reconstruction' in name for name in images)
+
+		# gradient and preactivation histograms only in the full tier
+		full_histograms = [name for name in histograms if 'gradient' in name or 'preactivations' in name]
+		assert bool(full_histograms) == (tier == 'full')
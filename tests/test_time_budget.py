@@ -0,0 +1,88 @@
+import pytest
+
+import scripts.time_budget as time_budget
+from scripts.time_budget import TimeBudget
+
+
+class Clock:
+
+	def __init__(self):
+		self.now = 1000.
+
+	def __call__(self):
+		return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+	clock = Clock()
+	monkeypatch.setattr(time_budget.time, 'time', clock)
+	return clock
+
+
+def test_checks_are_due_every_check_seconds(clock):
+	budget = TimeBudget(3600, check_seconds=60)
+
+	assert budget.check_due()
+	budget.checked(5)
+
+	clock.now += 30
+	assert not budget.check_due()
+
+	clock.now += 30
+	assert budget.check_due()
+
+
+def test_last_check_leaves_room_for_the_next_steps_the_check_and_the_reserve(clock):
+	budget = TimeBudget(1000, check_seconds=60, margin_seconds=30)
+	budget.checked(20)
+	budget.steps_done(10, 10.)
+	budget.reserve(100)
+
+	# needed: 1 s step + 20 s check + 100 s reserved + 30 s margin
+	clock.now += 1000 - 152
+	assert not budget.last_check_due()
+
+	clock.now += 2
+	assert budget.last_check_due()
+	assert budget.last_check_due(num_steps=5)
+
+
+def test_step_time_is_a_moving_average(clock):
+	budget = TimeBudget(1000, check_seconds=60)
+
+	budget.steps_done(0, 5.)
+	assert budget.step_duration == 0
+
+	budget.steps_done(4, 4.)
+	assert budget.step_duration == pytest.approx(1.)
+
+	budget.steps_done(1, 2.)
+	assert budget.step_duration == pytest.approx(1. + time_budget.STEP_TIME_DECAY)
+
+
+def test_runs_end_when_the_next_check_is_due(clock):
+	budget = TimeBudget(3600, check_seconds=60, margin_seconds=0)
+
+	# one step to measure the step time
+	assert budget.max_steps(500) == 1
+
+	budget.checked(1)
+	budget.steps_done(1, 0.5)
+
+	assert budget.max_steps(500) == 120
+	assert budget.max_steps(50) == 50
+
+	clock.now += 59.9
+	assert budget.max_steps(500) == 1
+
+
+def test_runs_end_at_the_last_check(clock):
+	budget = TimeBudget(100, check_seconds=600, margin_seconds=10)
+	budget.checked(5)
+	budget.steps_done(1, 1.)
+	budget.reserve(15)
+
+	clock.now += 50
+	# 50 s left: 5 s check + 15 s reserved + 10 s margin
+	assert budget.max_steps(500) == 20
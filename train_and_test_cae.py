@@ -19,7 +19,15 @@ from functools import reduce
 from models.cae.convolutional_autoencoder import CAE
 from scripts.train_cae import train_ae
 import configs.config as cfg
-from scripts.from_github.cifar10 	import maybe_download_and_extract
+import scripts.dataset_store as dataset_store
+import scripts.datasets as datasets
+import scripts.input_statistics as input_statistics
+from scripts.resident_dataset import ResidentDataSet
+from scripts.multi_step_training import MultiStepTraining
+from scripts.early_stopping import EarlyStopping
+from scripts.time_budget import TimeBudget
+from scripts.augmentation import BatchAugmenter, supports_augmentation
+from scripts.augmentation_cache import augmented_data_set, is_materializable
 
 ########
 # MAIN #
@@ -124,7 +132,7 @@ def main():
 	else:
 		print('Wrong number of arguments!')
 		print('Usage: {} dataset config_file_path pre-trained_weights_path log_folder run_name regularization_factor'.format(arguments[0]))
-		print('dataset 					: (MNIST | MNIST_SMALL | CIFAR10 | CKPLUS)')
+		print('dataset 					: (MNIST[:n=<N>] | CIFAR[:n=<N>,seed=<s>] | CIFAR10 | CKPLUS[:frames=<f>,split=<0|1>] | MNIST_SMALL | CIFAR_<n>k)')
 		print('config_file_path 		: relative path to config file to use')
 		print('init_weights_path 	 	: (None : resume training | path to old checkpoint to init from')
 		print('log_folder 				: log folder name (used in logs/ and weights/ subdirectories)')
@@ -138,87 +146,15 @@ def main():
 	# INPUT HANDING #
 	## ########### ##
 
-	if DATASET == "MNIST":
-		# load mnist
-		from tensorflow.examples.tutorials.mnist import input_data
-		dataset = input_data.read_data_sets("MNIST_data/", one_hot=True)
-		input_size = (28, 28)
-		num_classes = 10
-		nhwd_shape = False
-
-	elif DATASET == "MNIST_SMALL":
-		N = 1000
-
-		# load mnist
-		from tensorflow.contrib.learn.python.learn.datasets.mnist import DataSet
-		from tensorflow.contrib.learn.python.learn.datasets.base import Datasets
-		from tensorflow.examples.tutorials.mnist import input_data
-
-		complete_dataset = input_data.read_data_sets("MNIST_data/", one_hot=True)
-
-		small_training_dataset = DataSet(complete_dataset.train._images[:N], complete_dataset.train._labels[:N], reshape=False)
-
-		dataset = Datasets(train=small_training_dataset, validation = complete_dataset.validation, test=complete_dataset.test)
-
-		input_size = (28, 28)
-		num_classes = 10
-		one_hot_labels = True
-		nhwd_shape = False
-
-	elif DATASET == "CKPLUS":
-		import scripts.load_ckplus as load_ckplus
-		dataset = load_ckplus.read_data_sets(split=False, one_hot=True, frames=100)
-		input_size = (68, 65)
-		num_classes = load_ckplus.NUM_CLASSES
-		nhwd_shape = False
-
-	elif DATASET=="CIFAR10":
-		dataset 		= "cifar_10" 	# signals the train_ae function that it needs to load the data via cifar10_input.py
-		input_size 		= (24, 24, 3)
-		num_classes 	= 1
-		nhwd_shape 		= True
-
-		maybe_download_and_extract()
-
-	elif DATASET[:6]=="CIFAR_":
-		# CIFAR_nk
-		limit = int(DATASET.split('_')[1].split('k')[0])
-
-		if limit > 0 and limit < 51:
-			print("Using " + str(limit) + "k CIFAR training images")
-
-			from tensorflow.contrib.learn.python.learn.datasets.mnist import DataSet
-			from tensorflow.contrib.learn.python.learn.datasets.base import Datasets
-			import scripts.load_cifar as load_cifar
-
-			complete_dataset = load_cifar.read_data_sets(one_hot=True)
-
-			small_training_dataset = DataSet(complete_dataset.train._images[:limit*1000], complete_dataset.train._labels[:limit*1000], dtype=dtypes.uint8, reshape=False)
-
-			dataset = Datasets(train=small_training_dataset, validation=complete_dataset.validation, test=complete_dataset.test)
-
-			one_hot_labels = True
-			input_size = (32, 32, 3)
-			num_classes = 10
-			nhwd_shape = True
-		else:
-			raise Exception("CIFAR limit must be between 1k and 50k, is: " + str(limit))
-
-	else:
-		print('ERROR: Dataset not available')
-
-	if nhwd_shape == False:
-
-		# input variables: x (images), y_ (labels), keep_prob (dropout rate)
-		x  = tf.placeholder(tf.float32, [None, input_size[0]*input_size[1]], name='input_digits')
-		# reshape the input to NHWD format
-		x_image = tf.reshape(x, [-1, input_size[0], input_size[1], 1])
-
-	else: 
-
-		x = tf.placeholder(tf.float32, [None, input_size[0], input_size[1], input_size[2]], name='input_images')
-		x_image = x
+	# DATASET is a specification of scripts/datasets.py (e.g. MNIST, MNIST:n=2500, CIFAR:n=7k,seed=3, CIFAR10, CKPLUS:frames=3)
+	# CK+ for the autoencoder: 100 frames per sequence of all subjects (no split)
+	dataset_description = datasets.load_dataset(DATASET, frames=100, split=0)
 
+	dataset 		= dataset_description.data
+	input_size 		= dataset_description.input_size
+	num_classes 	= dataset_description.num_classes
+	one_hot_labels 	= dataset_description.one_hot_labels
+	nhwd_shape 		= dataset_description.nhwd_shape
 
 	# directory containing the autoencoder file
 	cae_dir 		= os.path.join('models', 'cae')
@@ -259,6 +195,46 @@ def main():
 
 		tie_conv_weights = True
 
+		# cifar10 input: queue runners ('queue'), tf.data ('dataset') or pre-shuffled shards ('sharded')
+		input_pipeline = 'queue'
+		# number of training batches prepared in a background thread (0: synchronous)
+		prefetch_batches = 2
+		# keep the training set in the graph (no feed_dict for the training steps)
+		resident_dataset = False
+		# random crops, flips and brightness/contrast for the training batches of the in-memory datasets
+		augmentation = False
+		# number of materialized augmentation epochs reused across runs (0: augment on the fly)
+		augmentation_epochs = 0
+		# input normalization with cached training set statistics: none | standardize | zca
+		input_normalization = 'none'
+		# cifar10 queue pipeline: reader pipelines, enqueue threads and queue capacity in batches (see scripts/calibrate_cifar_input.py)
+		cifar_input_readers = 1
+		cifar_input_threads = 16
+		cifar_queue_capacity_batches = 3
+		# training steps per sess.run in an in-graph loop (needs resident_dataset, 1: one step per run)
+		steps_per_run = 1
+		# tensorboard summaries: scalars | standard | full, the tiers above scalars are only written every expensive_summary_checks checks
+		summary_tier = 'full'
+		expensive_summary_checks = 1
+		# validation images evaluated at every check iteration (<= 0: all) and their batch size
+		validation_set_size = -1
+		validation_batch_size = 500
+		# evaluation of the check iterations in a background thread while training continues
+		concurrent_evaluation = False
+		# early stopping after this many checks without improvement by more than early_stopping_min_delta (0: disabled),
+		# the step size is multiplied by plateau_step_size_drop after plateau_patience checks without improvement (0: disabled)
+		early_stopping_patience = 0
+		early_stopping_min_delta = 0
+		plateau_patience = 0
+		plateau_step_size_drop = 0.1
+		# wall-clock budget of the job in seconds (0: disabled), the check iterations happen every check_seconds instead of every chk_iterations
+		time_budget = 0
+		check_seconds = 600
+		# gradient accumulation over micro batches of batch_size images (effective batch size batch_size * accumulation_steps)
+		accumulation_steps = 1
+		# finalize the graph before the training loop (creating ops in the loop raises an error)
+		finalize_graph = False
+
 		# store to config dict:
 		config_dict = {}
 		config_dict['filter_dims'] = filter_dims
@@ -278,6 +254,29 @@ def main():
 		config_dict['chk_iterations'] = chk_iterations
 		config_dict['step_size'] = step_size
 		config_dict['tie_conv_weights'] = int(tie_conv_weights)
+		config_dict['input_pipeline'] = input_pipeline
+		config_dict['prefetch_batches'] = prefetch_batches
+		config_dict['resident_dataset'] = int(resident_dataset)
+		config_dict['augmentation'] = int(augmentation)
+		config_dict['augmentation_epochs'] = augmentation_epochs
+		config_dict['input_normalization'] = input_normalization
+		config_dict['cifar_input_readers'] = cifar_input_readers
+		config_dict['cifar_input_threads'] = cifar_input_threads
+		config_dict['cifar_queue_capacity_batches'] = cifar_queue_capacity_batches
+		config_dict['steps_per_run'] = steps_per_run
+		config_dict['summary_tier'] = summary_tier
+		config_dict['expensive_summary_checks'] = expensive_summary_checks
+		config_dict['validation_set_size'] = validation_set_size
+		config_dict['validation_batch_size'] = validation_batch_size
+		config_dict['concurrent_evaluation'] = int(concurrent_evaluation)
+		config_dict['early_stopping_patience'] = early_stopping_patience
+		config_dict['early_stopping_min_delta'] = early_stopping_min_delta
+		config_dict['plateau_patience'] = plateau_patience
+		config_dict['plateau_step_size_drop'] = plateau_step_size_drop
+		config_dict['time_budget'] = time_budget
+		config_dict['check_seconds'] = check_seconds
+		config_dict['accumulation_steps'] = accumulation_steps
+		config_dict['finalize_graph'] = int(finalize_graph)
 
 		config_loader.configuration_dict = config_dict
 
@@ -309,11 +308,105 @@ def main():
 		chk_iterations = int(config_dict['chk_iterations'])
 		step_size = float(config_dict['step_size'])
 		tie_conv_weights = bool(int(config_dict['tie_conv_weights']))
+		input_pipeline = config_dict['input_pipeline']
+		prefetch_batches = int(config_dict['prefetch_batches'])
+		resident_dataset = bool(int(config_dict['resident_dataset']))
+		augmentation = bool(int(config_dict['augmentation']))
+		augmentation_epochs = int(config_dict['augmentation_epochs'])
+		input_normalization = config_dict['input_normalization']
+		cifar_input_readers = int(config_dict['cifar_input_readers'])
+		cifar_input_threads = int(config_dict['cifar_input_threads'])
+		cifar_queue_capacity_batches = int(config_dict['cifar_queue_capacity_batches'])
+		steps_per_run = int(config_dict['steps_per_run'])
+		summary_tier = config_dict['summary_tier']
+		expensive_summary_checks = int(config_dict['expensive_summary_checks'])
+		validation_set_size = int(config_dict['validation_set_size'])
+		validation_batch_size = int(config_dict['validation_batch_size'])
+		concurrent_evaluation = bool(int(config_dict['concurrent_evaluation']))
+		early_stopping_patience = int(config_dict['early_stopping_patience'])
+		early_stopping_min_delta = float(config_dict['early_stopping_min_delta'])
+		plateau_patience = int(config_dict['plateau_patience'])
+		plateau_step_size_drop = float(config_dict['plateau_step_size_drop'])
+		time_budget = float(config_dict['time_budget'])
+		check_seconds = float(config_dict['check_seconds'])
+		accumulation_steps = int(config_dict['accumulation_steps'])
+		finalize_graph = bool(int(config_dict['finalize_graph']))
 
 		print('Config succesfully loaded')
 
+	# the clock of the time budget starts here
+	budget = None
+	if time_budget > 0:
+		print('Time budget of {} s, check iterations every {} s'.format(time_budget, check_seconds))
+		budget = TimeBudget(time_budget, check_seconds)
+
+	if accumulation_steps > 1:
+		# batch_size is the micro batch size, every training batch holds accumulation_steps micro batches
+		batch_size = batch_size * accumulation_steps
+		print('Gradient accumulation over {} micro batches, effective batch size {}'.format(accumulation_steps, batch_size))
+
 	# TODO Sabbir: end what needs to be in the config file -----------------------------
 
+	## ######### ##
+	# INPUT NODES #
+	## ######### ##
+
+	# keyword arguments of cifar10_input.distorted_inputs (queue pipeline)
+	cifar_input_options = {'num_readers': cifar_input_readers, 'num_preprocess_threads': cifar_input_threads, 'capacity_batches': cifar_queue_capacity_batches}
+
+	if nhwd_shape == False:
+		input_shape = [input_size[0]*input_size[1]]
+		input_name 	= 'input_digits'
+	else:
+		input_shape = list(input_size)
+		input_name 	= 'input_images'
+
+	if resident_dataset and dataset != 'cifar_10':
+		# keep the training set in the graph: training steps use the resident batches, evaluations feed x
+		resident_training_set = ResidentDataSet(dataset.train, batch_size, input_shape)
+		x = tf.placeholder_with_default(resident_training_set.images, [None] + input_shape, name=input_name)
+
+	else:
+		resident_training_set = None
+		x = tf.placeholder(tf.float32, [None] + input_shape, name=input_name)
+
+	if input_normalization != 'none':
+		# statistics of the training images (cached per dataset specification), applied as graph constants
+		input_statistics_dict = input_statistics.constants(input_statistics.load_statistics(DATASET, input_normalization, dataset, input_size, dataset_description.data_dir))
+
+		if error_function != 'mse':
+			print('Attention: the autoencoder reconstructs the normalized input, which is not in [0, 1] (consider error_function = mse)')
+
+	def input_images(images):
+		# network input of an input node: reshaped to NHWD format and normalized
+		if nhwd_shape == False:
+			images = tf.reshape(images, [-1, input_size[0], input_size[1], 1])
+		if input_normalization != 'none':
+			images = input_statistics.normalize(images, input_statistics_dict)
+		return images
+
+	x_image = input_images(x)
+
+	if augmentation and dataset != 'cifar_10':
+		if not supports_augmentation(DATASET):
+			print('Attention: only CIFAR and CK+ training batches are augmented, {} is not'.format(DATASET))
+			batch_augmenter = None
+		elif resident_training_set is not None:
+			print('Attention: the resident training batches are drawn in the graph and are not augmented')
+			batch_augmenter = None
+		else:
+			batch_augmenter = BatchAugmenter(input_size)
+	else:
+		batch_augmenter = None
+
+	if batch_augmenter is not None and augmentation_epochs > 0 and not is_materializable(dataset.train):
+		print('Attention: {} is not in the dataset store, its training batches are augmented on the fly instead of materialized'.format(DATASET))
+	elif batch_augmenter is not None and augmentation_epochs > 0:
+		# stream the training batches from augmentation epochs materialized once for all runs
+		dataset = dataset_store.Datasets(train=augmented_data_set(dataset.train, augmentation_epochs), validation=dataset.validation, test=dataset.test)
+		batch_augmenter = None
+
+
 	weight_file_name = get_weight_file_name(filter_dims, hidden_channels, pooling_type, activation_function, tie_conv_weights, batch_size, step_size, weight_init_mean, weight_init_stddev, initial_bias_value)
 
 	# log_folder_name = '02_CIFAR_2enc'
@@ -377,11 +470,27 @@ def main():
 
 
 	# construct autoencoder (5x5 filters, 3 feature maps)
-	autoencoder = CAE(x_image, filter_dims, hidden_channels, step_size, weight_init_stddev, weight_init_mean, initial_bias_value, strides, pooling_type, activation_function, tie_conv_weights, store_model_walkthrough = visualize_model_walkthrough, relu_leak = relu_leak, optimizer_type = optimizer_type, output_reconstruction_activation=output_reconstruction_activation, regularization_factor=regularization_factor)
+	autoencoder = CAE(x_image, filter_dims, hidden_channels, step_size, weight_init_stddev, weight_init_mean, initial_bias_value, strides, pooling_type, activation_function, tie_conv_weights, store_model_walkthrough = visualize_model_walkthrough, relu_leak = relu_leak, optimizer_type = optimizer_type, output_reconstruction_activation=output_reconstruction_activation, regularization_factor=regularization_factor, summary_tier=summary_tier, accumulation_steps=accumulation_steps)
+
+	multi_step_training = None
+	if steps_per_run > 1:
+		if resident_training_set is None:
+			print('Attention: steps_per_run needs the resident training set (resident_dataset = 1), training one step per run')
+		else:
+			# up to steps_per_run training steps on the resident batches in one sess.run
+			multi_step_training = MultiStepTraining(steps_per_run, resident_training_set.batch, lambda images, labels: autoencoder.training_step(input_images(images), error_function))
+
+	early_stopping = None
+	if early_stopping_patience > 0 or plateau_patience > 0:
+		# driven by the evaluation set regularized reconstruction error of the check iterations (as the model selection)
+		early_stopping = EarlyStopping('min', early_stopping_patience, early_stopping_min_delta, plateau_patience, plateau_step_size_drop)
 
 	sess = tf.Session() 
 	sess.run(tf.global_variables_initializer())
 
+	if resident_training_set is not None:
+		resident_training_set.initialize(sess)
+
 	print("Begin autencoder training")
 	
 	writer = tf.summary.FileWriter(log_path, sess.graph)
@@ -423,16 +532,16 @@ def main():
 
 			saver.restore(sess, latest_checkpoint)
 
-			train_ae(sess, writer, x, autoencoder, dataset, cae_dir, weight_file_name, error_function, batch_size, init_iteration, max_iterations, chk_iterations, save_prefix = save_path, minimal_reconstruction_error = smallest_reconstruction_error)
+			train_ae(sess, writer, x, autoencoder, dataset, cae_dir, weight_file_name, error_function, batch_size, init_iteration, max_iterations, chk_iterations, save_prefix = save_path, minimal_reconstruction_error = smallest_reconstruction_error, input_pipeline = input_pipeline, prefetch_batches = prefetch_batches, resident_data = resident_training_set is not None, augmentation = batch_augmenter, cifar_dir = dataset_description.data_dir, cifar_input_options = cifar_input_options, multi_step_training = multi_step_training, expensive_summary_checks = expensive_summary_checks, evaluation_set_size = validation_set_size, evaluation_batch_size = validation_batch_size, concurrent_evaluation = concurrent_evaluation, early_stopping = early_stopping, time_budget = budget, finalize_graph = finalize_graph)
 
 		else:
 			print('No checkpoint was found, beginning with iteration 0')
-			train_ae(sess, writer, x, autoencoder, dataset, cae_dir, weight_file_name, error_function, batch_size,init_iteration,  max_iterations, chk_iterations, save_prefix = save_path)
+			train_ae(sess, writer, x, autoencoder, dataset, cae_dir, weight_file_name, error_function, batch_size,init_iteration,  max_iterations, chk_iterations, save_prefix = save_path, input_pipeline = input_pipeline, prefetch_batches = prefetch_batches, resident_data = resident_training_set is not None, augmentation = batch_augmenter, cifar_dir = dataset_description.data_dir, cifar_input_options = cifar_input_options, multi_step_training = multi_step_training, expensive_summary_checks = expensive_summary_checks, evaluation_set_size = validation_set_size, evaluation_batch_size = validation_batch_size, concurrent_evaluation = concurrent_evaluation, early_stopping = early_stopping, time_budget = budget, finalize_graph = finalize_graph)
 
 
 	else:
 		# always train a new autoencoder 
-		train_ae(sess, writer, x, autoencoder, dataset, cae_dir, weight_file_name, error_function, batch_size,init_iteration,  max_iterations, chk_iterations, save_prefix = save_path)
+		train_ae(sess, writer, x, autoencoder, dataset, cae_dir, weight_file_name, error_function, batch_size,init_iteration,  max_iterations, chk_iterations, save_prefix = save_path, input_pipeline = input_pipeline, prefetch_batches = prefetch_batches, resident_data = resident_training_set is not None, augmentation = batch_augmenter, cifar_dir = dataset_description.data_dir, cifar_input_options = cifar_input_options, multi_step_training = multi_step_training, expensive_summary_checks = expensive_summary_checks, evaluation_set_size = validation_set_size, evaluation_batch_size = validation_batch_size, concurrent_evaluation = concurrent_evaluation, early_stopping = early_stopping, time_budget = budget, finalize_graph = finalize_graph)
 
 	# print('Test the training:')
 